@@ -7,6 +7,7 @@ from ..db import SessionLocal
 from ..models.device import Device
 from ..models.config_backup import ConfigBackup
 from ..services.configsync import backup_juniper, last_two_backups
+from ..services.jobcontrol import JOB_SLOT_API_WAIT_SEC, DeviceBusy, limiter
 
 router = APIRouter(prefix="/configs/backup", tags=["config-backup"])
 
@@ -28,7 +29,11 @@ def pull_juniper(
 ):
     if not db.query(Device).filter(Device.id == device_id).first():
         raise HTTPException(404, "Device not found")
-    return backup_juniper(db, device_id, host, username, password, private_key_path)
+    try:
+        with limiter.slot(host, wait=JOB_SLOT_API_WAIT_SEC):
+            return backup_juniper(db, device_id, host, username, password, private_key_path)
+    except DeviceBusy as exc:
+        raise HTTPException(429, str(exc))
 
 @router.get("/diff")
 def backup_diff(device_id: int, db: Session = Depends(get_db)):
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from ..db import SessionLocal
 from ..models.device import Device
 from ..schemas.device import DeviceOut, DeviceCreate, DeviceUpdate
+from ..services.counters import store as counter_store
+from ..services.topology import invalidate_topology
+from ..ws import notify_topology_update_background
 
 router = APIRouter(prefix="/devices", tags=["devices"])
 
@@ -42,36 +45,56 @@ def get_device(device_id: int, db: Session = Depends(get_db)):
 
 # --- Create a device manually (optional feature) ---
 @router.post("/", response_model=DeviceOut)
-def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
+def create_device(device: DeviceCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    if db.query(Device.id).filter(Device.mgmt_ip == device.mgmt_ip).first():
+        raise HTTPException(status_code=409, detail="Device with this mgmt_ip already exists")
     db_device = Device(**device.dict())
     db.add(db_device)
     db.commit()
+    invalidate_topology()
+    background_tasks.add_task(notify_topology_update_background)
     db.refresh(db_device)
     return db_device
 
 
 # --- Update a device record ---
 @router.put("/{device_id}", response_model=DeviceOut)
-def update_device(device_id: int, payload: DeviceUpdate, db: Session = Depends(get_db)):
+def update_device(
+    device_id: int,
+    payload: DeviceUpdate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
     db_device = db.query(Device).filter(Device.id == device_id).first()
     if not db_device:
         raise HTTPException(status_code=404, detail="Device not found")
 
-    for key, value in payload.dict(exclude_unset=True).items():
+    changes = payload.dict(exclude_unset=True)
+    new_ip = changes.get("mgmt_ip")
+    if new_ip and new_ip != db_device.mgmt_ip:
+        if db.query(Device.id).filter(Device.mgmt_ip == new_ip).first():
+            raise HTTPException(status_code=409, detail="Device with this mgmt_ip already exists")
+
+    for key, value in changes.items():
         setattr(db_device, key, value)
 
     db.commit()
+    invalidate_topology()
+    background_tasks.add_task(notify_topology_update_background)
     db.refresh(db_device)
     return db_device
 
 
 # --- Delete a device ---
 @router.delete("/{device_id}")
-def delete_device(device_id: int, db: Session = Depends(get_db)):
+def delete_device(device_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     device = db.query(Device).filter(Device.id == device_id).first()
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
     db.delete(device)
     db.commit()
+    invalidate_topology()
+    background_tasks.add_task(notify_topology_update_background)
+    counter_store.forget_device(device_id)
     return {"ok": True, "deleted_id": device_id}
@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Body
+import asyncio
+
+from fastapi import APIRouter, Body, HTTPException
+from ..services.jobcontrol import JOB_SLOT_API_WAIT_SEC, DeviceBusy, limiter
 from ..services.pfsense import pull_pfsense_bundle
 
 router = APIRouter(prefix="/integrations", tags=["integrations"])
@@ -10,4 +13,9 @@ async def pfsense_pull(
     password: str = Body(""),
     private_key_path: str | None = Body(None)
 ):
-    return pull_pfsense_bundle(host, username, password, private_key_path)
+    try:
+        async with limiter.aslot(host, wait=JOB_SLOT_API_WAIT_SEC):
+            return await asyncio.to_thread(pull_pfsense_bundle, host, username, password, private_key_path)
+    except DeviceBusy as exc:
+        raise HTTPException(429, str(exc))
+
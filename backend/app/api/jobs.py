@@ -1,20 +1,241 @@
-from fastapi import APIRouter, Body
-import os
+from typing import Dict, List
+from fastapi import APIRouter, Body, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+import uuid
 from rq import Queue
-from redis import Redis
+from rq.exceptions import NoSuchJobError
+from rq.job import Dependency, Job, JobStatus
+from redis.exceptions import RedisError
+
+from ..db import SessionLocal
+from ..services.jobcontrol import claim_jobs, dedupe_key
+from ..services.queues import QUEUE_NAMES, get_queue, get_redis, redis_registry
+from ..workers import (
+    FLEET_KINDS,
+    JOB_FAILURE_TTL_SEC,
+    JOB_KINDS,
+    JOB_RESULT_TTL_SEC,
+    JOB_TIMEOUT_SEC,
+    plan_fleet,
+)
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
-def _q():
-    redis_url = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
-    conn = Redis.from_url(redis_url)
-    return Queue("default", connection=conn)
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+class JobSpec(BaseModel):
+    kind: str = Field(..., description="scan|snmp|pfsense|juniper_backup")
+    payload: dict = Field(default_factory=dict)
+    queue: str = Field("default", description="high|default|bulk")
+    dedupe: bool = Field(True, description="Share an identical job that is already queued or running")
+
+def _q(name: str = "default") -> Queue:
+    try:
+        return get_queue(name)
+    except KeyError:
+        raise HTTPException(422, f"Unknown queue {name!r}; expected one of {', '.join(QUEUE_NAMES)}")
+
+def _check_kind(kind: str) -> None:
+    if kind not in JOB_KINDS:
+        raise HTTPException(422, f"Unknown job kind {kind!r}; expected one of {', '.join(JOB_KINDS)}")
+
+def _job_data(q: Queue, kind: str, payload: dict, meta: dict | None = None, job_id: str | None = None):
+    return q.prepare_data(
+        "app.workers.dispatch", ({"kind": kind, "payload": payload},),
+        job_id=job_id,
+        timeout=JOB_TIMEOUT_SEC,
+        result_ttl=JOB_RESULT_TTL_SEC,
+        failure_ttl=JOB_FAILURE_TTL_SEC,
+        meta={"kind": kind, **(meta or {})},
+    )
+
+def _enqueue_pipelined(batches: Dict[str, list]) -> Dict[str, List[Job]]:
+    """Enqueue prepared jobs on several queues in one Redis round trip."""
+    with get_redis().pipeline() as pipe:
+        jobs = {name: get_queue(name).enqueue_many(datas, pipeline=pipe) for name, datas in batches.items()}
+        pipe.execute()
+    return jobs
+
+def _fetch(job_id: str) -> Job:
+    try:
+        return Job.fetch(job_id, connection=get_redis())
+    except NoSuchJobError:
+        raise HTTPException(404, "Job not found (unknown, or its result expired)")
+    except RedisError as exc:
+        raise HTTPException(503, f"Job queue unavailable: {exc}")
+
+def _status(job: Job | None) -> str:
+    if job is None:
+        return "expired"
+    status = job.get_status()
+    return getattr(status, "value", status) or "unknown"
+
+def _error(job: Job) -> str | None:
+    exc_info = job.exc_info
+    if not exc_info:
+        return None
+    return exc_info.strip().splitlines()[-1]
 
 @router.post("/enqueue")
 def enqueue_job(
     kind: str = Body(..., description="scan|snmp|pfsense|juniper_backup"),
-    payload: dict = Body(default={})
+    payload: dict = Body(default={}),
+    queue: str = Body("default", description="high|default|bulk"),
+    dedupe: bool = Body(True, description="Share an identical job that is already queued or running"),
 ):
-    # For now we enqueue a placeholder; you can wire real callables later
-    job = _q().enqueue("app.workers.dispatch", {"kind": kind, "payload": payload})
-    return {"ok": True, "job_id": job.get_id()}
+    """
+    Identical requests (same kind and normalized payload) made while one is
+    still queued or running get that job's id back, with deduplicated=true.
+    """
+    _check_kind(kind)
+    q = _q(queue)
+    job_id = str(uuid.uuid4())
+    try:
+        if dedupe:
+            owner = claim_jobs([(dedupe_key(kind, payload), job_id)])[0]
+            if owner != job_id:
+                return {"ok": True, "job_id": owner, "deduplicated": True, "status_url": f"/jobs/{owner}"}
+        q.enqueue_many([_job_data(q, kind, payload, job_id=job_id)])
+    except RedisError as exc:
+        raise HTTPException(503, f"Job queue unavailable: {exc}")
+    return {"ok": True, "job_id": job_id, "deduplicated": False, "status_url": f"/jobs/{job_id}"}
+
+@router.post("/enqueue-bulk")
+def enqueue_bulk(jobs: List[JobSpec] = Body(..., embed=True, min_length=1)):
+    """
+    Enqueue many jobs (any mix of kinds and queues) in one pipelined round
+    trip. Jobs matching one in flight (or an earlier one in the same batch)
+    share its id; `deduplicated` counts them.
+    """
+    for spec in jobs:
+        _check_kind(spec.kind)
+        _q(spec.queue)
+    fresh = [str(uuid.uuid4()) for _ in jobs]
+    ids = list(fresh)
+    try:
+        deduped = [i for i, spec in enumerate(jobs) if spec.dedupe]
+        owners = claim_jobs([(dedupe_key(jobs[i].kind, jobs[i].payload), fresh[i]) for i in deduped])
+        for i, owner in zip(deduped, owners):
+            ids[i] = owner
+        batches: Dict[str, list] = {}
+        for spec, job_id, new_id in zip(jobs, ids, fresh):
+            if job_id == new_id:   # ours to run; anything else is shared
+                batches.setdefault(spec.queue, []).append(_job_data(_q(spec.queue), spec.kind, spec.payload, job_id=job_id))
+        if batches:
+            _enqueue_pipelined(batches)
+    except RedisError as exc:
+        raise HTTPException(503, f"Job queue unavailable: {exc}")
+    shared = sum(1 for job_id, new_id in zip(ids, fresh) if job_id != new_id)
+    return {"ok": True, "job_ids": ids, "deduplicated": shared}
+
+@router.get("/queues")
+def queue_stats():
+    """Jobs waiting per queue, plus the shared Redis pool's connection usage."""
+    try:
+        counts = {name: get_queue(name).count for name in QUEUE_NAMES}
+    except RedisError as exc:
+        raise HTTPException(503, f"Job queue unavailable: {exc}")
+    return {"queues": counts, "redis_pool": redis_registry.stats()}
+
+@router.post("/fleet")
+def enqueue_fleet(
+    kind: str = Body(..., description="scan|snmp|juniper_backup"),
+    payload: dict = Body(default={}),
+    chunk_size: int | None = Body(None, ge=1, description="Devices per child job (scans: address shards)"),
+    queue: str = Body("bulk", description="Queue for the child jobs"),
+    dedupe: bool = Body(True, description="Share an identical fleet job that is still running"),
+    db: Session = Depends(get_db),
+):
+    """
+    Fan-out/fan-in: the device set (payload hosts / device_ids / targets, or
+    all_known=true) is split into child jobs any worker can take, plus an
+    aggregate job that runs once they're all done and returns one report.
+    Children and the aggregate are enqueued in one transaction. Poll the returned
+    job_id like any other job; an identical fleet job still in flight is
+    shared rather than started again.
+    """
+    if kind not in FLEET_KINDS:
+        raise HTTPException(422, f"Unknown fleet kind {kind!r}; expected one of {', '.join(FLEET_KINDS)}")
+    q = _q(queue)
+    try:
+        chunks = plan_fleet(db, kind, payload, chunk_size)
+    except ValueError as exc:
+        raise HTTPException(422, str(exc))
+    parent_id = str(uuid.uuid4())
+    try:
+        if dedupe:
+            key = dedupe_key(f"fleet-{kind}", {**payload, "chunk_size": chunk_size})
+            owner = claim_jobs([(key, parent_id)])[0]
+            if owner != parent_id:
+                return {"ok": True, "job_id": owner, "deduplicated": True, "status_url": f"/jobs/{owner}"}
+        child_ids = [str(uuid.uuid4()) for _ in chunks]
+        datas = [_job_data(q, kind, chunk, {"parent": parent_id}, job_id=cid) for chunk, cid in zip(chunks, child_ids)]
+        parent = _q("default").create_job(
+            "app.workers.aggregate", args=(kind, child_ids),
+            job_id=parent_id,
+            depends_on=Dependency(jobs=child_ids, allow_failure=True),
+            timeout=JOB_TIMEOUT_SEC,
+            result_ttl=JOB_RESULT_TTL_SEC,
+            failure_ttl=JOB_FAILURE_TTL_SEC,
+            meta={"kind": kind, "children": child_ids},
+            status=JobStatus.DEFERRED,
+        )
+        # One MULTI: the aggregate is registered as every child's dependent
+        # before any child is visible to a worker, so a child that fails
+        # straight away still releases it
+        with get_redis().pipeline() as pipe:
+            parent.save(pipeline=pipe)
+            parent.register_dependency(pipeline=pipe)
+            q.enqueue_many(datas, pipeline=pipe)
+            pipe.execute()
+    except RedisError as exc:
+        raise HTTPException(503, f"Job queue unavailable: {exc}")
+    return {
+        "ok": True, "job_id": parent_id, "deduplicated": False,
+        "children": child_ids, "status_url": f"/jobs/{parent_id}",
+    }
+
+@router.get("/{job_id}")
+def job_status(job_id: str):
+    """Status, progress (from job meta) and, once finished, the result."""
+    job = _fetch(job_id)
+    child_ids = job.meta.get("children")
+    if child_ids and not job.is_finished:
+        # fleet job still fanned out: progress is how many children are through
+        counts: dict = {}
+        try:
+            children = Job.fetch_many(child_ids, connection=job.connection)
+        except RedisError as exc:
+            raise HTTPException(503, f"Job queue unavailable: {exc}")
+        for child in children:
+            name = _status(child)
+            counts[name] = counts.get(name, 0) + 1
+        done = counts.get("finished", 0) + counts.get("failed", 0)
+        job.meta["progress"] = {"done": done, "total": len(child_ids), "children": counts}
+    return {
+        "job_id": job.id,
+        "kind": job.meta.get("kind"),
+        "status": _status(job),
+        "progress": job.meta.get("progress"),
+        "enqueued_at": job.enqueued_at,
+        "started_at": job.started_at,
+        "ended_at": job.ended_at,
+        "result": job.return_value() if job.is_finished else None,
+        "error": _error(job) if job.is_failed else None,
+    }
+
+@router.get("/{job_id}/result")
+def job_result(job_id: str):
+    """The job's return value; 409 while it is queued or running, or if it failed."""
+    job = _fetch(job_id)
+    if job.is_finished:
+        return job.return_value()
+    if job.is_failed:
+        raise HTTPException(409, f"Job failed: {_error(job)}")
+    raise HTTPException(409, f"Job is {_status(job)}")
@@ -1,20 +1,31 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import List, Literal
+from typing import Annotated, AsyncIterator, Dict, List, Literal
 
 import asyncio
-from fastapi import APIRouter, Body, Depends, Query, BackgroundTasks
+import concurrent.futures
+import json
+import os
+import threading
+import uuid
+from fastapi import APIRouter, Body, HTTPException, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from ..db import SessionLocal
-from ..models.device import Device
-from ..ws import notify_topology_update_background
-from ..services import scanner
+from ..ws import broadcast_event, notify_topology_update, notify_topology_update_background
+from ..services import discovery, scanner
+from ..services.inventory import fresh_cached_hosts, persist_scan_results
 
 router = APIRouter(prefix="/scan", tags=["scan"])
 
+# Incremental scans reuse per-(ip, profile) results younger than this
+SCAN_CACHE_TTL_SEC = int(os.getenv("SCAN_CACHE_TTL_SEC", "3600"))
+# Hosts buffered between the scan and a streaming client before the scan waits
+SCAN_STREAM_BUFFER = int(os.getenv("SCAN_STREAM_BUFFER", "64"))
+
 
 # ---------------------------
 # DB session dependency
@@ -30,19 +41,28 @@ def get_db():
 # ---------------------------
 # Schemas
 # ---------------------------
-ScanProfile = Literal["fast", "standard", "deep"]
+# "discover" = TCP-connect host discovery only (no nmap, no root needed)
+ScanProfile = Literal["discover", "fast", "standard", "deep"]
 
 
 class ScanRequest(BaseModel):
     targets: List[str] = Field(..., description="CIDRs or IPs, e.g., ['192.168.3.0/24', '192.168.3.10']")
     profile: ScanProfile = "standard"
     skip_ping: bool = False
+    incremental: bool = Field(False, description="Reuse fresh cached results; only rescan stale or new hosts")
+    cache_ttl: int | None = Field(None, ge=0, description="Cache TTL in seconds (defaults to SCAN_CACHE_TTL_SEC)")
+    discover_first: bool = Field(False, description="Find live hosts with TCP probes, then nmap only those with -Pn")
+    discovery_ports: List[Annotated[int, Field(gt=0, lt=65536)]] | None = Field(
+        None, description="TCP ports to probe (defaults to DISCOVERY_PORTS)",
+    )
 
 
 class ScanResponse(BaseModel):
     ok: bool
     count: int
     hosts: List[str]
+    cached: int = 0      # hosts answered from the scan result cache
+    scanned: int = 0     # hosts found by a fresh nmap run (or discovery probe)
 
 
 # ---------------------------
@@ -55,40 +75,217 @@ def _normalize_targets_param(targets_param: str | None) -> List[str]:
     return [t for t in raw if t]
 
 
+def _parse_ports_param(ports_param: str | None) -> List[int] | None:
+    if not ports_param:
+        return None
+    try:
+        ports = [int(p) for p in ports_param.replace(",", " ").split()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"discovery_ports must be comma separated integers, got {ports_param!r}")
+    bad = [p for p in ports if not 0 < p < 65536]
+    if bad:
+        raise HTTPException(status_code=422, detail=f"discovery_ports out of range: {bad}")
+    return ports
+
+
+async def _narrow_to_live_hosts(targets: List[str], ports: List[int] | None) -> List[str]:
+    """Discovery pre-stage: live IPs plus whatever discovery can't enumerate."""
+    live = await discovery.discover_hosts(targets, ports)
+    _, passthrough = discovery.split_targets(targets)
+    return live + passthrough
+
+
+def _plan_incremental(
+    db: Session,
+    targets: List[str],
+    profile: ScanProfile,
+    cache_ttl: int | None,
+) -> tuple[Dict[str, dict], List[str]]:
+    """Split targets into fresh cache hits and what still has to be scanned."""
+    ttl = SCAN_CACHE_TTL_SEC if cache_ttl is None else cache_ttl
+    cached = fresh_cached_hosts(db, targets, profile, ttl, datetime.now(timezone.utc))
+    return cached, scanner.exclude_addresses(targets, cached.keys())
+
+
+def _plan_incremental_standalone(
+    targets: List[str],
+    profile: ScanProfile,
+    cache_ttl: int | None,
+) -> tuple[Dict[str, dict], List[str]]:
+    """_plan_incremental on its own session, for callers without one (worker threads)."""
+    db = SessionLocal()
+    try:
+        return _plan_incremental(db, targets, profile, cache_ttl)
+    finally:
+        db.close()
+
+
+def _persist_standalone(hosts: Dict[str, dict], profile: ScanProfile) -> None:
+    """persist_scan_results on its own session, for worker threads."""
+    db = SessionLocal()
+    try:
+        persist_scan_results(db, hosts, datetime.now(timezone.utc), profile)
+    finally:
+        db.close()
+
+
 async def _run_scan_and_persist(
     targets: List[str],
     profile: ScanProfile,
     skip_ping: bool,
-    db: Session,
-) -> List[str]:
+    incremental: bool = False,
+    cache_ttl: int | None = None,
+    discover_first: bool = False,
+    discovery_ports: List[int] | None = None,
+) -> ScanResponse:
     """
-    Run scan (thread off main loop) and upsert 'up' hosts into Devices, updating last_seen.
-    services.scanner.scan_targets may return list[str] or list[dict] with an 'ip' key.
+    Run scan (thread off main loop) and persist 'up' hosts in one set-based pass:
+    devices are upserted on mgmt_ip (last_seen bumped), their open ports synced
+    into Services and the per-profile result cached. services.scanner.scan_targets
+    returns list[dict] with an 'ip' key (bare IP strings are tolerated).
+    With incremental=True, hosts with a fresh cached result are not rescanned.
+    The "discover" profile (and discover_first) use services.discovery instead of
+    nmap's own host discovery.
     """
-    results = await asyncio.to_thread(scanner.scan_targets, targets, profile, skip_ping)
-    if not results:
-        return []
+    cached: Dict[str, dict] = {}
+    if incremental:
+        cached, targets = await asyncio.to_thread(_plan_incremental_standalone, targets, profile, cache_ttl)
 
-    ips: List[str] = []
+    results = []
+    if targets and profile == "discover":
+        results = [{"ip": ip} for ip in await discovery.discover_hosts(targets, discovery_ports)]
+    elif targets:
+        if discover_first:
+            targets, skip_ping = await _narrow_to_live_hosts(targets, discovery_ports), True
+        if targets:
+            results = await asyncio.to_thread(scanner.scan_targets, targets, profile, skip_ping)
+    if not results and not cached:
+        return ScanResponse(ok=True, count=0, hosts=[])
+
+    hosts: Dict[str, dict] = {}
     for item in results:
         if isinstance(item, str):
-            ips.append(item)
+            hosts[item] = {}
         elif isinstance(item, dict):
             ip = item.get("ip") or item.get("addr") or item.get("mgmt_ip")
             if ip:
-                ips.append(str(ip))
+                hosts[str(ip)] = item
+
+    # the commit and the topology version bump (a Redis INCR) stay off the loop
+    await asyncio.to_thread(_persist_standalone, hosts, profile)
+    ips = list(cached.keys()) + [ip for ip in hosts if ip not in cached]
+    return ScanResponse(ok=True, count=len(ips), hosts=ips, cached=len(cached), scanned=len(hosts))
+
+
+async def _stream_scan(
+    targets: List[str],
+    profile: ScanProfile,
+    skip_ping: bool,
+    incremental: bool = False,
+    cache_ttl: int | None = None,
+    discover_first: bool = False,
+    discovery_ports: List[int] | None = None,
+) -> AsyncIterator[str]:
+    """
+    NDJSON generator: one {"event": "host", ...} line per host as soon as its
+    shard reports, then a closing {"event": "done", ...} line.
+    Each host is persisted and broadcast on /ws/topology as it arrives.
+    With incremental=True, fresh cache hits are emitted first ("cached": true).
+    A slow client holds the scan back (bounded buffer); a client that
+    disconnects stops it, killing the nmap runs still in progress.
+    """
+    scan_id = uuid.uuid4().hex
+    cached: Dict[str, dict] = {}
+    if incremental:
+        cached, targets = await asyncio.to_thread(_plan_incremental_standalone, targets, profile, cache_ttl)
+    if discover_first and targets and profile != "discover":
+        targets, skip_ping = await _narrow_to_live_hosts(targets, discovery_ports), True
+    loop = asyncio.get_running_loop()
+    # Bounded: a slow client stalls the producer (and through it nmap's pipe)
+    # instead of buffering the scan here
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SCAN_STREAM_BUFFER)
+    stop = threading.Event()   # set when the client goes away
+    done = object()
+
+    async def discover() -> None:
+        # "discover" profile: probes run on the event loop, hosts stream as found
+        try:
+            async for ip in discovery.iter_live_hosts(targets, discovery_ports):
+                await queue.put((ip, {}))
+        except Exception as exc:
+            await queue.put(exc)
+        finally:
+            await queue.put(done)
+
+    def handoff(item) -> bool:
+        # Blocks this thread while the queue is full; False once the stream is closed
+        while not stop.is_set():
+            fut = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            try:
+                fut.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                fut.cancel()
+        return False
+
+    def produce() -> None:
+        # Runs in a worker thread; hands hosts over to the event loop one by one
+        if not targets:
+            handoff(done)
+            return
+        hosts = scanner.iter_sharded_scan(targets, profile, skip_ping)
+        try:
+            for item in hosts:
+                if not handoff(item):
+                    return
+        except Exception as exc:
+            handoff(exc)
+        finally:
+            hosts.close()   # an early stop kills the nmap runs still going
+            handoff(done)
+
+    if profile == "discover":
+        producer = asyncio.ensure_future(discover())
+    else:
+        producer = loop.run_in_executor(None, produce)
+    broadcast_event({"event": "scan_started", "scan_id": scan_id, "targets": targets}, topic="scan")
 
-    now = datetime.now(timezone.utc)
-    for ip in ips:
-        dev = db.query(Device).filter(Device.mgmt_ip == ip).first()
-        if not dev:
-            dev = Device(mgmt_ip=ip)
-            db.add(dev)
-            db.flush()
-        dev.last_seen = now
+    count = 0
+    error: str | None = None
+    db = SessionLocal()
+    try:
+        for ip, host in cached.items():
+            yield json.dumps({"event": "host", "scan_id": scan_id, "ip": ip, "cached": True, **host}) + "\n"
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                error = str(item)
+                continue
+            ip, host = item
+            await asyncio.to_thread(persist_scan_results, db, {ip: host}, datetime.now(timezone.utc), profile)
+            count += 1
+            event = {"event": "scan_host", "scan_id": scan_id, "ip": ip, **host}
+            broadcast_event(event, topic="scan")
+            yield json.dumps({**event, "event": "host", "cached": False}) + "\n"
+    finally:
+        stop.set()
+        if not producer.done():
+            producer.cancel()   # discover task; the executor thread exits on `stop`
+        db.close()
 
-    db.commit()
-    return ips
+    await asyncio.gather(producer, return_exceptions=True)
+    summary = {
+        "event": "done", "scan_id": scan_id, "ok": error is None,
+        "count": count + len(cached), "cached": len(cached), "scanned": count,
+    }
+    if error:
+        summary["error"] = error
+    broadcast_event({**summary, "event": "scan_done"}, topic="scan")
+    if count:
+        await notify_topology_update()
+    yield json.dumps(summary) + "\n"
 
 
 # ---------------------------
@@ -100,24 +297,63 @@ async def scan_get(
     targets: str = Query(..., description="Comma or space separated CIDRs or IPs"),
     profile: ScanProfile = Query("standard"),
     skip_ping: bool = Query(False, description="If true, do a no-ping scan"),
-    db: Session = Depends(get_db),
-      # injected by FastAPI
+    incremental: bool = Query(False, description="Only rescan hosts without a fresh cached result"),
+    cache_ttl: int | None = Query(None, ge=0, description="Cache TTL in seconds"),
+    discover_first: bool = Query(False, description="TCP-probe for live hosts first, then nmap them with -Pn"),
+    discovery_ports: str | None = Query(None, description="Comma separated TCP ports to probe"),
 ):
     target_list = _normalize_targets_param(targets)
-    ips = await _run_scan_and_persist(target_list, profile, skip_ping, db)
-    if ips:
+    resp = await _run_scan_and_persist(
+        target_list, profile, skip_ping, incremental, cache_ttl,
+        discover_first, _parse_ports_param(discovery_ports),
+    )
+    if resp.scanned:
         background_tasks.add_task(notify_topology_update_background)
-    return ScanResponse(ok=True, count=len(ips), hosts=ips)
+    return resp
 
 
 @router.post("/", response_model=ScanResponse)
 async def scan_post(
     background_tasks: BackgroundTasks,
     req: ScanRequest = Body(...),
-    db: Session = Depends(get_db),
-      # injected by FastAPI
 ):
-    ips = await _run_scan_and_persist(req.targets, req.profile, req.skip_ping, db)
-    if ips:
+    resp = await _run_scan_and_persist(
+        req.targets, req.profile, req.skip_ping, req.incremental, req.cache_ttl,
+        req.discover_first, req.discovery_ports,
+    )
+    if resp.scanned:
         background_tasks.add_task(notify_topology_update_background)
-    return ScanResponse(ok=True, count=len(ips), hosts=ips)
+    return resp
+
+
+@router.get("/stream")
+async def scan_stream_get(
+    targets: str = Query(..., description="Comma or space separated CIDRs or IPs"),
+    profile: ScanProfile = Query("standard"),
+    skip_ping: bool = Query(False, description="If true, do a no-ping scan"),
+    incremental: bool = Query(False, description="Only rescan hosts without a fresh cached result"),
+    cache_ttl: int | None = Query(None, ge=0, description="Cache TTL in seconds"),
+    discover_first: bool = Query(False, description="TCP-probe for live hosts first, then nmap them with -Pn"),
+    discovery_ports: str | None = Query(None, description="Comma separated TCP ports to probe"),
+):
+    """Streaming variant of GET /scan: NDJSON, one line per discovered host."""
+    target_list = _normalize_targets_param(targets)
+    return StreamingResponse(
+        _stream_scan(
+            target_list, profile, skip_ping, incremental, cache_ttl,
+            discover_first, _parse_ports_param(discovery_ports),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/stream")
+async def scan_stream_post(req: ScanRequest = Body(...)):
+    """Streaming variant of POST /scan: NDJSON, one line per discovered host."""
+    return StreamingResponse(
+        _stream_scan(
+            req.targets, req.profile, req.skip_ping, req.incremental, req.cache_ttl,
+            req.discover_first, req.discovery_ports,
+        ),
+        media_type="application/x-ndjson",
+    )
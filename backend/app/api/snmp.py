@@ -1,21 +1,40 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Dict, List, Literal, Optional
 
-from fastapi import APIRouter, Body, Depends, BackgroundTasks
+import asyncio
+import functools
+import os
+from fastapi import APIRouter, Body, Depends, BackgroundTasks, HTTPException, Query
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from ..db import SessionLocal
 from ..models.device import Device
-from ..models.interface import Interface
-from ..models.neighbor import Neighbor
 from ..ws import notify_topology_update_background
-from ..services.snmp import poll_sysinfo, poll_interfaces, poll_lldp_neighbors
+from ..services.counters import METRICS, store as counter_store
+from ..services.crawler import CRAWL_MAX_DEPTH, crawl, parse_scope
+from ..services.inventory import persist_snmp_results
+from ..services.events import publish_event
+from ..services.jobcontrol import JOB_SLOT_API_WAIT_SEC, DeviceBusy, limiter
+from ..services.leader import poller_lease
+from ..services.scheduler import scheduler as poll_scheduler
+from ..services.snmp import (
+    SNMP_CONCURRENCY,
+    SNMP_HOST_TIMEOUT_SEC,
+    poll_device_async,
+    poll_many,
+)
 
 router = APIRouter(prefix="/snmp", tags=["snmp"])
 
+# Per-device / per-subnet session slots, shared with jobs and the pollers
+_slot = functools.partial(limiter.aslot, wait=JOB_SLOT_API_WAIT_SEC)
+
+# Bulk polls commit this many devices per transaction
+SNMP_PERSIST_BATCH = int(os.getenv("SNMP_PERSIST_BATCH", "50"))
+
 
 # ---------------------------
 # DB session dependency
@@ -42,94 +61,233 @@ class SnmpPollResponse(BaseModel):
     sysName: Optional[str] = None
     interfaces_count: int = 0
     neighbors_count: int = 0
+    changed: bool = False      # anything besides last_seen written
+    failed_tables: List[str] = Field(default_factory=list)   # walks that errored; stored rows kept
+    error: Optional[str] = None
+
+
+class SnmpBulkPollRequest(BaseModel):
+    hosts: List[str] = Field(default_factory=list, description="Device management IPs")
+    all_known: bool = Field(False, description="Poll every device with a mgmt_ip (hosts is ignored)")
+    community: str = Field("public", description="SNMP v2c community string")
+    concurrency: int = Field(SNMP_CONCURRENCY, ge=1, le=1024, description="Devices polled at once")
+    timeout: float = Field(SNMP_HOST_TIMEOUT_SEC, gt=0, description="Per-device budget in seconds")
+
+
+class SnmpBulkPollResponse(BaseModel):
+    ok: bool
+    polled: int
+    failed: int
+    results: List[SnmpPollResponse]
+    errors: Dict[str, str] = Field(default_factory=dict)
+
+
+class SnmpCrawlRequest(BaseModel):
+    seeds: List[str] = Field(..., min_length=1, description="Management IPs to start from")
+    community: str = Field("public", description="SNMP v2c community string")
+    max_depth: int = Field(CRAWL_MAX_DEPTH, ge=0, le=64, description="LLDP hops to follow from the seeds")
+    scope: List[str] | None = Field(None, description="Only follow neighbors inside these CIDRs")
+    concurrency: int = Field(SNMP_CONCURRENCY, ge=1, le=1024, description="Devices polled at once")
+    timeout: float = Field(SNMP_HOST_TIMEOUT_SEC, gt=0, description="Per-device budget in seconds")
+
+
+class SnmpCrawlResponse(SnmpBulkPollResponse):
+    depth: Dict[str, int] = Field(default_factory=dict)   # hops from the nearest seed, per host
+    max_depth_reached: int = 0
+    truncated: int = 0          # addresses not visited because CRAWL_MAX_DEVICES was hit
 
 
 # ---------------------------
 # Helpers
 # ---------------------------
-def _infer_vendor_from_descr(descr: str) -> Optional[str]:
-    d = (descr or "").lower()
-    if "juniper" in d:
-        return "Juniper"
-    if "cisco" in d:
-        return "Cisco"
-    if "pfsense" in d:
-        return "pfSense"
-    if "ubiquiti" in d or "unifi" in d:
-        return "Ubiquiti"
-    return None
+def _to_response(host: str, persisted: dict) -> SnmpPollResponse:
+    return SnmpPollResponse(
+        ok=True,
+        host=host,
+        sysName=persisted["hostname"],
+        interfaces_count=persisted["interfaces"],
+        neighbors_count=persisted["neighbors"],
+        changed=persisted["changed"],
+        failed_tables=persisted["failed"],
+    )
+
+
+def _persist_batch(batch: Dict[str, dict]) -> List[SnmpPollResponse]:
+    """Runs in a worker thread with its own session; one commit per batch."""
+    db = SessionLocal()
+    try:
+        persisted = persist_snmp_results(db, batch, datetime.now(timezone.utc))
+        return [_to_response(host, p) for host, p in persisted.items()]
+    finally:
+        db.close()
 
 
 # ---------------------------
-# Endpoint
+# Endpoints
 # ---------------------------
 @router.post("/poll", response_model=SnmpPollResponse)
 async def snmp_poll(
     background_tasks: BackgroundTasks,
     req: SnmpPollRequest = Body(...),
-    db: Session = Depends(get_db),
-     # injected by FastAPI
 ):
     host = req.host
-    community = req.community
-
-    # Upsert device
-    dev = db.query(Device).filter(Device.mgmt_ip == host).first()
-    if not dev:
-        dev = Device(mgmt_ip=host)
-        db.add(dev)
-        db.flush()
-
-    # System info
-    sysinfo = poll_sysinfo(host, community) or {}
-    sys_name = sysinfo.get("sysName")
-    sys_descr = sysinfo.get("sysDescr") or ""
-
-    # Basic enrichment
-    if sys_name:
-        dev.hostname = sys_name
-    if sys_descr:
-        inferred = _infer_vendor_from_descr(sys_descr)
-        if inferred:
-            dev.vendor = inferred
-        dev.os = (sys_descr[:255]) if sys_descr else dev.os
-
-    dev.last_seen = datetime.now(timezone.utc)
-
-    # Interfaces: wipe & repopulate (simple approach)
-    db.query(Interface).filter(Interface.device_id == dev.id).delete(synchronize_session=False)
-    if_rows = poll_interfaces(host, community) or []
-    for row in if_rows:
-        db.add(Interface(
-            device_id=dev.id,
-            name=row.get("name"),
-            admin_up=bool(row.get("admin_up")),
-            oper_up=bool(row.get("oper_up")),
-            speed=row.get("speed"),
-            # desc=row.get("desc"),  # if you added this column
-        ))
-
-    # LLDP neighbors: wipe & repopulate (simple approach)
-    db.query(Neighbor).filter(Neighbor.local_device_id == dev.id).delete(synchronize_session=False)
-    nbrs = poll_lldp_neighbors(host, community) or []
-    for n in nbrs:
-        db.add(Neighbor(
-            local_device_id=dev.id,
-            local_if=None,
-            remote_sysname=n.get("remote_sysname"),
-            remote_port=n.get("remote_port"),
-            remote_mgmt_ip=None,
-        ))
-
-    db.commit()
-
-    # Notify clients to refresh topology (non-blocking)
-    background_tasks.add_task(notify_topology_update_background)
+    try:
+        async with _slot(host):
+            result = await poll_device_async(host, req.community)
+    except DeviceBusy as exc:
+        raise HTTPException(429, str(exc))
+    if not result["reachable"]:
+        # same as /poll-bulk: a device that didn't answer is reported, not written
+        return SnmpPollResponse(ok=False, host=host, error="no SNMP response")
 
-    return SnmpPollResponse(
-        ok=True,
-        host=host,
-        sysName=dev.hostname,
-        interfaces_count=len(if_rows),
-        neighbors_count=len(nbrs),
+    # commit and topology version bump (a Redis INCR) run off the loop
+    response = (await asyncio.to_thread(_persist_batch, {host: result}))[0]
+
+    # Notify clients to refresh topology (non-blocking), only if something moved
+    if response.changed:
+        background_tasks.add_task(notify_topology_update_background)
+
+    return response
+
+
+@router.post("/poll-bulk", response_model=SnmpBulkPollResponse)
+async def snmp_poll_bulk(
+    background_tasks: BackgroundTasks,
+    req: SnmpBulkPollRequest = Body(...),
+    db: Session = Depends(get_db),
+):
+    """
+    Poll many devices concurrently over puresnmp's asyncio client. Results are
+    persisted in batches of SNMP_PERSIST_BATCH devices while polling continues;
+    devices that time out or don't answer are reported in `errors` and left as-is.
+    Clients are only told to refresh when some device actually changed.
+    """
+    if req.all_known:
+        hosts = [ip for (ip,) in db.query(Device.mgmt_ip).filter(Device.mgmt_ip.isnot(None)).all()]
+    else:
+        hosts = list(dict.fromkeys(h.strip() for h in req.hosts if h.strip()))
+
+    results: List[SnmpPollResponse] = []
+    errors: Dict[str, str] = {}
+    batch: Dict[str, dict] = {}
+
+    # In-flight polls keep running while a batch is being written
+    async for host, res, err in poll_many(hosts, req.community, req.concurrency, req.timeout, guard=_slot):
+        if err:
+            errors[host] = err
+            continue
+        batch[host] = res
+        if len(batch) >= SNMP_PERSIST_BATCH:
+            results.extend(await asyncio.to_thread(_persist_batch, batch))
+            batch = {}
+    if batch:
+        results.extend(await asyncio.to_thread(_persist_batch, batch))
+
+    if any(r.changed for r in results):
+        background_tasks.add_task(notify_topology_update_background)
+
+    return SnmpBulkPollResponse(
+        ok=not errors,
+        polled=len(results),
+        failed=len(errors),
+        results=results,
+        errors=errors,
     )
+
+
+@router.post("/crawl", response_model=SnmpCrawlResponse)
+async def snmp_crawl(
+    background_tasks: BackgroundTasks,
+    req: SnmpCrawlRequest = Body(...),
+):
+    """
+    Map the network from a few seeds: poll them, follow each LLDP neighbor's
+    management address breadth-first up to max_depth hops, and persist every
+    device found the same way /poll-bulk does. A crawl cut short by
+    CRAWL_MAX_DEVICES reports ok=false and how many addresses it left out.
+    """
+    try:
+        parse_scope(req.scope)
+    except ValueError as exc:
+        raise HTTPException(422, str(exc))
+    results: List[SnmpPollResponse] = []
+    errors: Dict[str, str] = {}
+    depth: Dict[str, int] = {}
+    batch: Dict[str, dict] = {}
+    stats: Dict[str, int] = {}
+
+    async for host, hops, res, err in crawl(
+        req.seeds, req.community, req.max_depth, req.concurrency, req.timeout, req.scope,
+        stats=stats, guard=_slot,
+    ):
+        depth[host] = hops
+        if err:
+            errors[host] = err
+            continue
+        batch[host] = res
+        if len(batch) >= SNMP_PERSIST_BATCH:
+            results.extend(await asyncio.to_thread(_persist_batch, batch))
+            batch = {}
+    if batch:
+        results.extend(await asyncio.to_thread(_persist_batch, batch))
+
+    if any(r.changed for r in results):
+        background_tasks.add_task(notify_topology_update_background)
+
+    return SnmpCrawlResponse(
+        ok=not errors and not stats["truncated"],
+        polled=len(results),
+        failed=len(errors),
+        results=results,
+        errors=errors,
+        depth=depth,
+        max_depth_reached=max((depth[r.host] for r in results), default=0),
+        truncated=stats["truncated"],
+    )
+
+
+@router.get("/counters/{device_id}")
+async def interface_counters(
+    device_id: int,
+    resolution: Literal["1m", "5m", "1h"] = Query("1m"),
+    if_index: Optional[str] = Query(None, description="Single ifIndex; all interfaces if omitted"),
+    since: Optional[float] = Query(None, description="Unix timestamp; only buckets at/after it"),
+):
+    """
+    Interface utilisation series from the in-memory counter store, column form:
+    {"interfaces": {ifIndex: {"name", "t": [...], "in_bps": [...], ...}}}.
+    """
+    series = counter_store.query(device_id, resolution, if_index, since)
+    if if_index is not None and not series:
+        raise HTTPException(404, "No counter data for this interface")
+    return {
+        "device_id": device_id,
+        "resolution": resolution,
+        "metrics": list(METRICS),
+        "interfaces": series,
+    }
+
+
+@router.get("/scheduler")
+async def scheduler_stats():
+    """
+    Background poller health: devices tracked, how late due polls are picked up
+    (lag_sec) and completed polls per minute against what the interval requires.
+    Only the worker holding the poller lease runs it ("leader"); the others
+    report an idle scheduler.
+    """
+    return {**poll_scheduler.stats(), "leader": poller_lease.leader}
+
+
+@router.post("/scheduler/poll-now/{device_id}")
+async def scheduler_poll_now(device_id: int):
+    """
+    Put a device at the front of the background poller's queue. Handled here
+    when this worker runs the scheduler, else forwarded to the one that does.
+    """
+    if not poller_lease.leader:
+        publish_event({"type": "poll_now", "device_id": device_id})
+        return {"ok": True, "device_id": device_id, "forwarded": True}
+    if not poll_scheduler.poll_now(device_id):
+        raise HTTPException(404, "Device is not tracked by the scheduler")
+    return {"ok": True, "device_id": device_id}
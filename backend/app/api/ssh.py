@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Body
+import asyncio
+
+from fastapi import APIRouter, Body, HTTPException
+from ..services.jobcontrol import JOB_SLOT_API_WAIT_SEC, DeviceBusy, limiter
 from ..services.sshpush import push_juniper_set_config
 
 
@@ -14,5 +17,11 @@ async def push_config(
     config_text: str = Body(..., description="Juniper set-style commands or 'configure' mode script"),
     dry_run: bool = Body(True)
 ):
-    result = push_juniper_set_config(host, username, password, private_key_path, config_text, dry_run)
-    return result
\ No newline at end of file
+    try:
+        async with limiter.aslot(host, wait=JOB_SLOT_API_WAIT_SEC):
+            result = await asyncio.to_thread(
+                push_juniper_set_config, host, username, password, private_key_path, config_text, dry_run,
+            )
+    except DeviceBusy as exc:
+        raise HTTPException(429, str(exc))
+    return result
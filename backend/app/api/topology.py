@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from ..db import SessionLocal
-from ..services.topology import build_topology
+from ..services.analytics import analytics
+from ..services.topology import TopologySnapshot, cache as topology_cache
 
 router = APIRouter(prefix="/topology", tags=["topology"])
 
@@ -13,5 +14,62 @@ def get_db():
         db.close()
 
 @router.get("/")
-def get_topology(db: Session = Depends(get_db)):
-    return build_topology(db)
+def get_topology(
+    if_none_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Cached, versioned snapshot ({"version", "nodes", "edges"}). Rebuilt at most
+    once per change; answers 304 when the client's ETag is still current.
+    """
+    snap = topology_cache.get(db)
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache"}
+    if if_none_match and snap.etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
+
+
+# ---------------------------
+# Analytics (on the cached snapshot, memoised per version)
+# ---------------------------
+def _snapshot_with(db: Session, *device_ids: int | None) -> TopologySnapshot:
+    snap = topology_cache.get(db)
+    for dev_id in device_ids:
+        if dev_id is not None and dev_id not in snap.graph:
+            raise HTTPException(status_code=404, detail=f"Device {dev_id} not in topology")
+    return snap
+
+@router.get("/path")
+def shortest_path(
+    src: int = Query(..., description="Source device id"),
+    dst: int = Query(..., description="Destination device id"),
+    db: Session = Depends(get_db),
+):
+    """Fewest-hop path between two devices; path is null when they aren't connected."""
+    snap = _snapshot_with(db, src, dst)
+    path = analytics.shortest_path(snap, src, dst)
+    return {"version": snap.version, "path": path, "hops": len(path) - 1 if path else None}
+
+@router.get("/blast-radius")
+def blast_radius(
+    device_id: int | None = Query(None, description="Failed device"),
+    source: int | None = Query(None, description="Failed link: one end"),
+    target: int | None = Query(None, description="Failed link: other end"),
+    root: int | None = Query(None, description="Judge reachability from this device (default: largest remaining piece)"),
+    db: Session = Depends(get_db),
+):
+    """Devices that become unreachable if a device, or the link source-target, fails."""
+    if (device_id is None) == (source is None or target is None):
+        raise HTTPException(status_code=422, detail="Give either device_id or both source and target")
+    snap = _snapshot_with(db, device_id, source, target, root)
+    link = (source, target) if device_id is None else None
+    if link and not snap.graph.has_edge(*link):
+        raise HTTPException(status_code=404, detail="No such link in topology")
+    cut = analytics.blast_radius(snap, device=device_id, link=link, root=root)
+    return {"version": snap.version, "unreachable": cut, "count": len(cut)}
+
+@router.get("/spof")
+def single_points_of_failure(db: Session = Depends(get_db)):
+    """Articulation points (devices) and bridges (links) whose failure partitions the network."""
+    snap = topology_cache.get(db)
+    return {"version": snap.version, **analytics.single_points_of_failure(snap)}
@@ -5,7 +5,8 @@ from sqlalchemy.orm import Session
 from ..db import SessionLocal
 from ..models.device import Device
 from ..models.topology_layout import TopologyLayout
-from ..schemas.layout import LayoutSetRequest, LayoutGetResponse
+from ..schemas.layout import LayoutSetRequest, LayoutGetResponse, LayoutComputedResponse
+from ..services.layout import layout_cache
 
 router = APIRouter(prefix="/topology/layout", tags=["topology"])
 
@@ -36,11 +37,13 @@ def set_layout(payload: LayoutSetRequest = Body(...), db: Session = Depends(get_
             p = by_id[row.device_id]
             row.pos_x = float(p.x)
             row.pos_y = float(p.y)
+            row.pinned = True
             seen.add(row.device_id)
         for did, p in by_id.items():
             if did not in seen:
-                db.add(TopologyLayout(device_id=did, pos_x=float(p.x), pos_y=float(p.y)))
+                db.add(TopologyLayout(device_id=did, pos_x=float(p.x), pos_y=float(p.y), pinned=True))
         db.commit()
+        layout_cache.invalidate()
 
     # Return current map
     all_rows = db.query(TopologyLayout).all()
@@ -53,5 +56,20 @@ def clear_layout(device_id: int | None = Query(None), db: Session = Depends(get_
     else:
         db.query(TopologyLayout).filter(TopologyLayout.device_id == device_id).delete(synchronize_session=False)
     db.commit()
+    layout_cache.invalidate()
     rows = db.query(TopologyLayout).all()
     return {"points": {r.device_id: {"x": float(r.pos_x), "y": float(r.pos_y)} for r in rows}}
+
+
+@router.get("/computed", response_model=LayoutComputedResponse)
+def get_computed_layout(
+    full: bool = Query(False, description="Re-run the whole layout (pinned nodes still stay put)"),
+    db: Session = Depends(get_db),
+):
+    """
+    Positions for every device, computed server-side around the pinned ones.
+    Served from cache; a newer topology version (or full=true) is laid out in
+    the background, so "version" may trail the topology until it lands.
+    New devices are placed incrementally.
+    """
+    return layout_cache.get(db, full)
@@ -0,0 +1,90 @@
+# backend/app/db_upgrade.py
+# Brings a database created by an older build up to the current models.
+#
+# create_all() only creates missing tables; it never touches existing ones.
+# This adds the columns introduced since, merges devices that share a
+# mgmt_ip and swaps the plain ix_devices_mgmt_ip index for a unique one (the
+# scan upsert relies on ON CONFLICT (mgmt_ip)). Every step checks first, so
+# it is safe to run on every startup; on Postgres it runs in one transaction
+# under an advisory lock, so several uvicorn workers starting together don't
+# trip over each other.
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+
+# (table, column, DDL type) added after the first release
+ADDED_COLUMNS = [
+    ("interfaces", "if_index", "VARCHAR"),
+    ("neighbors", "instance", "VARCHAR"),
+    ("neighbors", "remote_chassis_id", "VARCHAR"),
+    # rows that predate the flag were all placed by hand
+    ("topology_layouts", "pinned", "BOOLEAN NOT NULL DEFAULT TRUE"),
+]
+
+# tables pointing at devices.id that are moved onto the surviving device
+_DEVICE_CHILDREN = [
+    ("services", "device_id"),
+    ("interfaces", "device_id"),
+    ("neighbors", "local_device_id"),
+    ("config_backups", "device_id"),
+]
+
+_ADVISORY_LOCK_ID = 0x686C6162   # "hlab"
+
+
+def _add_columns(conn: Connection) -> None:
+    postgres = conn.dialect.name == "postgresql"
+    insp = inspect(conn)
+    for table, column, ddl in ADDED_COLUMNS:
+        if not insp.has_table(table):
+            continue
+        if postgres:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+        elif column not in {c["name"] for c in insp.get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _merge_duplicate_devices(conn: Connection) -> int:
+    """
+    Keep the oldest device per mgmt_ip; its duplicates' services, interfaces,
+    neighbors and backups move over to it. Layout positions of the duplicates
+    are dropped (one position per device). Returns devices removed.
+    """
+    dupes = conn.execute(text(
+        "SELECT d.id, k.keep FROM devices d JOIN ("
+        " SELECT mgmt_ip, MIN(id) AS keep FROM devices"
+        " WHERE mgmt_ip IS NOT NULL GROUP BY mgmt_ip HAVING COUNT(*) > 1"
+        ") k ON d.mgmt_ip = k.mgmt_ip WHERE d.id <> k.keep"
+    )).all()
+    if not dupes:
+        return 0
+    insp = inspect(conn)
+    pairs = [{"dupe": dupe, "keep": keep} for dupe, keep in dupes]
+    for table, column in _DEVICE_CHILDREN:
+        if insp.has_table(table):
+            conn.execute(text(f"UPDATE {table} SET {column} = :keep WHERE {column} = :dupe"), pairs)
+    if insp.has_table("topology_layouts"):
+        conn.execute(text("DELETE FROM topology_layouts WHERE device_id = :dupe"), pairs)
+    conn.execute(text("DELETE FROM devices WHERE id = :dupe"), pairs)
+    return len(pairs)
+
+
+def _unique_mgmt_ip(conn: Connection) -> None:
+    index = next((i for i in inspect(conn).get_indexes("devices") if i["name"] == "ix_devices_mgmt_ip"), None)
+    if index is not None and index.get("unique"):
+        return
+    if index is not None:
+        conn.execute(text("DROP INDEX ix_devices_mgmt_ip"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_devices_mgmt_ip ON devices (mgmt_ip)"))
+
+
+def upgrade_schema(engine: Engine) -> None:
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _ADVISORY_LOCK_ID})
+        if not inspect(conn).has_table("devices"):
+            return
+        _add_columns(conn)
+        _merge_duplicate_devices(conn)
+        _unique_mgmt_ip(conn)
@@ -1,6 +1,8 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from sqlalchemy import text
 from .db import enjoy
+from .db_upgrade import upgrade_schema
 from .models.base import Base
 from .models.device import Device
 from .models.service import Service
@@ -14,15 +16,62 @@ from .models.config_backup import ConfigBackup  # noqa: F401
 from .api import topology, configsync, jobs
 from fastapi.staticfiles import StaticFiles
 from .models.topology_layout import TopologyLayout  # noqa: F401
+from .models.scan_result import ScanResult  # noqa: F401
 from .api import topology_layout
-from .ws import router as ws_router
+from .ws import router as ws_router, handle_event
+from .services.events import bus as event_bus
+from .services.queues import redis_registry
+from .services.sshpool import ssh_pool
+from .services.counters import collector as counter_collector, store as counter_store
+from .services.leader import poller_lease
+from .services.scheduler import scheduler as poll_scheduler
 
 
-app = FastAPI(title="Homelab Orchestrator (MVP)", version="0.1.0")
+def start_pollers() -> None:
+    counter_collector.start()
+    poll_scheduler.start()
 
 
-# Create tables on startup (simple for MVP; use Alembic later)
+async def stop_pollers() -> None:
+    await poll_scheduler.stop()
+    await counter_collector.stop()
+
+
+async def on_event(event: dict) -> None:
+    # poller traffic is handled here; everything else is for the WebSockets
+    kind = event.get("type")
+    if kind == "counters":
+        counter_store.ingest(event["device_id"], event["counters"], event["ts"])
+    elif kind == "poll_now":
+        if poller_lease.leader:
+            poll_scheduler.poll_now(event["device_id"])
+    else:
+        await handle_event(event)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The event bus subscriber and the shared Redis pool live as long as the
+    # app; the background pollers run in whichever worker holds the lease
+    redis_registry.open()
+    await event_bus.start(on_event)
+    await poller_lease.start(start_pollers, stop_pollers)
+    try:
+        yield
+    finally:
+        await poller_lease.stop()
+        await event_bus.stop()
+        redis_registry.close()
+        ssh_pool.close_all()
+
+
+app = FastAPI(title="Homelab Orchestrator (MVP)", version="0.1.0", lifespan=lifespan)
+
+
+# Create tables on startup (simple for MVP; use Alembic later), then bring
+# tables from older builds up to date
 Base.metadata.create_all(bind=enjoy)
+upgrade_schema(enjoy)
 
 
 @app.get("/health")
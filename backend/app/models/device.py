@@ -9,7 +9,9 @@ class Device(Base):
 
     id = Column(Integer, primary_key=True)
     hostname = Column(String, index=True)
-    mgmt_ip = Column(String, index=True)
+    # Unique so scans can upsert with ON CONFLICT (mgmt_ip); db_upgrade.py
+    # converts databases that still have the old plain index.
+    mgmt_ip = Column(String, index=True, unique=True)
     mac = Column(String, index=True)
     vendor = Column(String)
     model = Column(String)
@@ -6,6 +6,7 @@ class Interface(Base):
     __tablename__ = "interfaces"
     id = Column(Integer, primary_key=True)
     device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), index=True)
+    if_index = Column(String)          # SNMP ifIndex; diff key for polls
     name = Column(String, index=True)
     mac = Column(String)
     admin_up = Column(Boolean, default=None)
@@ -5,7 +5,9 @@ class Neighbor(Base):
     __tablename__ = "neighbors"
     id = Column(Integer, primary_key=True)
     local_device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), index=True)
+    instance = Column(String)          # LLDP "<localPort>.<remIndex>"; diff key for polls
     local_if = Column(String)
     remote_sysname = Column(String)
     remote_port = Column(String)
     remote_mgmt_ip = Column(String)
+    remote_chassis_id = Column(String)  # lldpRemChassisId; aa:bb:.. when it's a MAC
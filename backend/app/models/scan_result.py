@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, UniqueConstraint
+from datetime import datetime
+from .base import Base
+
+class ScanResult(Base):
+    """Last scan result per (mgmt_ip, profile); backs incremental rescans."""
+    __tablename__ = "scan_results"
+
+    id = Column(Integer, primary_key=True)
+    mgmt_ip = Column(String, nullable=False, index=True)
+    profile = Column(String, nullable=False)
+    scanned_at = Column(DateTime, default=datetime.utcnow, index=True)
+    result = Column(JSON, default=dict)      # host dict as returned by run_nmap_scan
+
+    __table_args__ = (
+        UniqueConstraint("mgmt_ip", "profile", name="uq_scan_result_ip_profile"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import Boolean, Column, Integer, Float, ForeignKey, UniqueConstraint, Index
 from .base import Base
 
 class TopologyLayout(Base):
@@ -8,6 +8,9 @@ class TopologyLayout(Base):
     device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
     pos_x = Column(Float, nullable=False)
     pos_y = Column(Float, nullable=False)
+    # True for positions placed by hand (the layout engine leaves them alone);
+    # computed positions are stored with pinned=False
+    pinned = Column(Boolean, nullable=False, default=True)
 
     __table_args__ = (
         UniqueConstraint("device_id", name="uq_topo_layout_device"),
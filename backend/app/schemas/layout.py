@@ -14,3 +14,10 @@ class LayoutGetResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     # Map device_id -> {x,y}
     points: dict[int, dict[str, float]]
+
+class LayoutComputedResponse(BaseModel):
+    version: int                              # topology version the positions belong to
+    points: dict[int, dict[str, float]]       # every device in the topology
+    pinned: List[int]                         # device ids placed by hand (never moved)
+    mode: str                                 # "full" or "incremental"
+    moved: int                                # positions (re)computed by the last run
@@ -0,0 +1,105 @@
+# backend/app/services/analytics.py
+# Graph questions answered on the cached topology snapshot (services.topology):
+# shortest paths, blast radius of a device or link failure, and single points
+# of failure. The snapshot graph is already built once per topology version,
+# so queries are plain networkx traversals; results are memoised per version
+# and dropped wholesale when the version moves.
+
+from __future__ import annotations
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import networkx as nx
+
+from .topology import TopologySnapshot
+
+
+# Distinct query results kept per version (paths are per device pair)
+ANALYTICS_MEMO_SIZE = int(os.getenv("ANALYTICS_MEMO_SIZE", "4096"))
+
+
+class TopologyAnalytics:
+    def __init__(self) -> None:
+        self.version: Optional[int] = None
+        self.memo: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+
+    def _memoised(self, snap: TopologySnapshot, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if self.version != snap.version:
+                self.version, self.memo = snap.version, {}
+            if key in self.memo:
+                return self.memo[key]
+        value = compute()
+        with self._lock:
+            if self.version == snap.version and len(self.memo) < ANALYTICS_MEMO_SIZE:
+                self.memo[key] = value
+        return value
+
+    # ---- queries ----
+
+    def shortest_path(self, snap: TopologySnapshot, src: int, dst: int) -> Optional[List[int]]:
+        """Device ids from src to dst (fewest hops), or None if they aren't connected."""
+        def compute():
+            try:
+                return nx.shortest_path(snap.graph, src, dst)
+            except nx.NetworkXNoPath:
+                return None
+        return self._memoised(snap, ("path", src, dst), compute)
+
+    def single_points_of_failure(self, snap: TopologySnapshot) -> Dict[str, list]:
+        """Articulation points (devices) and bridges (links) whose loss splits the network."""
+        def compute():
+            G = snap.graph
+            return {
+                "articulation_points": sorted(nx.articulation_points(G)),
+                "bridges": sorted([min(u, v), max(u, v)] for u, v in nx.bridges(G)),
+            }
+        return self._memoised(snap, ("spof",), compute)
+
+    def blast_radius(
+        self,
+        snap: TopologySnapshot,
+        device: Optional[int] = None,
+        link: Optional[Tuple[int, int]] = None,
+        root: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Devices cut off when `device` (or the `link`) fails. Reachability is
+        judged from `root` when given, else from the largest piece the failed
+        element's component breaks into. The failed device itself isn't listed.
+        """
+        key = ("blast", device, tuple(sorted(link)) if link else None, root)
+
+        def compute():
+            G = snap.graph
+            if device is not None:
+                if not G[device]:
+                    return []
+                component = nx.node_connected_component(G, device) - {device}
+                view = nx.restricted_view(G, [device], [])
+            else:
+                u, v = link
+                if not G.has_edge(u, v):
+                    return []
+                component = nx.node_connected_component(G, u)
+                view = nx.restricted_view(G, [], [(u, v), (v, u)])
+            if root is not None and root != device:
+                if root not in component:
+                    return []
+                kept = nx.node_connected_component(view, root)
+            else:
+                kept = set()
+                seen = set()
+                for n in component:
+                    if n not in seen:
+                        piece = nx.node_connected_component(view, n)
+                        seen |= piece
+                        if len(piece) > len(kept):
+                            kept = piece
+            return sorted(component - kept)
+        return self._memoised(snap, key, compute)
+
+
+analytics = TopologyAnalytics()
@@ -1,9 +1,9 @@
 from pathlib import Path
 from datetime import datetime
 import hashlib
-import paramiko
 from sqlalchemy.orm import Session
 from ..models.config_backup import ConfigBackup
+from .sshpool import ssh_pool
 
 BACKUP_DIR = Path("/configs/backups")
 BACKUP_DIR.mkdir(parents=True, exist_ok=True)
@@ -12,21 +12,10 @@ def _sha256_bytes(data: bytes) -> str:
     h = hashlib.sha256(); h.update(data); return h.hexdigest()
 
 def _ssh_read(host: str, username: str, password: str | None = None, key_path: str | None = None, cmd: str = "show configuration | display set"):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    if key_path:
-        key = paramiko.RSAKey.from_private_key_file(key_path)
-        client.connect(host, username=username, pkey=key, look_for_keys=False)
-    else:
-        client.connect(host, username=username, password=password, look_for_keys=False)
-    try:
-        _, out, err = client.exec_command(cmd)
-        data = out.read()
-        if not data:
-            raise RuntimeError(err.read().decode(errors="ignore"))
-        return data
-    finally:
-        client.close()
+    data, err, _ = ssh_pool.run(host, username, cmd, password=password, key_path=key_path)
+    if not data:
+        raise RuntimeError(err.decode(errors="ignore"))
+    return data
 
 def backup_juniper(db: Session, device_id: int, host: str, username: str, password: str | None, key_path: str | None) -> dict:
     raw = _ssh_read(host, username, password, key_path, "show configuration | display set | no-more")
@@ -0,0 +1,270 @@
+# backend/app/services/counters.py
+# Interface utilisation time-series kept in memory, no ORM row per sample.
+#
+# Every (device, ifIndex) gets one RingSeries per resolution (1m/5m/1h). A ring
+# is a fixed number of time slots backed by flat arrays (uint32 bucket stamp,
+# uint16 sample count, 4 x float32 metrics), so an interface costs ~15 KB with
+# the default retention no matter how long the collector runs. Slots are
+# addressed by bucket % capacity; a sample updates the running mean of its
+# bucket in every resolution, which makes the 5m/1h rollups free.
+#
+# Only the worker holding the poller lease (services.leader) collects; on the
+# Redis bus it publishes every poll as a "counters" event and all workers feed
+# their own store from it, so any worker can answer counter queries.
+
+from __future__ import annotations
+import asyncio
+import os
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from ..db import SessionLocal
+from ..models.device import Device
+from ..models.interface import Interface
+from .events import EVENT_BUS, publish_event
+from .jobcontrol import DeviceBusy, limiter
+from .snmp import SNMP_COMMUNITY, SNMP_CONCURRENCY, SNMP_HOST_TIMEOUT_SEC, poll_counters_async
+
+
+# -------------------------------
+# Tunables
+# -------------------------------
+
+COUNTER_POLL_INTERVAL_SEC = int(os.getenv("COUNTER_POLL_INTERVAL_SEC", "60"))  # 0 disables
+
+# resolution -> (bucket seconds, slots kept)
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "1m": (60, int(os.getenv("COUNTER_SLOTS_1M", "240"))),    # 4 hours
+    "5m": (300, int(os.getenv("COUNTER_SLOTS_5M", "288"))),   # 24 hours
+    "1h": (3600, int(os.getenv("COUNTER_SLOTS_1H", "168"))),  # 7 days
+}
+
+METRICS = ("in_bps", "out_bps", "in_errors_ps", "out_errors_ps")
+
+
+# -------------------------------
+# Rate computation
+# -------------------------------
+
+def counter_delta(prev: Optional[int], cur: Optional[int], bits: int) -> Optional[int]:
+    """
+    Wrap-safe counter difference. A decrease is a wrap only if it is plausible
+    for the counter width (the old value was in the top half of the range);
+    otherwise it's a reset (agent reboot, counter cleared) and yields None.
+    64-bit counters don't wrap in practice, so any decrease there is a reset.
+    """
+    if prev is None or cur is None:
+        return None
+    if cur >= prev:
+        return cur - prev
+    if bits == 64:
+        return None
+    span = 1 << bits
+    if prev >= span // 2:
+        return cur + span - prev
+    return None
+
+
+# -------------------------------
+# Storage
+# -------------------------------
+
+class RingSeries:
+    """Fixed-size, slot-addressed ring of per-bucket metric means."""
+
+    __slots__ = ("step", "capacity", "stamps", "counts", "values")
+
+    def __init__(self, step: int, capacity: int) -> None:
+        self.step = step
+        self.capacity = capacity
+        self.stamps = array("I", bytes(4 * capacity))     # bucket number + 1 (0 = empty)
+        self.counts = array("H", bytes(2 * capacity))
+        self.values = array("f", bytes(4 * capacity * len(METRICS)))
+
+    def add(self, ts: float, sample: Tuple[float, ...]) -> None:
+        bucket = int(ts) // self.step
+        slot = bucket % self.capacity
+        base = slot * len(METRICS)
+        if self.stamps[slot] != bucket + 1:
+            self.stamps[slot] = bucket + 1
+            self.counts[slot] = 1
+            for i, v in enumerate(sample):
+                self.values[base + i] = v
+            return
+        n = min(self.counts[slot] + 1, 0xFFFF)
+        self.counts[slot] = n
+        for i, v in enumerate(sample):
+            cur = self.values[base + i]
+            self.values[base + i] = cur + (v - cur) / n
+
+    def points(self, now: float, since: Optional[float] = None) -> List[Tuple[int, ...]]:
+        """[(bucket_start_ts, *metrics)] oldest first, limited to the retention window."""
+        newest = int(now) // self.step
+        oldest = newest - self.capacity + 1
+        if since is not None:
+            oldest = max(oldest, int(since) // self.step)
+        out = []
+        for slot in range(self.capacity):
+            stamp = self.stamps[slot]
+            if not stamp or not (oldest <= stamp - 1 <= newest):
+                continue
+            base = slot * len(METRICS)
+            out.append(((stamp - 1) * self.step, *self.values[base:base + len(METRICS)]))
+        out.sort()
+        return out
+
+
+class InterfaceSeries:
+    __slots__ = ("name", "last_ts", "last", "rings")
+
+    def __init__(self) -> None:
+        self.name: Optional[str] = None
+        self.last_ts: Optional[float] = None
+        self.last: Optional[dict] = None
+        self.rings = {res: RingSeries(step, cap) for res, (step, cap) in RESOLUTIONS.items()}
+
+
+class CounterStore:
+    """In-memory series for every (device_id, ifIndex) the collector has seen."""
+
+    def __init__(self) -> None:
+        self.series: Dict[Tuple[int, str], InterfaceSeries] = {}
+
+    def ingest(self, device_id: int, counters: Dict[str, dict], ts: float) -> int:
+        """Feed one poll of raw counters; returns how many rate samples were stored."""
+        stored = 0
+        for idx, cur in counters.items():
+            s = self.series.get((device_id, idx))
+            if s is None:
+                s = self.series[(device_id, idx)] = InterfaceSeries()
+            s.name = cur.get("name") or s.name
+            prev, prev_ts = s.last, s.last_ts
+            s.last, s.last_ts = cur, ts
+            if prev is None or prev_ts is None or ts <= prev_ts:
+                continue
+            if prev.get("octet_bits") != cur.get("octet_bits"):
+                continue  # switched between HC and 32-bit counters
+            dt = ts - prev_ts
+            bits = cur.get("octet_bits") or 32
+            d_in = counter_delta(prev.get("in_octets"), cur.get("in_octets"), bits)
+            d_out = counter_delta(prev.get("out_octets"), cur.get("out_octets"), bits)
+            if d_in is None or d_out is None:
+                continue
+            d_ie = counter_delta(prev.get("in_errors"), cur.get("in_errors"), 32) or 0
+            d_oe = counter_delta(prev.get("out_errors"), cur.get("out_errors"), 32) or 0
+            sample = (d_in * 8 / dt, d_out * 8 / dt, d_ie / dt, d_oe / dt)
+            for ring in s.rings.values():
+                ring.add(ts, sample)
+            stored += 1
+        return stored
+
+    def query(
+        self,
+        device_id: int,
+        resolution: str = "1m",
+        if_index: Optional[str] = None,
+        since: Optional[float] = None,
+        now: Optional[float] = None,
+    ) -> Dict[str, dict]:
+        """{ifIndex: {"name", "t": [...], "in_bps": [...], ...}} in column form."""
+        now = time.time() if now is None else now
+        out: Dict[str, dict] = {}
+        for (dev, idx), s in self.series.items():
+            if dev != device_id or (if_index is not None and idx != if_index):
+                continue
+            pts = s.rings[resolution].points(now, since)
+            cols: Dict[str, list] = {"t": [p[0] for p in pts]}
+            for i, m in enumerate(METRICS, start=1):
+                cols[m] = [round(p[i], 3) for p in pts]
+            out[idx] = {"name": s.name, **cols}
+        return out
+
+    def forget_device(self, device_id: int) -> None:
+        for key in [k for k in self.series if k[0] == device_id]:
+            del self.series[key]
+
+
+store = CounterStore()
+
+
+# -------------------------------
+# Collector
+# -------------------------------
+
+def _snmp_targets() -> List[Tuple[int, str]]:
+    """Devices that have answered SNMP before (i.e. have Interface rows)."""
+    db = SessionLocal()
+    try:
+        q = (
+            select(Device.id, Device.mgmt_ip)
+            .where(Device.mgmt_ip.isnot(None), Device.id.in_(select(Interface.device_id)))
+        )
+        return [(dev_id, ip) for dev_id, ip in db.execute(q)]
+    finally:
+        db.close()
+
+
+async def collect_once(community: str = SNMP_COMMUNITY) -> Dict[str, int]:
+    """One collection round over every SNMP-capable device."""
+    targets = await asyncio.to_thread(_snmp_targets)
+    sem = asyncio.Semaphore(SNMP_CONCURRENCY)
+    stats = {"devices": len(targets), "failed": 0, "busy": 0, "samples": 0}
+
+    async def one(dev_id: int, ip: str) -> None:
+        async with sem:
+            try:
+                # a device busy with a job or API session sits this round out
+                async with limiter.aslot(ip, wait=0):
+                    counters = await asyncio.wait_for(poll_counters_async(ip, community), SNMP_HOST_TIMEOUT_SEC)
+            except DeviceBusy:
+                stats["busy"] += 1
+                return
+            except Exception:
+                stats["failed"] += 1
+                return
+            ts = time.time()
+            stats["samples"] += store.ingest(dev_id, counters, ts)
+            if EVENT_BUS == "redis":
+                # other workers' stores; our own copy comes back as a no-op (same ts)
+                publish_event({"type": "counters", "device_id": dev_id, "ts": ts, "counters": counters})
+
+    await asyncio.gather(*(one(dev_id, ip) for dev_id, ip in targets))
+    return stats
+
+
+class CounterCollector:
+    """Background task polling counters every COUNTER_POLL_INTERVAL_SEC."""
+
+    def __init__(self, interval: int = COUNTER_POLL_INTERVAL_SEC) -> None:
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_stats: Dict[str, int] = {}
+
+    def start(self) -> None:
+        if self.interval > 0 and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                self.last_stats = await collect_once()
+            except Exception:
+                pass  # DB hiccup etc.; try again next round
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+
+collector = CounterCollector()
@@ -0,0 +1,130 @@
+# backend/app/services/crawler.py
+# Breadth-first LLDP crawl: poll the seeds, follow every neighbor that
+# advertises a management address, repeat until the depth limit.
+#
+# Polls run concurrently (bounded); the frontier is a FIFO so hosts are visited
+# in depth order even though results come back in completion order. Devices
+# are deduplicated by address and by sysName, so a switch reachable through
+# several addresses is only polled once its name is known.
+
+from __future__ import annotations
+import asyncio
+import contextlib
+import os
+from collections import deque
+from ipaddress import ip_address, ip_network
+from typing import AsyncContextManager, AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from .snmp import SNMP_CONCURRENCY, SNMP_HOST_TIMEOUT_SEC, poll_device_async
+
+
+# -------------------------------
+# Tunables
+# -------------------------------
+
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "8"))
+# Hard stop so a crawl that leaks into someone else's network ends eventually
+CRAWL_MAX_DEVICES = int(os.getenv("CRAWL_MAX_DEVICES", "5000"))
+
+
+# -------------------------------
+# Crawl
+# -------------------------------
+
+def parse_scope(scope: Optional[List[str]]) -> list:
+    """CIDR strings -> networks; ValueError names the first bad entry."""
+    nets = []
+    for cidr in scope or []:
+        try:
+            nets.append(ip_network(cidr.strip(), strict=False))
+        except ValueError:
+            raise ValueError(f"invalid scope CIDR {cidr!r}") from None
+    return nets
+
+
+def _in_scope(ip: str, scope) -> bool:
+    if not scope:
+        return True
+    try:
+        addr = ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in scope)
+
+
+async def crawl(
+    seeds: List[str],
+    community: str,
+    max_depth: int = CRAWL_MAX_DEPTH,
+    concurrency: int = SNMP_CONCURRENCY,
+    timeout: float = SNMP_HOST_TIMEOUT_SEC,
+    scope: Optional[List[str]] = None,
+    max_devices: int = CRAWL_MAX_DEVICES,
+    stats: Optional[Dict[str, int]] = None,
+    guard: Optional[Callable[[str], AsyncContextManager]] = None,
+) -> AsyncIterator[Tuple[str, int, Optional[dict], Optional[str]]]:
+    """
+    Yields (host, depth, result, error) in completion order, like snmp.poll_many;
+    seeds are depth 0. Neighbors are only followed out of devices shallower than
+    max_depth, and only into `scope` (CIDRs) when given. Seeds are always polled.
+    If `stats` is given, stats["truncated"] counts addresses left unvisited
+    because max_devices was reached (0 for a complete crawl). `guard(host)` is
+    held around each poll, as in snmp.poll_many.
+    """
+    nets = parse_scope(scope)
+    frontier: Deque[Tuple[str, int]] = deque()
+    visited: Set[str] = set()
+    dropped: Set[str] = set()
+    names: Set[str] = set()
+    if stats is not None:
+        stats["truncated"] = 0
+
+    def admit(ip: str, depth: int) -> None:
+        if ip in visited:
+            return
+        if len(visited) >= max_devices:
+            dropped.add(ip)
+            if stats is not None:
+                stats["truncated"] = len(dropped)
+            return
+        visited.add(ip)
+        frontier.append((ip, depth))
+
+    async def one(ip: str, depth: int):
+        try:
+            async with (guard(ip) if guard else contextlib.nullcontext()):
+                res = await asyncio.wait_for(poll_device_async(ip, community), timeout)
+        except asyncio.TimeoutError:
+            return ip, depth, None, f"timeout after {timeout:g}s"
+        except Exception as exc:
+            return ip, depth, None, str(exc) or type(exc).__name__
+        if not res["reachable"]:
+            return ip, depth, None, "no SNMP response"
+        return ip, depth, res, None
+
+    for seed in dict.fromkeys(s.strip() for s in seeds if s.strip()):
+        admit(seed, 0)
+
+    pending: Set[asyncio.Task] = set()
+    try:
+        while frontier or pending:
+            while frontier and len(pending) < concurrency:
+                pending.add(asyncio.create_task(one(*frontier.popleft())))
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                ip, depth, res, err = task.result()
+                if res is not None:
+                    name = (res["sysinfo"].get("sysName") or "").lower()
+                    if name:
+                        names.add(name)
+                    if depth < max_depth:
+                        for n in res["neighbors"]:
+                            addr = n.get("remote_mgmt_ip")
+                            if not addr or (n.get("remote_sysname") or "").lower() in names:
+                                continue
+                            if _in_scope(addr, nets):
+                                admit(addr, depth + 1)
+                yield ip, depth, res, err
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,186 @@
+# backend/app/services/discovery.py
+# Pure-Python host discovery: concurrent TCP-connect probes, no root needed.
+# Used as the "discover" scan profile and as a pre-stage that narrows big,
+# sparse ranges down to live hosts before nmap runs (with -Pn).
+
+from __future__ import annotations
+import asyncio
+import errno
+import os
+from ipaddress import ip_network
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+
+# -------------------------------
+# Tunables
+# -------------------------------
+
+# Ports that are open (or actively refused) on most infrastructure gear
+DISCOVERY_PORTS: List[int] = [
+    int(p) for p in os.getenv("DISCOVERY_PORTS", "22,23,53,80,443,445,3389,8080,8443").split(",") if p.strip()
+]
+# Hosts probed at the same time (each probes all of its ports in parallel)
+DISCOVERY_CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", "256"))
+DISCOVERY_TIMEOUT_SEC = float(os.getenv("DISCOVERY_TIMEOUT_SEC", "1.0"))
+# Connects in flight at once, across all hosts; keep well under the fd limit
+DISCOVERY_MAX_SOCKETS = int(os.getenv("DISCOVERY_MAX_SOCKETS", "512"))
+
+# Refuse to enumerate anything bigger than this (think IPv6 /64)
+MAX_EXPAND = 2 ** 20
+
+# Connect errors that mean "nothing answered there". Anything else (EMFILE,
+# ENOBUFS, EADDRNOTAVAIL, ...) is trouble on our side and is raised, so a
+# starved prober can't report live hosts as down.
+_DOWN_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN, errno.ETIMEDOUT, errno.ECONNRESET}
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+
+def split_targets(targets: List[str]) -> Tuple[Iterator[str], List[str]]:
+    """
+    Returns (addresses to probe, targets we can't enumerate).
+    The second list (hostnames, nmap ranges, huge IPv6 nets) is left for nmap.
+    """
+    nets = []
+    passthrough: List[str] = []
+    for t in targets:
+        try:
+            net = ip_network(t, strict=False)
+        except ValueError:
+            passthrough.append(t)
+            continue
+        if net.num_addresses > MAX_EXPAND:
+            passthrough.append(t)
+        else:
+            nets.append(net)
+
+    def addresses() -> Iterator[str]:
+        seen = set()
+        for net in nets:
+            hosts = net.hosts() if net.num_addresses > 2 else iter(net)
+            for addr in hosts:
+                if addr not in seen:
+                    seen.add(addr)
+                    yield str(addr)
+
+    return addresses(), passthrough
+
+
+async def _probe_port(ip: str, port: int, timeout: float, sockets: Optional[asyncio.Semaphore] = None) -> bool:
+    try:
+        if sockets is None:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        else:
+            async with sockets:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except ConnectionRefusedError:
+        return True  # RST: nothing listening, but the host is there
+    except asyncio.TimeoutError:
+        return False
+    except OSError as exc:
+        if exc.errno in _DOWN_ERRNOS:
+            return False
+        raise
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def probe_host(
+    ip: str,
+    ports: List[int],
+    timeout: float = DISCOVERY_TIMEOUT_SEC,
+    sockets: Optional[asyncio.Semaphore] = None,
+) -> bool:
+    """
+    True as soon as any port answers (accept or refuse); remaining probes are
+    cancelled. `sockets` caps connects in flight across callers sharing it.
+    """
+    tasks = [asyncio.create_task(_probe_port(ip, p, timeout, sockets)) for p in ports]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            if await fut:
+                return True
+        return False
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+# -------------------------------
+# Public API
+# -------------------------------
+
+async def iter_live_hosts(
+    targets: List[str],
+    ports: Optional[List[int]] = None,
+    concurrency: int = DISCOVERY_CONCURRENCY,
+    timeout: float = DISCOVERY_TIMEOUT_SEC,
+) -> AsyncIterator[str]:
+    """
+    Yield live IPs in completion order. At most `concurrency` hosts and
+    DISCOVERY_MAX_SOCKETS connects are in flight at once, so a /16 never
+    materialises 65k tasks or runs out of file descriptors.
+    Non-enumerable targets are skipped (see split_targets). A local socket
+    error (fd or buffer exhaustion) stops the sweep and is raised here.
+    """
+    ports = ports or DISCOVERY_PORTS
+    addresses, _ = split_targets(targets)
+    sem = asyncio.Semaphore(concurrency)
+    sockets = asyncio.Semaphore(DISCOVERY_MAX_SOCKETS)
+    found: asyncio.Queue = asyncio.Queue()
+    errors: List[BaseException] = []
+    done = object()
+
+    async def check(ip: str) -> None:
+        try:
+            if await probe_host(ip, ports, timeout, sockets):
+                found.put_nowait(ip)
+        except OSError as exc:
+            errors.append(exc)
+        finally:
+            sem.release()
+
+    async def feed() -> None:
+        tasks = set()
+        try:
+            for ip in addresses:
+                await sem.acquire()
+                if errors:
+                    break
+                task = asyncio.create_task(check(ip))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            found.put_nowait(done)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            ip = await found.get()
+            if ip is done:
+                break
+            yield ip
+        if errors:
+            raise errors[0]
+    finally:
+        feeder.cancel()
+
+
+async def discover_hosts(
+    targets: List[str],
+    ports: Optional[List[int]] = None,
+    concurrency: int = DISCOVERY_CONCURRENCY,
+    timeout: float = DISCOVERY_TIMEOUT_SEC,
+) -> List[str]:
+    """Collecting wrapper around iter_live_hosts."""
+    return [ip async for ip in iter_live_hosts(targets, ports, concurrency, timeout)]
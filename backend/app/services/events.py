@@ -0,0 +1,193 @@
+# backend/app/services/events.py
+# Cross-process event bus. Anything (API handlers, threads, RQ jobs, other
+# uvicorn workers) publishes plain dict events; every API process subscribes
+# and fans them out to its own WebSockets (see app/ws.py).
+#
+# EVENT_BUS=redis publishes on a Redis pub/sub channel and keeps the topology
+# version in a shared counter, so all workers agree on it. EVENT_BUS=local
+# (the default when REDIS_URL isn't set) delivers within this process only.
+# If Redis goes away, the Redis bus degrades to local delivery and the local
+# version counter until it's reachable again.
+#
+# Publishes made on the API event loop never touch the blocking client: they
+# are queued and sent, in order, over the bus's own asyncio connection.
+# Threads and RQ jobs publish through the shared (blocking) pool.
+
+from __future__ import annotations
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from redis import Redis
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from .queues import REDIS_URL, redis_registry
+
+
+EVENT_BUS = os.getenv("EVENT_BUS", "redis" if os.getenv("REDIS_URL") else "local")
+EVENT_CHANNEL = os.getenv("EVENT_CHANNEL", "homelab:events")
+TOPOLOGY_VERSION_KEY = "homelab:topology:version"
+TOPOLOGY_EPOCH_KEY = "homelab:topology:epoch"
+# After a Redis error, don't try it again (and stall the caller) for this long
+REDIS_RETRY_SEC = float(os.getenv("EVENT_BUS_RETRY_SEC", "10"))
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class LocalEventBus:
+    """Delivers events to this process's subscriber, from any thread."""
+
+    def __init__(self) -> None:
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.handler = handler
+
+    async def stop(self) -> None:
+        self.handler = None
+
+    def on_loop(self) -> bool:
+        """True when called from the API event loop's own thread."""
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def deliver(self, event: dict) -> None:
+        handler, loop = self.handler, self.loop
+        if handler is None or loop is None or loop.is_closed():
+            return  # no API loop in this process (scripts, RQ workers)
+        if self.on_loop():
+            loop.create_task(handler(event))
+        else:
+            asyncio.run_coroutine_threadsafe(handler(event), loop)
+
+    def publish(self, event: dict) -> None:
+        self.deliver(event)
+
+    def next_version(self) -> Optional[int]:
+        """Shared topology version, or None to keep counting in-process."""
+        return None
+
+    def shared_epoch(self) -> Optional[str]:
+        return None
+
+
+class RedisEventBus(LocalEventBus):
+    """Redis pub/sub; this process hears its own events through the subscription."""
+
+    def __init__(self, url: str) -> None:
+        super().__init__()
+        self.url = url   # the subscriber needs its own (asyncio) connection
+        self.down_until = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self.sender: Optional[asyncio.Task] = None
+        self.outbox: Optional[asyncio.Queue] = None
+
+    def _redis(self, op: Callable[[Redis], object]):
+        if time.monotonic() < self.down_until:
+            raise RedisError("redis marked down")
+        try:
+            return op(redis_registry.client)   # shared pool (services.queues)
+        except RedisError:
+            self.down_until = time.monotonic() + REDIS_RETRY_SEC
+            raise
+
+    async def start(self, handler: Handler) -> None:
+        await super().start(handler)
+        self.outbox = asyncio.Queue()
+        self.task = asyncio.create_task(self._listen())
+        self.sender = asyncio.create_task(self._send())
+
+    async def stop(self) -> None:
+        await super().stop()
+        for task in (self.task, self.sender):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.task = self.sender = self.outbox = None
+
+    async def _send(self) -> None:
+        # drains publishes made on the loop, one at a time so they stay in order
+        client = aioredis.from_url(self.url)
+        try:
+            while True:
+                event = await self.outbox.get()
+                if time.monotonic() >= self.down_until:
+                    try:
+                        await client.publish(EVENT_CHANNEL, json.dumps(event))
+                        continue
+                    except (RedisError, OSError):
+                        self.down_until = time.monotonic() + REDIS_RETRY_SEC
+                self.deliver(event)   # at least our own sockets hear about it
+        finally:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+    async def _listen(self) -> None:
+        while True:
+            client = aioredis.from_url(self.url)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(EVENT_CHANNEL)
+                async for msg in pubsub.listen():
+                    if msg.get("type") != "message" or self.handler is None:
+                        continue
+                    try:
+                        event = json.loads(msg["data"])
+                    except ValueError:
+                        continue
+                    try:
+                        await self.handler(event)
+                    except Exception:
+                        pass  # one bad event mustn't kill the subscription
+            except (RedisError, OSError):
+                await asyncio.sleep(REDIS_RETRY_SEC)   # Redis away; publishes go local meanwhile
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+    def publish(self, event: dict) -> None:
+        if self.outbox is not None and self.on_loop():
+            self.outbox.put_nowait(event)   # never block the loop on Redis
+            return
+        try:
+            self._redis(lambda r: r.publish(EVENT_CHANNEL, json.dumps(event)))
+        except RedisError:
+            self.deliver(event)   # at least our own sockets hear about it
+
+    def next_version(self) -> Optional[int]:
+        # blocking; writers call it from threadpool endpoints, to_thread or jobs
+        try:
+            return int(self._redis(lambda r: r.incr(TOPOLOGY_VERSION_KEY)))
+        except RedisError:
+            return None
+
+    def shared_epoch(self) -> Optional[str]:
+        try:
+            self._redis(lambda r: r.set(TOPOLOGY_EPOCH_KEY, os.urandom(4).hex(), nx=True))
+            value = self._redis(lambda r: r.get(TOPOLOGY_EPOCH_KEY))
+        except RedisError:
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+
+bus: LocalEventBus = RedisEventBus(REDIS_URL) if EVENT_BUS == "redis" else LocalEventBus()
+
+
+def publish_event(event: dict) -> None:
+    """Publish from anywhere (async code, threads, RQ jobs); never raises on bus trouble."""
+    bus.publish(event)
@@ -0,0 +1,453 @@
+# backend/app/services/inventory.py
+# Set-based persistence of discovery results (devices + their services, and
+# SNMP poll results). Callers hand over whole batches; everything here is a
+# handful of statements regardless of how many hosts a scan returned.
+
+from __future__ import annotations
+from datetime import datetime, timedelta
+from ipaddress import ip_address, ip_network
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models.device import Device
+from ..models.interface import Interface
+from ..models.neighbor import Neighbor
+from ..models.scan_result import ScanResult
+from ..models.service import Service
+from .topology import invalidate_topology
+
+
+# Keep well under Postgres' 65535 bind-parameter limit per statement
+UPSERT_CHUNK = 1000
+
+# fresh_cached_hosts looks addresses up with `mgmt_ip IN (...)` while the
+# targets span at most this many; beyond that one query over the profile's
+# fresh rows is cheaper than that many IN chunks
+CACHE_LOOKUP_MAX = 16 * UPSERT_CHUNK
+
+# Only ports nmap positively reports as open become Service rows
+OPEN_STATES = {"open"}
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+
+def _dialect_insert(db: Session):
+    """INSERT construct with ON CONFLICT support for the bound dialect."""
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        return postgresql.insert
+    if name == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Bulk upsert not supported on dialect {name!r}")
+
+
+def _service_key(port, proto) -> Tuple[int, str]:
+    return int(port), (proto or "tcp").lower()
+
+
+# -------------------------------
+# Devices
+# -------------------------------
+
+def upsert_scan_hosts(db: Session, hosts: Dict[str, dict], seen_at: datetime) -> Dict[str, int]:
+    """
+    Upsert scanned hosts into devices with INSERT ... ON CONFLICT (mgmt_ip) DO UPDATE.
+      - last_seen is always bumped
+      - hostname/os keep an existing value (SNMP sysName/sysDescr win over rDNS/OS guesses)
+      - mac/vendor take the fresh value when nmap reported one
+    Returns {ip: device_id}. Does not commit.
+    """
+    if not hosts:
+        return {}
+
+    ins = _dialect_insert(db)
+    ids: Dict[str, int] = {}
+    items = list(hosts.items())
+    for start in range(0, len(items), UPSERT_CHUNK):
+        rows = [
+            {
+                "mgmt_ip": ip,
+                "hostname": h.get("hostname"),
+                "mac": h.get("mac"),
+                "vendor": h.get("vendor"),
+                "os": h.get("os"),
+                "first_seen": seen_at,
+                "last_seen": seen_at,
+            }
+            for ip, h in items[start:start + UPSERT_CHUNK]
+        ]
+        stmt = ins(Device).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Device.mgmt_ip],
+            set_={
+                "last_seen": stmt.excluded.last_seen,
+                "hostname": func.coalesce(Device.hostname, stmt.excluded.hostname),
+                "os": func.coalesce(Device.os, stmt.excluded.os),
+                "mac": func.coalesce(stmt.excluded.mac, Device.mac),
+                "vendor": func.coalesce(stmt.excluded.vendor, Device.vendor),
+            },
+        ).returning(Device.id, Device.mgmt_ip)
+        for dev_id, ip in db.execute(stmt):
+            ids[ip] = dev_id
+    return ids
+
+
+def changes_topology(db: Session, hosts: Dict[str, dict]) -> bool:
+    """
+    Would upsert_scan_hosts(hosts) add a device or change what the topology
+    graph shows for one (label from hostname, vendor)? Mirrors the upsert's
+    coalesce rules; a scan that only bumps last_seen returns False.
+    """
+    if not hosts:
+        return False
+    ips = list(hosts)
+    existing: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    for start in range(0, len(ips), UPSERT_CHUNK):
+        rows = db.execute(
+            select(Device.mgmt_ip, Device.hostname, Device.vendor)
+            .where(Device.mgmt_ip.in_(ips[start:start + UPSERT_CHUNK]))
+        )
+        for ip, hostname, vendor in rows:
+            existing[ip] = (hostname, vendor)
+    for ip, h in hosts.items():
+        if ip not in existing:
+            return True
+        hostname, vendor = existing[ip]
+        if hostname is None and h.get("hostname"):
+            return True
+        if h.get("vendor") and h.get("vendor") != vendor:
+            return True
+    return False
+
+
+# -------------------------------
+# Services
+# -------------------------------
+
+def sync_services(db: Session, device_ids: Dict[str, int], hosts: Dict[str, dict]) -> Dict[str, int]:
+    """
+    Diff the open ports of each scanned host against its stored Service rows,
+    keyed by (port, proto), and apply inserts/updates/deletes in bulk.
+    Returns counts {"inserted", "updated", "deleted"}. Does not commit.
+    """
+    # Desired state per device
+    # (hosts without a "services" key, e.g. from discovery, leave services alone)
+    wanted: Dict[int, Dict[Tuple[int, str], dict]] = {}
+    for ip, dev_id in device_ids.items():
+        host = hosts.get(ip) or {}
+        if "services" not in host:
+            continue
+        per_dev = wanted.setdefault(dev_id, {})
+        for svc in host["services"] or []:
+            if (svc.get("state") or "").lower() not in OPEN_STATES:
+                continue
+            key = _service_key(svc.get("port"), svc.get("proto"))
+            per_dev[key] = {
+                "name": svc.get("name") or None,
+                "product": svc.get("product") or None,
+                "version": svc.get("version") or None,
+            }
+
+    if not wanted:
+        return {"inserted": 0, "updated": 0, "deleted": 0}
+
+    # Current state, one query for the whole batch
+    current: Dict[int, Dict[Tuple[int, str], tuple]] = {}
+    dev_list = list(wanted.keys())
+    for start in range(0, len(dev_list), UPSERT_CHUNK):
+        chunk = dev_list[start:start + UPSERT_CHUNK]
+        q = select(
+            Service.id, Service.device_id, Service.port, Service.proto,
+            Service.name, Service.product, Service.version,
+        ).where(Service.device_id.in_(chunk))
+        for sid, dev_id, port, proto, name, product, version in db.execute(q):
+            current.setdefault(dev_id, {})[_service_key(port, proto)] = (sid, name, product, version)
+
+    inserts: List[dict] = []
+    updates: List[dict] = []
+    deletes: List[int] = []
+    for dev_id, want in wanted.items():
+        have = current.get(dev_id, {})
+        for key, fields in want.items():
+            existing = have.get(key)
+            if existing is None:
+                inserts.append({"device_id": dev_id, "port": key[0], "proto": key[1], **fields})
+            elif existing[1:] != (fields["name"], fields["product"], fields["version"]):
+                updates.append({"id": existing[0], **fields})
+        deletes.extend(row[0] for key, row in have.items() if key not in want)
+
+    if inserts:
+        db.execute(insert(Service), inserts)
+    if updates:
+        db.execute(update(Service), updates)
+    for start in range(0, len(deletes), UPSERT_CHUNK):
+        db.execute(delete(Service).where(Service.id.in_(deletes[start:start + UPSERT_CHUNK])))
+
+    return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes)}
+
+
+# -------------------------------
+# Scan result cache (incremental rescans)
+# -------------------------------
+
+def store_scan_cache(db: Session, hosts: Dict[str, dict], profile: str, scanned_at: datetime) -> None:
+    """Upsert the latest result per (ip, profile). Does not commit."""
+    if not hosts:
+        return
+    ins = _dialect_insert(db)
+    items = list(hosts.items())
+    for start in range(0, len(items), UPSERT_CHUNK):
+        rows = [
+            {"mgmt_ip": ip, "profile": profile, "scanned_at": scanned_at,
+             "result": {k: v for k, v in h.items() if k != "ip"}}
+            for ip, h in items[start:start + UPSERT_CHUNK]
+        ]
+        stmt = ins(ScanResult).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ScanResult.mgmt_ip, ScanResult.profile],
+            set_={"scanned_at": stmt.excluded.scanned_at, "result": stmt.excluded.result},
+        )
+        db.execute(stmt)
+
+
+def fresh_cached_hosts(
+    db: Session,
+    targets: List[str],
+    profile: str,
+    ttl_seconds: int,
+    now: datetime,
+) -> Dict[str, dict]:
+    """
+    Cached results inside `targets` that are still fresh for `profile`:
+    scanned with that profile within the TTL *and* the device itself was seen
+    (by a scan or SNMP) within the TTL. Hosts not matching both are stale.
+    Targets spanning up to CACHE_LOOKUP_MAX addresses are matched in SQL;
+    wider ones are matched here against the profile's fresh rows.
+    """
+    nets = []
+    for t in targets:
+        try:
+            nets.append(ip_network(t, strict=False))
+        except ValueError:
+            continue  # hostnames/ranges can't be matched against the cache
+    if not nets:
+        return {}
+
+    cutoff = now - timedelta(seconds=ttl_seconds)
+    q = (
+        select(ScanResult.mgmt_ip, ScanResult.result)
+        .join(Device, Device.mgmt_ip == ScanResult.mgmt_ip)
+        .where(
+            ScanResult.profile == profile,
+            ScanResult.scanned_at >= cutoff,
+            Device.last_seen >= cutoff,
+        )
+    )
+    out: Dict[str, dict] = {}
+    if sum(n.num_addresses for n in nets) <= CACHE_LOOKUP_MAX:
+        ips = list(dict.fromkeys(str(addr) for n in nets for addr in n))
+        for start in range(0, len(ips), UPSERT_CHUNK):
+            chunk = ips[start:start + UPSERT_CHUNK]
+            for ip, result in db.execute(q.where(ScanResult.mgmt_ip.in_(chunk))):
+                out[ip] = result or {}
+        return out
+
+    for ip, result in db.execute(q):
+        try:
+            addr = ip_address(ip)
+        except ValueError:
+            continue
+        if any(addr.version == n.version and addr in n for n in nets):
+            out[ip] = result or {}
+    return out
+
+
+def persist_scan_results(
+    db: Session,
+    hosts: Dict[str, dict],
+    seen_at: datetime,
+    profile: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Devices upsert + services sync for one batch of scan results, plus the
+    per-profile cache entry when `profile` is given. Commits. The topology is
+    only invalidated when a device was added or its label/vendor changed.
+    """
+    graph_changed = changes_topology(db, hosts)
+    device_ids = upsert_scan_hosts(db, hosts, seen_at)
+    sync_services(db, device_ids, hosts)
+    if profile:
+        store_scan_cache(db, hosts, profile, seen_at)
+    db.commit()
+    if graph_changed:
+        invalidate_topology()
+    return device_ids
+
+
+# -------------------------------
+# SNMP poll results
+# -------------------------------
+
+def _infer_vendor_from_descr(descr: str) -> Optional[str]:
+    d = (descr or "").lower()
+    if "juniper" in d:
+        return "Juniper"
+    if "cisco" in d:
+        return "Cisco"
+    if "pfsense" in d:
+        return "pfSense"
+    if "ubiquiti" in d or "unifi" in d:
+        return "Ubiquiti"
+    return None
+
+
+def _sync_rows(db: Session, current: list, wanted: Dict[str, dict], key_attr: str, make) -> bool:
+    """
+    Generic keyed diff: update rows whose fields differ, insert missing keys,
+    delete rows whose key is gone (or that predate keying, key None).
+    Only dirty attributes are written. Returns True if anything changed.
+    """
+    changed = False
+    seen = set()
+    for row in current:
+        key = getattr(row, key_attr)
+        fields = wanted.get(key) if key is not None else None
+        if fields is None or key in seen:
+            db.delete(row)
+            changed = True
+            continue
+        seen.add(key)
+        for attr, value in fields.items():
+            if getattr(row, attr) != value:
+                setattr(row, attr, value)
+                changed = True
+    for key, fields in wanted.items():
+        if key not in seen:
+            db.add(make(key, fields))
+            changed = True
+    return changed
+
+
+def apply_snmp_poll(
+    db: Session,
+    dev: Device,
+    result: dict,
+    seen_at: datetime,
+    current_ifs: Optional[List[Interface]] = None,
+    current_nbrs: Optional[List[Neighbor]] = None,
+) -> Dict[str, int]:
+    """
+    Write one poll_device_async() result onto an existing Device: sysName/sysDescr
+    enrichment, then interfaces (keyed by ifIndex) and LLDP neighbors (keyed by
+    instance) diffed against the stored rows. Steady-state polls only touch
+    last_seen. Tables listed in result["failed"] keep their stored rows.
+    Pass current_ifs/current_nbrs when already loaded for a batch.
+    Returns {"interfaces", "neighbors", "changed", "failed"}. Does not commit.
+    """
+    sysinfo = result.get("sysinfo") or {}
+    failed = result.get("failed") or {}
+    sys_name = sysinfo.get("sysName")
+    sys_descr = sysinfo.get("sysDescr") or ""
+    changed = False
+
+    # Basic enrichment
+    enrich = {}
+    if sys_name:
+        enrich["hostname"] = sys_name
+    if sys_descr:
+        inferred = _infer_vendor_from_descr(sys_descr)
+        if inferred:
+            enrich["vendor"] = inferred
+        enrich["os"] = sys_descr[:255]
+    for attr, value in enrich.items():
+        if getattr(dev, attr) != value:
+            setattr(dev, attr, value)
+            changed = True
+
+    dev.last_seen = seen_at
+
+    # Interfaces, keyed by ifIndex. A table whose walk errored arrives as []
+    # and is left alone; diffing it would delete every stored row.
+    if_rows = result.get("interfaces") or []
+    if "interfaces" not in failed:
+        if current_ifs is None:
+            current_ifs = db.query(Interface).filter(Interface.device_id == dev.id).all()
+        wanted_ifs = {
+            str(row.get("index")): {
+                "name": row.get("name"),
+                "admin_up": bool(row.get("admin_up")),
+                "oper_up": bool(row.get("oper_up")),
+                "speed": row.get("speed"),
+            }
+            for row in if_rows if row.get("index") is not None
+        }
+        changed |= _sync_rows(
+            db, current_ifs, wanted_ifs, "if_index",
+            lambda key, f: Interface(device_id=dev.id, if_index=key, **f),
+        )
+
+    # LLDP neighbors, keyed by instance
+    nbrs = result.get("neighbors") or []
+    if "neighbors" not in failed:
+        if current_nbrs is None:
+            current_nbrs = db.query(Neighbor).filter(Neighbor.local_device_id == dev.id).all()
+        wanted_nbrs = {
+            n["instance"]: {
+                "local_if": n.get("local_if"),
+                "remote_sysname": n.get("remote_sysname"),
+                "remote_port": n.get("remote_port"),
+                "remote_mgmt_ip": n.get("remote_mgmt_ip"),
+                "remote_chassis_id": n.get("remote_chassis_id"),
+            }
+            for n in nbrs if n.get("instance")
+        }
+        changed |= _sync_rows(
+            db, current_nbrs, wanted_nbrs, "instance",
+            lambda key, f: Neighbor(local_device_id=dev.id, instance=key, **f),
+        )
+
+    return {"interfaces": len(if_rows), "neighbors": len(nbrs), "changed": changed, "failed": sorted(failed)}
+
+
+def persist_snmp_results(db: Session, results: Dict[str, dict], seen_at: datetime) -> Dict[str, dict]:
+    """
+    Persist a batch of {host: poll result} in one transaction: one SELECT each for
+    the batch's devices, interfaces and neighbors, one flush for new devices,
+    then only the rows that actually differ.
+    Returns {host: {"device", "hostname", "interfaces", "neighbors", "changed"}}.
+    "hostname" is read before the commit, so callers needn't refresh the
+    expired Device to report it. Commits.
+    """
+    if not results:
+        return {}
+    hosts = list(results.keys())
+    devices = {d.mgmt_ip: d for d in db.query(Device).filter(Device.mgmt_ip.in_(hosts)).all()}
+    missing = [h for h in hosts if h not in devices]
+    for h in missing:
+        devices[h] = Device(mgmt_ip=h)
+        db.add(devices[h])
+    if missing:
+        db.flush()
+
+    dev_ids = [d.id for d in devices.values()]
+    ifs_by_dev: Dict[int, List[Interface]] = {i: [] for i in dev_ids}
+    for row in db.query(Interface).filter(Interface.device_id.in_(dev_ids)).all():
+        ifs_by_dev[row.device_id].append(row)
+    nbrs_by_dev: Dict[int, List[Neighbor]] = {i: [] for i in dev_ids}
+    for row in db.query(Neighbor).filter(Neighbor.local_device_id.in_(dev_ids)).all():
+        nbrs_by_dev[row.local_device_id].append(row)
+
+    out: Dict[str, dict] = {}
+    for h, res in results.items():
+        dev = devices[h]
+        summary = apply_snmp_poll(db, dev, res, seen_at, ifs_by_dev[dev.id], nbrs_by_dev[dev.id])
+        out[h] = {"device": dev, "hostname": dev.hostname, **summary}
+    db.commit()
+    if missing or any(o["changed"] for o in out.values()):
+        invalidate_topology()
+    return out
@@ -0,0 +1,236 @@
+# backend/app/services/jobcontrol.py
+# Keeps the job queue from doing the same work twice or piling onto one device.
+#
+# Dedupe: every job gets a key from its kind and normalized payload (targets
+# sorted, CIDRs canonical). The key maps to the job currently doing that work;
+# enqueueing again while that job is queued or running hands back its id, so
+# callers share one execution and its result. Claims run as one Lua script
+# that also reads the RQ job's status, so concurrent requests can't both win.
+#
+# Limits: sessions against one device (and one /JOB_SUBNET_PREFIX subnet) are
+# counted in Redis sorted sets of lease tokens, shared by every worker. A slot
+# is taken for all of a host's keys at once or not at all, and leases expire,
+# so a worker that dies mid-job can't leak slots for longer than the lease.
+# API requests and the background pollers take the same slots; while Redis
+# is unreachable the limits are not enforced rather than failing every session.
+
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from ipaddress import ip_address, ip_network
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from redis.exceptions import RedisError
+
+from .queues import get_redis
+
+
+JOB_DEDUPE_TTL_SEC = int(os.getenv("JOB_DEDUPE_TTL_SEC", "7200"))
+JOB_DEVICE_CONCURRENCY = int(os.getenv("JOB_DEVICE_CONCURRENCY", "2"))
+JOB_SUBNET_CONCURRENCY = int(os.getenv("JOB_SUBNET_CONCURRENCY", "8"))
+JOB_SUBNET_PREFIX = int(os.getenv("JOB_SUBNET_PREFIX", "24"))
+# How long a job waits for a device slot before giving up on that device
+JOB_SLOT_WAIT_SEC = float(os.getenv("JOB_SLOT_WAIT_SEC", "300"))
+# ... and an API request, which someone is waiting on
+JOB_SLOT_API_WAIT_SEC = float(os.getenv("JOB_SLOT_API_WAIT_SEC", "10"))
+# Slots are leases: a holder that never releases frees it after this long
+JOB_SLOT_LEASE_SEC = int(os.getenv("JOB_SLOT_LEASE_SEC", "3600"))
+# Waiters re-check at most this far apart (backing off from 50 ms, jittered)
+JOB_SLOT_POLL_MAX_SEC = 0.5
+# After a Redis error, sessions go ahead unlimited for this long before retrying it
+JOB_SLOT_REDIS_RETRY_SEC = float(os.getenv("JOB_SLOT_REDIS_RETRY_SEC", "10"))
+
+# payload keys naming what a job touches; normalized so spelling doesn't matter
+_TARGET_KEYS = ("targets", "hosts", "host", "device_id", "device_ids")
+
+
+# ---------------------------
+# Dedupe
+# ---------------------------
+
+def _norm_target(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip().lower()
+        try:
+            return str(ip_network(value, strict=False))
+        except ValueError:
+            return value
+    return value
+
+
+def dedupe_key(kind: str, payload: Dict[str, Any]) -> str:
+    """Same kind + same (normalized) payload -> same key."""
+    canonical = dict(payload)
+    for key in _TARGET_KEYS:
+        value = canonical.get(key)
+        if isinstance(value, str) and key == "targets":
+            value = value.replace(",", " ").split()
+        if isinstance(value, list):
+            canonical[key] = sorted({_norm_target(v) for v in value}, key=str)
+        elif value is not None:
+            canonical[key] = _norm_target(value)
+    digest = hashlib.sha1(json.dumps(canonical, sort_keys=True, default=str).encode()).hexdigest()[:20]
+    return f"homelab:job:{kind}:{digest}"
+
+
+# KEYS[1]: dedupe key; ARGV: new job id, ttl, grace. Returns the owning job id.
+# The holder keeps the work while its RQ job (hash rq:job:<id>) is queued,
+# started, deferred or scheduled, or, before that hash exists, for `grace`
+# seconds after the claim (the claimer is still enqueueing).
+_CLAIM = """
+local cur = redis.call('GET', KEYS[1])
+if cur then
+  local status = redis.call('HGET', 'rq:job:' .. cur, 'status')
+  if status == 'queued' or status == 'started' or status == 'deferred' or status == 'scheduled' then
+    return cur
+  end
+  if not status and redis.call('TTL', KEYS[1]) > tonumber(ARGV[2]) - tonumber(ARGV[3]) then
+    return cur
+  end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return ARGV[1]
+"""
+# Longest gap expected between a claim and its job being written
+_CLAIM_GRACE_SEC = 30
+
+
+def claim_jobs(claims: Sequence[Tuple[str, str]]) -> List[str]:
+    """
+    claims: (dedupe_key, new_job_id) pairs. Returns, per claim, the job that
+    owns the work: new_job_id if the caller should enqueue it, otherwise the
+    id of the in-flight job to share. One round trip for any batch size; the
+    same key twice in a batch resolves to the first claim.
+    """
+    if not claims:
+        return []
+    r = get_redis()
+    script = r.register_script(_CLAIM)
+    with r.pipeline(transaction=False) as pipe:
+        for key, new_id in claims:
+            script(keys=[key], args=[new_id, JOB_DEDUPE_TTL_SEC, _CLAIM_GRACE_SEC], client=pipe)
+        owners = pipe.execute()
+    return [o.decode() if isinstance(o, bytes) else o for o in owners]
+
+
+# ---------------------------
+# Per-device / per-subnet session limits
+# ---------------------------
+
+# KEYS: slot sets; ARGV: now, lease expiry, token, limit per key...
+_ACQUIRE = """
+local now = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+  redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+  if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+    return 0
+  end
+end
+for i, key in ipairs(KEYS) do
+  redis.call('ZADD', key, ARGV[2], ARGV[3])
+  redis.call('EXPIRE', key, math.ceil(ARGV[2] - now) + 60)
+end
+return 1
+"""
+
+
+class DeviceBusy(RuntimeError):
+    pass
+
+
+class SessionLimiter:
+    def __init__(
+        self,
+        device_limit: int = JOB_DEVICE_CONCURRENCY,
+        subnet_limit: int = JOB_SUBNET_CONCURRENCY,
+        subnet_prefix: int = JOB_SUBNET_PREFIX,
+    ) -> None:
+        self.device_limit = device_limit
+        self.subnet_limit = subnet_limit
+        self.subnet_prefix = subnet_prefix
+        self.down_until = 0.0
+
+    def _slots(self, host: str) -> List[Tuple[str, int]]:
+        host = host.strip().lower()
+        try:
+            addr = ip_address(host)
+        except ValueError:
+            return [(f"homelab:slots:device:{host}", self.device_limit)]   # hostname: no subnet
+        slots = [(f"homelab:slots:device:{addr}", self.device_limit)]
+        prefix = self.subnet_prefix if addr.version == 4 else 64
+        subnet = ip_network(f"{addr}/{prefix}", strict=False)
+        slots.append((f"homelab:slots:subnet:{subnet}", self.subnet_limit))
+        return slots
+
+    def try_acquire(self, host: str, token: str) -> bool:
+        slots = self._slots(host)
+        r = get_redis()
+        now = time.time()
+        script = r.register_script(_ACQUIRE)
+        keys = [k for k, _ in slots]
+        args = [now, now + JOB_SLOT_LEASE_SEC, token, *[limit for _, limit in slots]]
+        return bool(script(keys=keys, args=args))
+
+    def release(self, host: str, token: str) -> None:
+        r = get_redis()
+        with r.pipeline(transaction=False) as pipe:
+            for key, _ in self._slots(host):
+                pipe.zrem(key, token)
+            pipe.execute()
+
+    def _acquire(self, host: str, token: str) -> bool:
+        if time.monotonic() < self.down_until:
+            return True
+        try:
+            return self.try_acquire(host, token)
+        except RedisError:
+            self.down_until = time.monotonic() + JOB_SLOT_REDIS_RETRY_SEC
+            return True
+
+    def _release(self, host: str, token: str) -> None:
+        if time.monotonic() < self.down_until:
+            return  # the lease runs out on its own
+        try:
+            self.release(host, token)
+        except RedisError:
+            self.down_until = time.monotonic() + JOB_SLOT_REDIS_RETRY_SEC
+
+    def _deadline(self, wait: Optional[float]) -> float:
+        return time.monotonic() + (JOB_SLOT_WAIT_SEC if wait is None else wait)
+
+    @contextmanager
+    def slot(self, host: str, wait: Optional[float] = None):
+        """Hold one session slot on `host` (and its subnet); raises DeviceBusy after `wait`."""
+        token, deadline, delay = uuid.uuid4().hex, self._deadline(wait), 0.05
+        while not self._acquire(host, token):
+            if time.monotonic() >= deadline:
+                raise DeviceBusy(f"{host}: no free session slot after {JOB_SLOT_WAIT_SEC if wait is None else wait:g}s")
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, JOB_SLOT_POLL_MAX_SEC)
+        try:
+            yield
+        finally:
+            self._release(host, token)
+
+    @asynccontextmanager
+    async def aslot(self, host: str, wait: Optional[float] = None):
+        """asyncio flavour of slot(); Redis calls run in a thread."""
+        token, deadline, delay = uuid.uuid4().hex, self._deadline(wait), 0.05
+        while not await asyncio.to_thread(self._acquire, host, token):
+            if time.monotonic() >= deadline:
+                raise DeviceBusy(f"{host}: no free session slot after {JOB_SLOT_WAIT_SEC if wait is None else wait:g}s")
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, JOB_SLOT_POLL_MAX_SEC)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self._release, host, token)
+
+
+limiter = SessionLimiter()
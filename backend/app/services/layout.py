@@ -0,0 +1,308 @@
+# backend/app/services/layout.py
+# Server-side force-directed layout (Fruchterman-Reingold), vectorised with NumPy.
+#
+# Edge attraction is a handful of bincounts per iteration. Node-node repulsion
+# would be O(N^2), so it is computed on a grid instead: node mass is spread
+# onto the grid bilinearly, convolved with the repulsion kernel via FFT, and the
+# resulting force field is read back at each node the same way. One iteration
+# is O(N + G^2 log G), which keeps thousands of nodes well under a second.
+#
+# Pinned positions (placed by hand in the UI) never move. When only a few
+# devices are new, they are dropped next to their placed neighbors and only
+# they are relaxed, so the rest of the map stays where people last saw it.
+# Results are written to topology_layouts (pinned=False) and cached per
+# topology version; a new version is laid out in the background while the
+# previous positions keep being served.
+
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..db import SessionLocal
+from ..models.topology_layout import TopologyLayout
+from .topology import cache as topology_cache
+
+
+# -------------------------------
+# Tunables
+# -------------------------------
+
+LAYOUT_EDGE_LENGTH = float(os.getenv("LAYOUT_EDGE_LENGTH", "120"))    # canvas px
+LAYOUT_ITERATIONS = int(os.getenv("LAYOUT_ITERATIONS", "150"))
+LAYOUT_INCREMENTAL_ITERATIONS = int(os.getenv("LAYOUT_INCREMENTAL_ITERATIONS", "40"))
+# Above this share of unplaced nodes, lay everything (unpinned) out again
+LAYOUT_INCREMENTAL_MAX_FRACTION = float(os.getenv("LAYOUT_INCREMENTAL_MAX_FRACTION", "0.2"))
+# Repulsion grid: cells of this many edge lengths, at most LAYOUT_MAX_GRID a side
+LAYOUT_GRID_CELL = float(os.getenv("LAYOUT_GRID_CELL", "1.0"))
+LAYOUT_MAX_GRID = int(os.getenv("LAYOUT_MAX_GRID", "128"))
+# Full layouts of more than this many nodes run proportionally fewer iterations
+# (by sqrt), but never fewer than LAYOUT_MIN_ITERATIONS
+LAYOUT_ITERATIONS_NODES = int(os.getenv("LAYOUT_ITERATIONS_NODES", "1000"))
+LAYOUT_MIN_ITERATIONS = int(os.getenv("LAYOUT_MIN_ITERATIONS", "50"))
+LAYOUT_GRAVITY = 0.02   # pull toward the centroid so components don't drift apart
+LAYOUT_MOVE_EPSILON = 0.5   # canvas px; stored rows that moved less are not rewritten
+
+
+# -------------------------------
+# Force computation
+# -------------------------------
+
+_kernels: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _unit_kernels(size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """rfft2 of ox/r^2 and oy/r^2 on a (2*size)^2 wrap-around offset grid."""
+    if size not in _kernels:
+        off = np.arange(2 * size, dtype=np.float64)
+        off[size:] -= 2 * size
+        ox, oy = np.meshgrid(off, off, indexing="ij")
+        r2 = ox * ox + oy * oy
+        r2[0, 0] = 1.0
+        kx, ky = ox / r2, oy / r2
+        kx[0, 0] = ky[0, 0] = 0.0
+        _kernels[size] = (np.fft.rfft2(kx), np.fft.rfft2(ky))
+    return _kernels[size]
+
+
+def _repulsion(pos: np.ndarray, length: float) -> np.ndarray:
+    """Approximate sum over j of (p_i - p_j) * L^2 / |p_i - p_j|^2 for every node."""
+    lo = pos.min(axis=0) - length
+    span = float((pos.max(axis=0) + length - lo).max())
+    # cells of about LAYOUT_GRID_CELL edge lengths, within the grid cap; sizes are
+    # rounded to multiples of 8 so the kernel FFTs get reused between iterations
+    size = int(min(LAYOUT_MAX_GRID, max(16, 8 * int(np.ceil(span / (LAYOUT_GRID_CELL * length) / 8)))))
+    h = span / (size - 1)
+
+    g = (pos - lo) / h
+    i0 = np.clip(np.floor(g).astype(np.int64), 0, size - 2)
+    f = g - i0
+    w = [(1 - f[:, 0]) * (1 - f[:, 1]), f[:, 0] * (1 - f[:, 1]), (1 - f[:, 0]) * f[:, 1], f[:, 0] * f[:, 1]]
+    cells = [i0[:, 0] * size + i0[:, 1], (i0[:, 0] + 1) * size + i0[:, 1],
+             i0[:, 0] * size + i0[:, 1] + 1, (i0[:, 0] + 1) * size + i0[:, 1] + 1]
+
+    mass = np.zeros(size * size)
+    for c, wc in zip(cells, w):
+        mass += np.bincount(c, weights=wc, minlength=size * size)
+    padded = np.zeros((2 * size, 2 * size))
+    padded[:size, :size] = mass.reshape(size, size)
+    spectrum = np.fft.rfft2(padded)
+    kx, ky = _unit_kernels(size)
+    scale = length * length / h
+    fx = np.fft.irfft2(spectrum * kx, s=padded.shape)[:size, :size].ravel() * scale
+    fy = np.fft.irfft2(spectrum * ky, s=padded.shape)[:size, :size].ravel() * scale
+
+    out = np.zeros_like(pos)
+    for c, wc in zip(cells, w):
+        out[:, 0] += fx[c] * wc
+        out[:, 1] += fy[c] * wc
+    return out
+
+
+def force_layout(
+    pos: np.ndarray,
+    edges: np.ndarray,
+    movable: np.ndarray,
+    iterations: int,
+    temperature: float,
+    length: float = LAYOUT_EDGE_LENGTH,
+) -> np.ndarray:
+    """
+    Relax `pos` (N x 2) in place for `iterations` steps; only rows where
+    `movable` is True move, by at most the current temperature per step
+    (cooling linearly to ~0). edges: E x 2 int array of node rows.
+    """
+    n = len(pos)
+    if n < 2 or not movable.any():
+        return pos
+    src, dst = (edges[:, 0], edges[:, 1]) if len(edges) else (np.empty(0, int), np.empty(0, int))
+    for step in range(iterations):
+        disp = _repulsion(pos, length)
+        if len(src):
+            d = pos[src] - pos[dst]
+            pull = d * (np.hypot(d[:, 0], d[:, 1]) / length)[:, None]
+            for k in (0, 1):
+                disp[:, k] -= np.bincount(src, weights=pull[:, k], minlength=n)
+                disp[:, k] += np.bincount(dst, weights=pull[:, k], minlength=n)
+        disp += (pos.mean(axis=0) - pos) * LAYOUT_GRAVITY * length
+        t = temperature * (1 - step / iterations) + 1e-3
+        norm = np.maximum(np.hypot(disp[:, 0], disp[:, 1]), 1e-9)
+        disp *= (np.minimum(norm, t) / norm)[:, None]
+        pos[movable] += disp[movable]
+    return pos
+
+
+def full_layout_schedule(n: int, length: float = LAYOUT_EDGE_LENGTH) -> Tuple[int, float]:
+    """(iterations, starting temperature) for laying out n nodes from scratch."""
+    scale = min(1.0, np.sqrt(LAYOUT_ITERATIONS_NODES / max(n, 1)))
+    iterations = max(min(LAYOUT_MIN_ITERATIONS, LAYOUT_ITERATIONS), int(LAYOUT_ITERATIONS * scale))
+    return iterations, length * np.sqrt(max(n, 1)) / 10
+
+
+# -------------------------------
+# Layout of the current topology
+# -------------------------------
+
+def _place_new(pos: np.ndarray, placed: np.ndarray, adjacency: List[List[int]], length: float) -> None:
+    """Put unplaced nodes at the mean of their placed neighbors (plus jitter), else on the rim."""
+    rng = np.random.default_rng(0)
+    center = pos[placed].mean(axis=0) if placed.any() else np.zeros(2)
+    radius = float(np.hypot(*(pos[placed] - center).T).max()) if placed.any() else 0.0
+    pending = [i for i in range(len(pos)) if not placed[i]]
+    # new nodes chained off other new nodes get placed once their neighbor is
+    for _ in range(3):
+        left = []
+        for i in pending:
+            anchors = [j for j in adjacency[i] if placed[j]]
+            if anchors:
+                pos[i] = pos[anchors].mean(axis=0) + rng.normal(0, length / 2, 2)
+                placed[i] = True
+            else:
+                left.append(i)
+        pending = left
+    for i in pending:
+        angle = rng.uniform(0, 2 * np.pi)
+        pos[i] = center + (radius + length) * np.array([np.cos(angle), np.sin(angle)])
+        placed[i] = True
+
+
+class LayoutCache:
+    """
+    Positions for the current topology version, recomputed in a background
+    thread (own session) when the version moves on. Until that run lands,
+    readers get the previous result; its "version" says which topology it
+    belongs to. Only the very first request, with nothing to serve yet,
+    computes inline.
+    """
+
+    def __init__(self) -> None:
+        self.version: Optional[int] = None
+        self.result: Optional[dict] = None
+        self.errors = 0
+        self._lock = threading.Lock()          # guards the flags below
+        self._compute_lock = threading.Lock()  # one layout run at a time
+        self._running = False
+        self._full = False
+
+    def invalidate(self) -> None:
+        self.version = None
+
+    def fresh(self) -> bool:
+        return self.result is not None and self.version == topology_cache.version
+
+    def get(self, db: Session, full: bool = False) -> dict:
+        if self.result is None:
+            with self._compute_lock:
+                if self.result is None:
+                    return self._compute(db, full)
+        if full or not self.fresh():
+            self.refresh(full)
+        return self.result
+
+    def refresh(self, full: bool = False) -> None:
+        """Schedule a background run (coalesced with one already under way)."""
+        with self._lock:
+            self._full = self._full or full
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._run, name="layout", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                full, self._full = self._full, False
+            failed = False
+            db = SessionLocal()
+            try:
+                with self._compute_lock:
+                    self._compute(db, full)
+            except Exception:
+                self.errors += 1   # DB hiccup; the next change or request retries
+                failed = True
+            finally:
+                db.close()
+            with self._lock:
+                # the topology may have moved on again while we were busy
+                if failed or (not self._full and self.fresh()):
+                    self._running = False
+                    return
+
+    def _compute(self, db: Session, full: bool) -> dict:
+        snap = topology_cache.get(db)
+        self.result = {"version": snap.version, **compute_layout(db, snap.graph, full)}
+        self.version = snap.version
+        return self.result
+
+
+def compute_layout(db: Session, graph, full: bool = False) -> dict:
+    """
+    Lay out `graph` (networkx, device ids as nodes) around the stored positions
+    and persist what moved. Returns {"points", "pinned", "mode", "moved"}.
+    """
+    ids = list(graph.nodes)
+    row_of = {dev_id: i for i, dev_id in enumerate(ids)}
+    n = len(ids)
+    length = LAYOUT_EDGE_LENGTH
+
+    stored = {r.device_id: r for r in db.query(TopologyLayout).all()}
+    pos = np.zeros((n, 2))
+    placed = np.zeros(n, dtype=bool)
+    pinned = np.zeros(n, dtype=bool)
+    for dev_id, row in stored.items():
+        i = row_of.get(dev_id)
+        if i is not None:
+            pos[i] = (row.pos_x, row.pos_y)
+            placed[i] = True
+            pinned[i] = bool(row.pinned)
+    before = pos.copy()
+
+    edges = np.array([(row_of[u], row_of[v]) for u, v in graph.edges], dtype=np.int64).reshape(-1, 2)
+    adjacency: List[List[int]] = [[] for _ in range(n)]
+    for u, v in edges:
+        adjacency[u].append(v)
+        adjacency[v].append(u)
+
+    new = ~placed
+    incremental = not full and placed.any() and new.sum() <= LAYOUT_INCREMENTAL_MAX_FRACTION * n
+    if incremental:
+        _place_new(pos, placed, adjacency, length)
+        movable = new
+        iterations, temperature = LAYOUT_INCREMENTAL_ITERATIONS, length
+    else:
+        if not placed.any():
+            side = length * np.sqrt(max(n, 1))
+            pos = np.random.default_rng(0).uniform(-side / 2, side / 2, (n, 2))
+        else:
+            _place_new(pos, placed, adjacency, length)
+        movable = ~pinned
+        iterations, temperature = full_layout_schedule(n, length)
+    force_layout(pos, edges, movable, iterations, temperature, length)
+
+    # Persist new nodes and the stored ones that actually moved (never pinned rows)
+    shift = np.hypot(pos[:, 0] - before[:, 0], pos[:, 1] - before[:, 1])
+    moved = 0
+    for i in np.flatnonzero(movable & (new | (shift > LAYOUT_MOVE_EPSILON))):
+        dev_id = ids[i]
+        x, y = float(pos[i, 0]), float(pos[i, 1])
+        row = stored.get(dev_id)
+        if row is None:
+            db.add(TopologyLayout(device_id=dev_id, pos_x=x, pos_y=y, pinned=False))
+        elif not row.pinned:
+            row.pos_x, row.pos_y = x, y
+        moved += 1
+    if moved:
+        db.commit()
+
+    return {
+        "points": {ids[i]: {"x": float(pos[i, 0]), "y": float(pos[i, 1])} for i in range(n)},
+        "pinned": [ids[i] for i in np.flatnonzero(pinned)],
+        "mode": "incremental" if incremental else "full",
+        "moved": moved,
+    }
+
+
+layout_cache = LayoutCache()
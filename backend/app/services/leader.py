@@ -0,0 +1,97 @@
+# backend/app/services/leader.py
+# Leader lease for work that must run once per deployment, not once per
+# uvicorn worker: the SNMP poll scheduler and the interface counter collector.
+#
+# On the Redis event bus every worker tries SET NX on a key with a TTL; the
+# holder renews it every TTL/3 and runs the pollers, the rest stand by and
+# retry at the same pace, so a dead leader is replaced within one TTL. A
+# leader that can't reach Redis keeps going until its lease would have run
+# out, then stops, so two workers never poll at once for long. Without
+# Redis (EVENT_BUS=local, a single process) this process is simply the leader.
+
+from __future__ import annotations
+import asyncio
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Optional
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from .events import EVENT_BUS
+from .queues import REDIS_URL
+
+
+LEADER_KEY = os.getenv("LEADER_KEY", "homelab:leader:pollers")
+LEADER_TTL_SEC = int(os.getenv("LEADER_TTL_SEC", "30"))
+
+# only the holder may extend or drop the lease
+_RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class LeaderLease:
+    def __init__(self, url: str = REDIS_URL, key: str = LEADER_KEY, ttl: int = LEADER_TTL_SEC) -> None:
+        self.url = url
+        self.key = key
+        self.ttl = ttl
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+        self.leader = False
+        self.renewed_at = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self._client = None
+        self._elected: Optional[Callable[[], None]] = None
+        self._lost: Optional[Callable[[], Awaitable[None]]] = None
+
+    async def start(self, elected: Callable[[], None], lost: Callable[[], Awaitable[None]]) -> None:
+        """Call `elected()` whenever this process takes the lease and `await lost()` when it goes."""
+        self._elected, self._lost = elected, lost
+        if EVENT_BUS != "redis":
+            self.leader = True
+            elected()
+            return
+        self._client = aioredis.from_url(self.url, socket_connect_timeout=2, socket_timeout=5)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.leader:
+            self.leader = False
+            await self._lost()
+            if self._client is not None:
+                try:
+                    await self._client.eval(_RELEASE, 1, self.key, self.token)
+                except (RedisError, OSError):
+                    pass  # expires on its own
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.leader:
+                    held = bool(await self._client.eval(_RENEW, 1, self.key, self.token, self.ttl))
+                else:
+                    held = bool(await self._client.set(self.key, self.token, nx=True, ex=self.ttl))
+                if held:
+                    self.renewed_at = time.monotonic()
+            except (RedisError, OSError):
+                held = self.leader and time.monotonic() - self.renewed_at < self.ttl
+            if held and not self.leader:
+                self.leader = True
+                self._elected()
+            elif not held and self.leader:
+                self.leader = False
+                await self._lost()
+            await asyncio.sleep(self.ttl / 3)
+
+
+poller_lease = LeaderLease()
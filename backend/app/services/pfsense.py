@@ -1,6 +1,6 @@
 from pathlib import Path
 from datetime import datetime
-import paramiko
+from .sshpool import ssh_pool
 
 EXPORT_DIR = Path("/configs/pfsense")
 EXPORT_DIR.mkdir(parents=True, exist_ok=True)
@@ -13,16 +13,6 @@ CMD_PACK = {
     "routes.txt":   "netstat -rn"
 }
 
-def _connect(host, username, password, private_key_path=None):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    if private_key_path:
-        key = paramiko.RSAKey.from_private_key_file(private_key_path)
-        client.connect(host, username=username, pkey=key, look_for_keys=False)
-    else:
-        client.connect(host, username=username, password=password, look_for_keys=False)
-    return client
-
 def _exec(ssh, cmd):
     _, stdout, stderr = ssh.exec_command(cmd)
     out = stdout.read()
@@ -34,8 +24,8 @@ def pull_pfsense_bundle(host: str, username: str, password: str, private_key_pat
     host_dir = EXPORT_DIR / f"{host}-{stamp}"
     host_dir.mkdir(parents=True, exist_ok=True)
 
-    ssh = _connect(host, username, password, private_key_path)
-    try:
+    # pooled connection (services.sshpool): one handshake for the whole bundle and later pulls
+    with ssh_pool.session(host, username, password, private_key_path) as ssh:
         # 1) config.xml
         # (CE/Plus both use /conf/config.xml on current releases)
         cfg_out, cfg_err = _exec(ssh, "cat /conf/config.xml")
@@ -55,5 +45,3 @@ def pull_pfsense_bundle(host: str, username: str, password: str, private_key_pat
             "files": ["config.xml"] + list(CMD_PACK.keys())
         }
         return {"ok": True, **summary}
-    finally:
-        ssh.close()
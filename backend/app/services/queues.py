@@ -0,0 +1,121 @@
+# backend/app/services/queues.py
+# One Redis connection pool per process, shared by the jobs API, the event bus
+# and anything else talking to Redis, plus cached RQ queue handles.
+#
+# The pool is a BlockingConnectionPool: under a burst, callers wait (up to
+# REDIS_POOL_TIMEOUT_SEC) for a free connection instead of opening more, so
+# the connection count stays at most REDIS_MAX_CONNECTIONS. main.py opens it
+# at startup and disconnects it at shutdown; scripts and RQ workers get it
+# lazily on first use.
+#
+# Queues, in the order workers should drain them (`rq worker high default bulk`):
+#   high    - interactive one-offs (a single poll or backup someone waits on)
+#   default - everything else
+#   bulk    - fleet fan-out children
+
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, Optional
+
+from redis import BlockingConnectionPool, Redis
+from rq import Queue
+
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+REDIS_POOL_TIMEOUT_SEC = float(os.getenv("REDIS_POOL_TIMEOUT_SEC", "5"))
+QUEUE_NAMES = ("high", "default", "bulk")
+
+
+class CountingPool(BlockingConnectionPool):
+    """BlockingConnectionPool that counts its checkouts, for stats()."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._count_lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        super().__init__(*args, **kwargs)
+
+    def reset(self) -> None:
+        super().reset()   # also after a fork: the parent's checkouts aren't ours
+        with self._count_lock:
+            self.in_use = 0
+
+    def get_connection(self, command_name, *keys, **options):
+        conn = super().get_connection(command_name, *keys, **options)
+        with self._count_lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return conn
+
+    def release(self, connection) -> None:
+        super().release(connection)
+        with self._count_lock:
+            self.in_use = max(0, self.in_use - 1)
+
+
+class RedisRegistry:
+    def __init__(self, url: str = REDIS_URL) -> None:
+        self.url = url
+        self._pool: Optional[CountingPool] = None
+        self._client: Optional[Redis] = None
+        self._queues: Dict[str, Queue] = {}
+        self._lock = threading.Lock()
+
+    def open(self) -> Redis:
+        """The shared client; creating it doesn't connect yet."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._pool = CountingPool.from_url(
+                        self.url,
+                        max_connections=REDIS_MAX_CONNECTIONS,
+                        timeout=REDIS_POOL_TIMEOUT_SEC,
+                        socket_connect_timeout=2,
+                        socket_timeout=5,
+                        health_check_interval=30,
+                    )
+                    self._client = Redis(connection_pool=self._pool)
+        return self._client
+
+    @property
+    def client(self) -> Redis:
+        return self.open()
+
+    def queue(self, name: str = "default") -> Queue:
+        if name not in QUEUE_NAMES:
+            raise KeyError(f"unknown queue {name!r}; expected one of {', '.join(QUEUE_NAMES)}")
+        q = self._queues.get(name)
+        if q is None:
+            q = self._queues.setdefault(name, Queue(name, connection=self.client))
+        return q
+
+    def stats(self) -> dict:
+        pool = self._pool
+        if pool is None:
+            return {"open": False}
+        return {
+            "open": True,
+            "max_connections": pool.max_connections,
+            "timeout_sec": pool.timeout,
+            "in_use": pool.in_use,
+            "peak_in_use": pool.peak_in_use,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.disconnect()
+            self._pool, self._client, self._queues = None, None, {}
+
+
+redis_registry = RedisRegistry()
+
+
+def get_redis() -> Redis:
+    return redis_registry.client
+
+
+def get_queue(name: str = "default") -> Queue:
+    return redis_registry.queue(name)
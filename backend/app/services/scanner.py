@@ -1,5 +1,17 @@
 import nmap
-from typing import Dict, List
+import os
+import multiprocessing
+import queue
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from bisect import bisect_left, bisect_right
+from ipaddress import ip_address, ip_network, summarize_address_range
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 PROFILES: Dict[str, str] = {
     "fast":     "-T4 -sS -F -sV --version-light --host-timeout 10s --max-retries 1",
@@ -7,10 +19,32 @@ PROFILES: Dict[str, str] = {
     "deep":     "-T3 -sS -sU -sV -O --host-timeout 45s --max-retries 1",
 }
 
-def run_nmap_scan(targets: List[str], profile: str = "fast", skip_ping: bool = False) -> dict:
+# Sharding: big ranges are split into /SHARD_PREFIX blocks and scanned by at
+# most MAX_WORKERS concurrent nmap runs.
+SHARD_PREFIX = int(os.getenv("SCAN_SHARD_PREFIX", "26"))
+MAX_WORKERS = int(os.getenv("SCAN_MAX_WORKERS", str(os.cpu_count() or 2)))
+
+# Backend: "xml" runs nmap -oX - and parses hosts incrementally (memory ~ one
+# host); "python-nmap" buffers the whole XML via nmap.PortScanner.
+SCAN_BACKEND = os.getenv("SCAN_BACKEND", "xml")
+NMAP_BIN = os.getenv("NMAP_BIN") or shutil.which("nmap") or "nmap"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _profile_args(profile: str, skip_ping: bool) -> str:
     base_args = PROFILES.get(profile, PROFILES["fast"])
     if skip_ping:
         base_args = f"{base_args} -Pn"
+    return base_args
+
+
+def run_nmap_scan(targets: List[str], profile: str = "fast", skip_ping: bool = False) -> dict:
+    if SCAN_BACKEND == "xml":
+        return dict(iter_nmap_xml(targets, profile, skip_ping))
+
+    base_args = _profile_args(profile, skip_ping)
 
     nm = nmap.PortScanner()
     nm.scan(hosts=",".join(targets), arguments=base_args)
@@ -52,3 +86,311 @@ def run_nmap_scan(targets: List[str], profile: str = "fast", skip_ping: bool = F
             "services": services,
         }
     return results
+
+
+# -------------------------------
+# Streaming XML backend
+# -------------------------------
+
+def _host_from_xml(elem: ET.Element) -> Optional[Tuple[str, dict]]:
+    """
+    One <host> element -> (ip, host dict) in the run_nmap_scan shape,
+    or None if the host isn't up.
+    """
+    status = elem.find("status")
+    if status is None or (status.get("state") or "").lower() != "up":
+        return None
+
+    ip = mac = vendor = None
+    for addr in elem.findall("address"):
+        kind = addr.get("addrtype")
+        if kind == "ipv4" or (kind == "ipv6" and ip is None):
+            ip = addr.get("addr")
+        elif kind == "mac":
+            mac = addr.get("addr")
+            vendor = addr.get("vendor")
+    if not ip:
+        return None
+
+    # Same preference as python-nmap's hostname(): user-supplied, else first
+    names = elem.findall("hostnames/hostname")
+    hostname = next((n.get("name") for n in names if n.get("type") == "user"), None)
+    if hostname is None and names:
+        hostname = names[0].get("name")
+
+    osmatch = elem.find("os/osmatch")
+    os_name = osmatch.get("name") if osmatch is not None else None
+
+    services = []
+    for port in elem.findall("ports/port"):
+        proto = port.get("protocol")
+        if proto not in ("tcp", "udp"):
+            continue
+        state = port.find("state")
+        svc = port.find("service")
+        services.append({
+            "port": int(port.get("portid")),
+            "proto": proto,
+            "name": svc.get("name", "") if svc is not None else "",
+            "product": svc.get("product", "") if svc is not None else "",
+            "version": svc.get("version", "") if svc is not None else "",
+            "state": state.get("state") if state is not None else None,
+        })
+
+    return ip, {
+        "hostname": hostname or None,
+        "mac": mac,
+        "vendor": vendor,
+        "os": os_name,
+        "services": services,
+    }
+
+
+def iter_nmap_xml(targets: List[str], profile: str = "fast", skip_ping: bool = False) -> Iterator[Tuple[str, dict]]:
+    """
+    Run nmap with -oX - and yield (ip, host) for each up host as soon as its
+    </host> closes. Parsed elements are cleared and detached from the root, so
+    memory stays at roughly one host no matter how large the scan is.
+    Closing the generator early kills nmap.
+    """
+    cmd = [NMAP_BIN, *shlex.split(_profile_args(profile, skip_ping)), "-oX", "-", *targets]
+    with tempfile.TemporaryFile() as err:
+        # bufsize=0: raw pipe, so iterparse sees each chunk as soon as nmap writes it
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, bufsize=0)
+        try:
+            root = None
+            parse_error = None
+            try:
+                for event, elem in ET.iterparse(proc.stdout, events=("start", "end")):
+                    if event == "start":
+                        if root is None:
+                            root = elem
+                        continue
+                    if elem.tag != "host":
+                        continue
+                    rec = _host_from_xml(elem)
+                    elem.clear()
+                    root.remove(elem)
+                    if rec:
+                        yield rec
+            except ET.ParseError as exc:
+                parse_error = exc  # usually nmap died early; prefer its stderr
+            if proc.wait() != 0:
+                err.seek(0)
+                raise RuntimeError(f"nmap exited with {proc.returncode}: {err.read().decode(errors='ignore').strip()}")
+            if parse_error is not None:
+                raise RuntimeError(f"Unparseable nmap XML output: {parse_error}")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+
+# -------------------------------
+# Sharded scanning
+# -------------------------------
+
+def shard_targets(targets: List[str], prefix: int = SHARD_PREFIX) -> List[List[str]]:
+    """
+    Split targets into shards of at most one /prefix block worth of addresses.
+      - IPv4 CIDRs wider than /prefix are cut into /prefix subnets
+      - smaller CIDRs and single IPs are packed together up to the block size
+      - anything nmap understands but ipaddress doesn't (hostnames, ranges,
+        IPv6) is counted as one address
+    """
+    block = 2 ** (32 - prefix)
+    shards: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+
+    def add(item: str, count: int) -> None:
+        nonlocal current, size
+        if current and size + count > block:
+            shards.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += count
+
+    for t in targets:
+        try:
+            net = ip_network(t, strict=False)
+        except ValueError:
+            add(t, 1)
+            continue
+        if net.version == 4 and net.prefixlen < prefix:
+            for sub in net.subnets(new_prefix=prefix):
+                add(str(sub), block)
+        elif net.version == 4:
+            add(t, net.num_addresses)
+        else:
+            add(t, 1)
+
+    if current:
+        shards.append(current)
+    return shards
+
+
+def exclude_addresses(targets: List[str], exclude: Iterable[str]) -> List[str]:
+    """
+    Remove single addresses from a target list, re-expressing the remainder of
+    each CIDR as the smallest set of covering CIDRs. The excluded addresses are
+    sorted once and each CIDR's gaps between them are summarized in one pass,
+    so this is O(n log n) in the number of excluded addresses.
+    Targets ipaddress can't parse (hostnames, nmap ranges) are kept as-is.
+    """
+    skip: Dict[int, List] = {4: [], 6: []}
+    for ip in exclude:
+        try:
+            addr = ip_address(ip)
+        except ValueError:
+            continue
+        skip[addr.version].append(addr)
+    if not skip[4] and not skip[6]:
+        return list(targets)
+    for addrs in skip.values():
+        addrs.sort()
+
+    out: List[str] = []
+    for t in targets:
+        try:
+            net = ip_network(t, strict=False)
+        except ValueError:
+            out.append(t)
+            continue
+        addrs = skip[net.version]
+        lo = bisect_left(addrs, net.network_address)
+        hi = bisect_right(addrs, net.broadcast_address)
+        if lo == hi:
+            out.append(str(net))
+            continue
+        first = net.network_address
+        for addr in addrs[lo:hi]:
+            if addr > first:
+                out.extend(str(p) for p in summarize_address_range(first, addr - 1))
+            first = addr + 1 if addr < net.broadcast_address else None
+            if first is None:
+                break
+        if first is not None:
+            out.extend(str(p) for p in summarize_address_range(first, net.broadcast_address))
+    return out
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: we are usually called from a worker thread of the API
+            # process, and forking a threaded process is unsafe.
+            _pool = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _iter_xml_shards(shards: List[List[str]], profile: str, skip_ping: bool) -> Iterator[Tuple[str, dict]]:
+    """
+    Streaming backend fan-out: one thread per shard (nmap itself is the
+    subprocess), hosts handed over through a small bounded queue so a slow
+    consumer backpressures the parsers instead of buffering results.
+    """
+    out: queue.Queue = queue.Queue(maxsize=MAX_WORKERS * 4)
+    stop = threading.Event()
+    finished = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work(shard: List[str]) -> None:
+        gen = iter_nmap_xml(shard, profile, skip_ping)
+        try:
+            for item in gen:
+                if not put(item):
+                    return
+        except Exception as exc:
+            put(exc)
+        finally:
+            gen.close()  # kills nmap if we bailed out early
+            put(finished)
+
+    ex = ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(shards)))
+    futures = [ex.submit(work, shard) for shard in shards]
+    remaining = len(futures)
+    try:
+        while remaining:
+            item = out.get()
+            if item is finished:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        for fut in futures:
+            fut.cancel()
+        ex.shutdown(wait=False)
+
+
+def iter_sharded_scan(
+    targets: List[str],
+    profile: str = "fast",
+    skip_ping: bool = False,
+    shard_prefix: Optional[int] = None,
+) -> Iterator[Tuple[str, dict]]:
+    """
+    Yield (ip, host) pairs in completion order. With the "xml" backend every
+    host is yielded as soon as nmap reports it; with "python-nmap" hosts come
+    out a shard at a time from the process pool.
+    A single-shard scan runs inline without touching any pool.
+    """
+    shards = shard_targets(targets, shard_prefix or SHARD_PREFIX)
+    if SCAN_BACKEND == "xml":
+        if len(shards) <= 1:
+            yield from iter_nmap_xml(targets, profile, skip_ping)
+        else:
+            yield from _iter_xml_shards(shards, profile, skip_ping)
+        return
+
+    if len(shards) <= 1:
+        yield from run_nmap_scan(targets, profile, skip_ping).items()
+        return
+
+    pool = _get_pool()
+    futures = [pool.submit(run_nmap_scan, shard, profile, skip_ping) for shard in shards]
+    try:
+        for fut in as_completed(futures):
+            yield from fut.result().items()
+    finally:
+        # Consumer went away (or a shard failed): don't keep queued shards around
+        for fut in futures:
+            fut.cancel()
+
+
+def run_sharded_scan(
+    targets: List[str],
+    profile: str = "fast",
+    skip_ping: bool = False,
+    shard_prefix: Optional[int] = None,
+) -> dict:
+    """
+    Same contract as run_nmap_scan, but runs one nmap per shard (threads for
+    the "xml" backend, the shared process pool for "python-nmap") and merges
+    the per-shard host dicts.
+    """
+    return dict(iter_sharded_scan(targets, profile, skip_ping, shard_prefix))
+
+
+def scan_targets(targets: List[str], profile: str = "standard", skip_ping: bool = False) -> List[dict]:
+    """
+    Entry point for the API: sharded scan flattened into [{"ip": ..., **host}, ...].
+    """
+    hosts = run_sharded_scan(targets, profile, skip_ping)
+    return [{"ip": ip, **info} for ip, info in hosts.items()]
@@ -0,0 +1,305 @@
+# backend/app/services/scheduler.py
+# Continuous SNMP polling of every known device.
+#
+# Each device has a next-due time kept in a min-heap. A dispatcher sleeps until
+# the earliest one, then hands due devices to a fixed pool of workers through a
+# bounded queue, so a slow round queues up (and shows as lag) instead of piling
+# up tasks. First polls are spread over one interval, every reschedule gets
+# +/- jitter, and hosts that don't answer back off exponentially up to a cap.
+# Results are written in batches by a single persister task.
+
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from ..db import SessionLocal
+from ..models.device import Device
+from ..ws import notify_topology_update
+from .inventory import persist_snmp_results
+from .jobcontrol import DeviceBusy, limiter
+from .snmp import SNMP_COMMUNITY, SNMP_HOST_TIMEOUT_SEC, poll_device_async
+
+
+# -------------------------------
+# Tunables
+# -------------------------------
+
+SNMP_POLL_INTERVAL_SEC = int(os.getenv("SNMP_POLL_INTERVAL_SEC", "300"))  # 0 disables
+SNMP_POLL_WORKERS = int(os.getenv("SNMP_POLL_WORKERS", "32"))
+SNMP_POLL_JITTER = float(os.getenv("SNMP_POLL_JITTER", "0.1"))            # +/- fraction of the interval
+SNMP_POLL_MAX_BACKOFF_SEC = int(os.getenv("SNMP_POLL_MAX_BACKOFF_SEC", "3600"))
+# How often the device list is re-read from the DB
+SNMP_POLL_REFRESH_SEC = int(os.getenv("SNMP_POLL_REFRESH_SEC", "60"))
+# Results written per transaction, and the longest a result waits for its batch
+SNMP_POLL_PERSIST_BATCH = int(os.getenv("SNMP_POLL_PERSIST_BATCH", "50"))
+SNMP_POLL_PERSIST_DELAY_SEC = float(os.getenv("SNMP_POLL_PERSIST_DELAY_SEC", "1.0"))
+
+# Completed polls remembered for the lag / throughput figures
+STATS_WINDOW = 1000
+
+
+@dataclass
+class _Target:
+    ip: str
+    due: float
+    failures: int = 0
+    last_ok: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+def _known_devices() -> Dict[int, str]:
+    db = SessionLocal()
+    try:
+        q = select(Device.id, Device.mgmt_ip).where(Device.mgmt_ip.isnot(None))
+        return {dev_id: ip for dev_id, ip in db.execute(q)}
+    finally:
+        db.close()
+
+
+def _persist(batch: Dict[str, dict]) -> bool:
+    """Runs in a worker thread; True if any device actually changed."""
+    db = SessionLocal()
+    try:
+        persisted = persist_snmp_results(db, batch, datetime.now(timezone.utc))
+        return any(p["changed"] for p in persisted.values())
+    finally:
+        db.close()
+
+
+def _percentile(sorted_vals: List[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, int(round(pct / 100 * (len(sorted_vals) - 1))))
+    return sorted_vals[k]
+
+
+class PollScheduler:
+    """Heap-driven poller; start()/stop() from the app lifespan."""
+
+    def __init__(
+        self,
+        interval: int = SNMP_POLL_INTERVAL_SEC,
+        workers: int = SNMP_POLL_WORKERS,
+        jitter: float = SNMP_POLL_JITTER,
+        max_backoff: int = SNMP_POLL_MAX_BACKOFF_SEC,
+        community: str = SNMP_COMMUNITY,
+    ) -> None:
+        self.interval = interval
+        self.workers = max(1, workers)
+        self.jitter = jitter
+        self.max_backoff = max(max_backoff, interval)
+        self.community = community
+
+        self.targets: Dict[int, _Target] = {}
+        self.heap: List[Tuple[float, int, int]] = []   # (due, seq, device_id)
+        self.seq = itertools.count()
+        self.tasks: List[asyncio.Task] = []
+        self.queue: Optional[asyncio.Queue] = None
+        self.results: Optional[asyncio.Queue] = None
+        self.wakeup: Optional[asyncio.Event] = None
+
+        self.started_at: Optional[float] = None
+        self.in_flight = 0
+        self.polled = 0
+        self.failed = 0
+        self.busy = 0          # skipped: a job or API request held the device's slots
+        self.persist_errors = 0
+        self.lags: Deque[float] = deque(maxlen=STATS_WINDOW)        # seconds late at pickup
+        self.durations: Deque[float] = deque(maxlen=STATS_WINDOW)   # seconds per poll
+        self.finished: Deque[float] = deque(maxlen=STATS_WINDOW)    # completion timestamps
+
+    # ---- scheduling ----
+
+    def _push(self, dev_id: int, due: float) -> None:
+        self.targets[dev_id].due = due
+        heapq.heappush(self.heap, (due, next(self.seq), dev_id))
+        if self.wakeup is not None and self.heap[0][2] == dev_id:
+            self.wakeup.set()
+
+    def _next_delay(self, target: _Target) -> float:
+        delay = self.interval
+        if target.failures:
+            delay = min(self.interval * 2 ** (target.failures - 1), self.max_backoff)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def sync_devices(self, devices: Dict[int, str], now: Optional[float] = None) -> None:
+        """Track new devices (first poll spread over one interval), drop removed ones."""
+        now = time.time() if now is None else now
+        for dev_id in [d for d in self.targets if d not in devices]:
+            del self.targets[dev_id]   # its heap entry is skipped when popped
+        for dev_id, ip in devices.items():
+            target = self.targets.get(dev_id)
+            if target is None:
+                self.targets[dev_id] = _Target(ip=ip, due=0.0)
+                self._push(dev_id, now + random.uniform(0, self.interval))
+            elif target.ip != ip:
+                target.ip, target.failures = ip, 0
+
+    def poll_now(self, dev_id: int) -> bool:
+        """Move a tracked device to the front of the heap."""
+        if dev_id not in self.targets:
+            return False
+        self._push(dev_id, time.time())
+        return True
+
+    # ---- tasks ----
+
+    def start(self) -> None:
+        if self.interval <= 0 or self.tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.workers)
+        self.results = asyncio.Queue()
+        self.wakeup = asyncio.Event()
+        self.started_at = time.time()
+        self.tasks = [
+            asyncio.create_task(self._refresh()),
+            asyncio.create_task(self._dispatch()),
+            asyncio.create_task(self._persister()),
+        ] + [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _refresh(self) -> None:
+        while True:
+            try:
+                self.sync_devices(await asyncio.to_thread(_known_devices))
+            except Exception:
+                pass  # DB hiccup; keep polling the devices we already know
+            await asyncio.sleep(SNMP_POLL_REFRESH_SEC)
+
+    async def _dispatch(self) -> None:
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            due, _, dev_id = self.heap[0]
+            wait = due - time.time()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            target = self.targets.get(dev_id)
+            if target is None or target.due != due:
+                continue  # device removed or rescheduled since this entry was pushed
+            # Blocks while every worker is busy; the wait shows up as lag
+            await self.queue.put((dev_id, due))
+
+    async def _worker(self) -> None:
+        while True:
+            dev_id, due = await self.queue.get()
+            target = self.targets.get(dev_id)
+            if target is None:
+                continue
+            started = time.time()
+            self.lags.append(max(0.0, started - due))
+            self.in_flight += 1
+            try:
+                async with limiter.aslot(target.ip, wait=0):
+                    res = await asyncio.wait_for(poll_device_async(target.ip, self.community), SNMP_HOST_TIMEOUT_SEC)
+                error = None if res["reachable"] else "no SNMP response"
+            except DeviceBusy:
+                res, error = None, None
+            except asyncio.TimeoutError:
+                res, error = None, f"timeout after {SNMP_HOST_TIMEOUT_SEC:g}s"
+            except Exception as exc:
+                res, error = None, str(exc) or type(exc).__name__
+            finally:
+                self.in_flight -= 1
+
+            now = time.time()
+            if res is None and error is None:
+                # busy: not the device's fault, so no backoff; try again next interval
+                self.busy += 1
+                if dev_id in self.targets:
+                    self._push(dev_id, now + self._next_delay(target))
+                continue
+            self.durations.append(now - started)
+            self.finished.append(now)
+            if error:
+                self.failed += 1
+                target.failures += 1
+                target.last_error = error
+            else:
+                self.polled += 1
+                target.failures = 0
+                target.last_ok, target.last_error = now, None
+                self.results.put_nowait((target.ip, res))
+            if dev_id in self.targets:
+                self._push(dev_id, now + self._next_delay(target))
+
+    async def _persister(self) -> None:
+        while True:
+            ip, res = await self.results.get()
+            batch = {ip: res}
+            deadline = time.time() + SNMP_POLL_PERSIST_DELAY_SEC
+            while len(batch) < SNMP_POLL_PERSIST_BATCH:
+                try:
+                    ip, res = await asyncio.wait_for(self.results.get(), max(0.0, deadline - time.time()))
+                except asyncio.TimeoutError:
+                    break
+                batch[ip] = res
+            try:
+                changed = await asyncio.to_thread(_persist, batch)
+            except Exception:
+                self.persist_errors += 1
+                continue
+            if changed:
+                await notify_topology_update()
+
+    # ---- stats ----
+
+    def stats(self) -> dict:
+        """Snapshot of how well the scheduler keeps up with its interval."""
+        now = time.time()
+        lags = sorted(self.lags)
+        durations = sorted(self.durations)
+        recent = sum(1 for t in self.finished if t >= now - 60)
+        backing_off = sum(1 for t in self.targets.values() if t.failures)
+        devices = len(self.targets)
+        return {
+            "running": bool(self.tasks),
+            "interval_sec": self.interval,
+            "workers": self.workers,
+            "devices": devices,
+            "backing_off": backing_off,
+            "due_now": sum(1 for t in self.targets.values() if t.due <= now),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "in_flight": self.in_flight,
+            "polled": self.polled,
+            "failed": self.failed,
+            "busy": self.busy,
+            "persist_errors": self.persist_errors,
+            "polls_last_minute": recent,
+            # polls/min needed to visit every healthy device once per interval
+            "required_per_minute": round((devices - backing_off) * 60 / self.interval, 1) if self.interval else 0,
+            "lag_sec": {
+                "p50": round(_percentile(lags, 50), 3),
+                "p95": round(_percentile(lags, 95), 3),
+                "max": round(lags[-1], 3) if lags else 0.0,
+            },
+            "poll_sec": {
+                "p50": round(_percentile(durations, 50), 3),
+                "p95": round(_percentile(durations, 95), 3),
+            },
+        }
+
+
+scheduler = PollScheduler()
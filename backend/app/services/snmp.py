@@ -1,10 +1,28 @@
 # backend/app/services/snmp.py
 # SNMP poller using puresnmp (Python 3.12 friendly, no external MIBs required).
 # Returns simple dicts/lists so callers can persist into the DB easily.
+# puresnmp 2.x is asyncio-only: the *_async functions are the real pollers and
+# the plain ones are thin asyncio.run() wrappers for threads/RQ workers.
 
 from __future__ import annotations
-from typing import Optional, List, Dict, Tuple
-from puresnmp import api as snmp
+import asyncio
+import contextlib
+import os
+from ipaddress import ip_address
+from typing import AsyncContextManager, AsyncIterator, Callable, Optional, List, Dict, Tuple
+from puresnmp import Client, PyWrapper, V2C
+
+
+# Community for background pollers (API callers pass their own)
+SNMP_COMMUNITY = os.getenv("SNMP_COMMUNITY", "public")
+# Per-request UDP timeout/retries (puresnmp defaults are 6s x 10 retries)
+SNMP_TIMEOUT_SEC = float(os.getenv("SNMP_TIMEOUT_SEC", "2"))
+SNMP_RETRIES = int(os.getenv("SNMP_RETRIES", "1"))
+# Rows per column per GETBULK request when walking tables
+SNMP_MAX_REPETITIONS = int(os.getenv("SNMP_MAX_REPETITIONS", "25"))
+# Bulk polling: devices in flight at once, and overall budget per device
+SNMP_CONCURRENCY = int(os.getenv("SNMP_CONCURRENCY", "64"))
+SNMP_HOST_TIMEOUT_SEC = float(os.getenv("SNMP_HOST_TIMEOUT_SEC", "30"))
 
 
 # -------------------------------
@@ -23,10 +41,24 @@ IF_SPEED     = "1.3.6.1.2.1.2.2.1.5"   # ifSpeed (bits per second)
 IF_ALIAS     = "1.3.6.1.2.1.31.1.1.1.18"  # ifAlias (text description)
 IF_HIGHSPEED = "1.3.6.1.2.1.31.1.1.1.15"  # ifHighSpeed (in Mbps)
 
+# IF-MIB counters (HC = 64-bit ifXTable; plain = 32-bit ifTable fallback)
+IF_HC_IN_OCTETS  = "1.3.6.1.2.1.31.1.1.1.6"   # ifHCInOctets
+IF_HC_OUT_OCTETS = "1.3.6.1.2.1.31.1.1.1.10"  # ifHCOutOctets
+IF_IN_OCTETS     = "1.3.6.1.2.1.2.2.1.10"     # ifInOctets
+IF_OUT_OCTETS    = "1.3.6.1.2.1.2.2.1.16"     # ifOutOctets
+IF_IN_ERRORS     = "1.3.6.1.2.1.2.2.1.14"     # ifInErrors
+IF_OUT_ERRORS    = "1.3.6.1.2.1.2.2.1.20"     # ifOutErrors
+
 # LLDP-MIB (IEEE 802.1AB) – remote tables (read-only)
 LLDP_REM_SYSNAME = "1.0.8802.1.1.2.1.4.1.1.9"  # lldpRemSysName
 LLDP_REM_PORTID  = "1.0.8802.1.1.2.1.4.1.1.7"  # lldpRemPortId
-# (Mgmt address tables exist too, but are more verbose to parse across variants)
+LLDP_REM_CHASSIS_SUBTYPE = "1.0.8802.1.1.2.1.4.1.1.4"  # lldpRemChassisIdSubtype (4 = MAC)
+LLDP_REM_CHASSIS_ID      = "1.0.8802.1.1.2.1.4.1.1.5"  # lldpRemChassisId
+# lldpRemManAddrTable: the address lives in the row index, so any column will do
+LLDP_REM_MAN_ADDR_IF_SUBTYPE = "1.0.8802.1.1.2.1.4.2.1.3"  # lldpRemManAddrIfSubtype
+# LLDP-MIB local port table, keyed by lldpLocPortNum (the localPort in remote rows)
+LLDP_LOC_PORT_ID   = "1.0.8802.1.1.2.1.3.7.1.3"  # lldpLocPortId
+LLDP_LOC_PORT_DESC = "1.0.8802.1.1.2.1.3.7.1.4"  # lldpLocPortDesc
 
 
 # -------------------------------
@@ -45,108 +77,323 @@ def _safe_str(val) -> Optional[str]:
         return None
 
 
-def _walk_pairs(host: str, community: str, base_oid: str) -> List[Tuple[str, str]]:
-    """
-    Walk an OID subtree and return list of (oid, value_str).
-    OID is string-form, value is already coerced to string.
-    """
-    out: List[Tuple[str, str]] = []
-    for oid, value in snmp.walk(host, community, base_oid):
-        out.append((str(oid), _safe_str(value)))
-    return out
+def _client(host: str, community: str) -> PyWrapper:
+    client = Client(host, V2C(community))
+    client.configure(timeout=SNMP_TIMEOUT_SEC, retries=SNMP_RETRIES)
+    return PyWrapper(client)
 
 
-def _walk_index_map(host: str, community: str, base_oid: str) -> Dict[str, str]:
+def _mac_str(raw: bytes) -> str:
+    return ":".join(f"{b:02x}" for b in raw)
+
+
+async def _table_walk(
+    client: PyWrapper,
+    columns: Dict[str, str],
+    max_repetitions: Optional[int] = None,
+    raw: Tuple[str, ...] = (),
+) -> Dict[str, Dict[str, Optional[str]]]:
     """
-    Walk a column OID and return {index: value}, where index is the last sub-id.
-    Example: 1.3.6...1.2.<index> -> "<value>"
+    Walk several table columns in one GETBULK stream and assemble rows by index.
+    columns: {name: column_oid}. Returns {index: {name: value_str}}, where index
+    is everything after the column OID (e.g. "12" for ifTable, "0.12.1" for
+    lldpRemTable). Each request fetches `max_repetitions` rows of every
+    column that hasn't run off its subtree yet. Columns named in `raw` keep the
+    undecoded value (binary octet strings such as MAC addresses).
     """
-    out: Dict[str, str] = {}
-    for oid, val in _walk_pairs(host, community, base_oid):
-        idx = oid.split(".")[-1]
-        out[idx] = val
-    return out
+    bases = [(name, oid + ".") for name, oid in columns.items()]
+    rows: Dict[str, Dict[str, Optional[str]]] = {}
+    walk = client.bulkwalk(list(columns.values()), bulk_size=max_repetitions or SNMP_MAX_REPETITIONS)
+    async for vb in walk:
+        oid = str(vb.oid)
+        for name, prefix in bases:
+            if oid.startswith(prefix):
+                value = vb.value if name in raw else _safe_str(vb.value)
+                rows.setdefault(oid[len(prefix):], {})[name] = value
+                break
+    return rows
 
 
 # -------------------------------
-# Public poll functions
+# Async poll functions
 # -------------------------------
 
-def poll_sysinfo(host: str, community: str) -> dict:
-    """
-    Returns basic system info: sysDescr & sysName.
-    """
+async def _sysinfo(client: PyWrapper) -> dict:
     try:
-        descr = snmp.get(host, community, SYS_DESCR)
-        name  = snmp.get(host, community, SYS_NAME)
+        descr, name = await client.multiget([SYS_DESCR, SYS_NAME])
         return {"sysDescr": _safe_str(descr), "sysName": _safe_str(name)}
     except Exception:
         # Return empty on failure so callers can proceed gracefully.
         return {}
 
 
-def poll_interfaces(host: str, community: str) -> List[dict]:
-    """
-    Returns a list of interface dicts with:
-      - index (str)
-      - name (ifDescr)
-      - admin_up (bool from ifAdminStatus == 1)
-      - oper_up  (bool from ifOperStatus  == 1)
-      - speed (prefers ifHighSpeed in Mbps; falls back to ifSpeed in bps)
-      - desc  (ifAlias, optional user description)
-    """
-    try:
-        descr = _walk_index_map(host, community, IF_DESCR)
-        admin = _walk_index_map(host, community, IF_ADMIN)
-        oper  = _walk_index_map(host, community, IF_OPER)
-        speed = _walk_index_map(host, community, IF_SPEED)
-        alias = _walk_index_map(host, community, IF_ALIAS)
-        hspd  = _walk_index_map(host, community, IF_HIGHSPEED)
-    except Exception:
-        return []
+IF_COLUMNS = {
+    "descr": IF_DESCR,
+    "admin": IF_ADMIN,
+    "oper": IF_OPER,
+    "speed": IF_SPEED,
+    "alias": IF_ALIAS,
+    "hspd": IF_HIGHSPEED,
+}
+
+COUNTER_COLUMNS = {
+    "descr": IF_DESCR,
+    "hc_in": IF_HC_IN_OCTETS,
+    "hc_out": IF_HC_OUT_OCTETS,
+    "in": IF_IN_OCTETS,
+    "out": IF_OUT_OCTETS,
+    "in_err": IF_IN_ERRORS,
+    "out_err": IF_OUT_ERRORS,
+}
+
+LLDP_COLUMNS = {
+    "sysname": LLDP_REM_SYSNAME,
+    "port": LLDP_REM_PORTID,
+    "chassis_subtype": LLDP_REM_CHASSIS_SUBTYPE,
+    "chassis": LLDP_REM_CHASSIS_ID,
+}
+
+LLDP_MAN_ADDR_COLUMNS = {
+    "if_subtype": LLDP_REM_MAN_ADDR_IF_SUBTYPE,
+}
+
+LLDP_LOC_PORT_COLUMNS = {
+    "id": LLDP_LOC_PORT_ID,
+    "desc": LLDP_LOC_PORT_DESC,
+}
+
+
+async def _interfaces(client: PyWrapper, max_repetitions: Optional[int] = None) -> List[dict]:
+    rows = await _table_walk(client, IF_COLUMNS, max_repetitions)
 
     out: List[dict] = []
-    for idx, name in descr.items():
+    for idx, row in rows.items():
+        name = row.get("descr")
+        if name is None:
+            continue  # ifXTable-only row without an ifTable entry
         # Prefer high-speed if present; else raw ifSpeed
-        hs = hspd.get(idx)
-        sp = hs if (hs and hs.isdigit()) else speed.get(idx)
+        hs = row.get("hspd")
+        sp = hs if (hs and hs.isdigit()) else row.get("speed")
         out.append({
             "index": idx,
             "name": name,
-            "admin_up": admin.get(idx) == "1",
-            "oper_up":  oper.get(idx) == "1",
+            "admin_up": row.get("admin") == "1",
+            "oper_up":  row.get("oper") == "1",
             "speed":    sp,                 # Mbps if from ifHighSpeed, else bps (string)
-            "desc":     alias.get(idx),     # interface description (if set)
+            "desc":     row.get("alias"),   # interface description (if set)
         })
     return out
 
 
-def poll_lldp_neighbors(host: str, community: str) -> List[dict]:
+def _man_addr_from_index(index: str) -> Optional[Tuple[str, str]]:
     """
-    Returns a list of LLDP neighbor dicts keyed by the last 3 sub-ids of each row:
-      - instance: "<localPort>.<remIndex>.<remSubIndex>"
-      - remote_sysname
-      - remote_port
-    (Local interface mapping can be added in a future iteration with LLDP localPort tables.)
+    Decode a lldpRemManAddrTable index
+    "<timeMark>.<localPort>.<remIndex>.<addrSubtype>.<len>.<addr octets...>"
+    into (instance, address). Only IPv4 (subtype 1) and IPv6 (subtype 2) are
+    kept. Some agents leave out the length octet, so both forms are accepted.
     """
+    parts = index.split(".")
+    if len(parts) < 8:
+        return None
+    subtype, rest = parts[3], parts[4:]
+    size = {"1": 4, "2": 16}.get(subtype)
+    if size is None:
+        return None
+    if len(rest) == size + 1 and rest[0] == str(size):
+        rest = rest[1:]
+    if len(rest) != size:
+        return None
     try:
-        sysnames = _walk_pairs(host, community, LLDP_REM_SYSNAME)
-        ports    = _walk_pairs(host, community, LLDP_REM_PORTID)
-    except Exception:
-        return []
+        addr = ip_address(bytes(int(o) for o in rest))
+    except ValueError:
+        return None
+    return ".".join(parts[1:3]), str(addr)
+
+
+async def _lldp_neighbors(client: PyWrapper, max_repetitions: Optional[int] = None) -> List[dict]:
+    # Remote systems, their management addresses and our local port names are
+    # three differently indexed tables; walk them side by side. A failed walk
+    # fails the whole table: half a neighbor row would read as a change.
+    walks = await asyncio.gather(
+        _table_walk(client, LLDP_COLUMNS, max_repetitions, raw=("chassis",)),
+        _table_walk(client, LLDP_MAN_ADDR_COLUMNS, max_repetitions),
+        _table_walk(client, LLDP_LOC_PORT_COLUMNS, max_repetitions),
+        return_exceptions=True,
+    )
+    for walk in walks:
+        if isinstance(walk, Exception):
+            raise walk
+    rows, man_rows, loc_rows = walks
+
+    # Rows are keyed by "<timeMark>.<localPort>.<remIndex>". The time mark moves
+    # whenever the agent re-learns the neighbor, so it's left out of the instance.
+    def k2(index: str) -> str:
+        return ".".join(index.split(".")[-2:])
 
-    # Build maps keyed by the last 3 sub-ids to correlate rows across columns.
-    def k3(oid: str) -> str:
-        return ".".join(oid.split(".")[-3:])
+    # First IPv4 address per neighbor wins; IPv6 only if there is no IPv4
+    mgmt: Dict[str, str] = {}
+    for idx in man_rows:
+        parsed = _man_addr_from_index(idx)
+        if parsed is None:
+            continue
+        inst, addr = parsed
+        if inst not in mgmt or (":" in mgmt[inst] and ":" not in addr):
+            mgmt[inst] = addr
 
-    sys_map: Dict[str, str] = {k3(oid): val for oid, val in sysnames}
-    port_map: Dict[str, str] = {k3(oid): val for oid, val in ports}
+    def chassis(row: dict) -> Optional[str]:
+        value = row.get("chassis")
+        if isinstance(value, bytes) and row.get("chassis_subtype") == "4" and len(value) == 6:
+            return _mac_str(value)
+        return _safe_str(value) or None
 
     out: List[dict] = []
-    for inst, rname in sys_map.items():
+    for idx, row in rows.items():
+        if "sysname" not in row:
+            continue
+        inst = k2(idx)
+        loc = loc_rows.get(inst.split(".")[0], {})
         out.append({
             "instance": inst,
-            "remote_sysname": rname,
-            "remote_port": port_map.get(inst),
+            "local_if": loc.get("desc") or loc.get("id"),
+            "remote_sysname": row["sysname"],
+            "remote_port": row.get("port"),
+            "remote_mgmt_ip": mgmt.get(inst),
+            "remote_chassis_id": chassis(row),
         })
     return out
+
+
+def _int_or_none(val: Optional[str]) -> Optional[int]:
+    return int(val) if val and val.isdigit() else None
+
+
+async def _counters(client: PyWrapper, max_repetitions: Optional[int] = None) -> Dict[str, dict]:
+    rows = await _table_walk(client, COUNTER_COLUMNS, max_repetitions)
+
+    out: Dict[str, dict] = {}
+    for idx, row in rows.items():
+        hc_in, hc_out = _int_or_none(row.get("hc_in")), _int_or_none(row.get("hc_out"))
+        wide = hc_in is not None and hc_out is not None
+        out[idx] = {
+            "name": row.get("descr"),
+            "in_octets": hc_in if wide else _int_or_none(row.get("in")),
+            "out_octets": hc_out if wide else _int_or_none(row.get("out")),
+            "octet_bits": 64 if wide else 32,
+            "in_errors": _int_or_none(row.get("in_err")),
+            "out_errors": _int_or_none(row.get("out_err")),
+        }
+    return out
+
+
+async def poll_sysinfo_async(host: str, community: str) -> dict:
+    return await _sysinfo(_client(host, community))
+
+
+async def poll_interfaces_async(host: str, community: str) -> List[dict]:
+    return await _interfaces(_client(host, community))
+
+
+async def poll_lldp_neighbors_async(host: str, community: str) -> List[dict]:
+    return await _lldp_neighbors(_client(host, community))
+
+
+async def poll_counters_async(host: str, community: str) -> Dict[str, dict]:
+    """
+    Raw interface counters keyed by ifIndex: {"name", "in_octets", "out_octets",
+    "octet_bits" (64 for ifHC*, 32 for the ifTable fallback), "in_errors",
+    "out_errors"}. Raises on SNMP failure so collectors can tell it from "no rows".
+    """
+    return await _counters(_client(host, community))
+
+
+async def poll_device_async(host: str, community: str) -> dict:
+    """
+    Full poll of one device: {"reachable", "sysinfo", "interfaces", "neighbors",
+    "failed"}. An empty sysinfo means the agent didn't answer; the tables are
+    skipped then. "failed" maps a table ("interfaces", "neighbors") whose walk
+    errored to the error; that table is [] and must not be read as "no rows".
+    """
+    client = _client(host, community)
+    sysinfo = await _sysinfo(client)
+    if not sysinfo:
+        return {"reachable": False, "sysinfo": {}, "interfaces": [], "neighbors": [], "failed": {}}
+    walks = await asyncio.gather(_interfaces(client), _lldp_neighbors(client), return_exceptions=True)
+    result = {"reachable": True, "sysinfo": sysinfo, "failed": {}}
+    for table, rows in zip(("interfaces", "neighbors"), walks):
+        if isinstance(rows, Exception):
+            result["failed"][table] = str(rows) or type(rows).__name__
+            rows = []
+        result[table] = rows
+    return result
+
+
+async def poll_many(
+    hosts: List[str],
+    community: str,
+    concurrency: int = SNMP_CONCURRENCY,
+    timeout: float = SNMP_HOST_TIMEOUT_SEC,
+    guard: Optional[Callable[[str], AsyncContextManager]] = None,
+) -> AsyncIterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """
+    Poll many devices concurrently (at most `concurrency` in flight, each capped
+    at `timeout` seconds). Yields (host, result, error) in completion order;
+    result is None when the device failed, timed out or didn't answer.
+    `guard(host)`, if given, is held around each poll (e.g. a per-device slot);
+    waiting for it doesn't count against `timeout`.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(host: str):
+        async with sem:
+            try:
+                async with (guard(host) if guard else contextlib.nullcontext()):
+                    res = await asyncio.wait_for(poll_device_async(host, community), timeout)
+            except asyncio.TimeoutError:
+                return host, None, f"timeout after {timeout:g}s"
+            except Exception as exc:
+                return host, None, str(exc) or type(exc).__name__
+            if not res["reachable"]:
+                return host, None, "no SNMP response"
+            return host, res, None
+
+    for fut in asyncio.as_completed([one(h) for h in hosts]):
+        yield await fut
+
+
+# -------------------------------
+# Public poll functions (sync)
+# -------------------------------
+
+def poll_sysinfo(host: str, community: str) -> dict:
+    """
+    Returns basic system info: sysDescr & sysName.
+    """
+    return asyncio.run(poll_sysinfo_async(host, community))
+
+
+def poll_interfaces(host: str, community: str) -> List[dict]:
+    """
+    Returns a list of interface dicts with:
+      - index (str)
+      - name (ifDescr)
+      - admin_up (bool from ifAdminStatus == 1)
+      - oper_up  (bool from ifOperStatus  == 1)
+      - speed (prefers ifHighSpeed in Mbps; falls back to ifSpeed in bps)
+      - desc  (ifAlias, optional user description)
+    Raises if the walk fails.
+    """
+    return asyncio.run(poll_interfaces_async(host, community))
+
+
+def poll_lldp_neighbors(host: str, community: str) -> List[dict]:
+    """
+    Returns a list of LLDP neighbor dicts keyed by the last 2 sub-ids of each row:
+      - instance: "<localPort>.<remIndex>"
+      - local_if (lldpLocPortDesc, else lldpLocPortId, of the local port)
+      - remote_sysname
+      - remote_port
+      - remote_mgmt_ip (from lldpRemManAddrTable; IPv4 preferred, None if not advertised)
+      - remote_chassis_id (aa:bb:cc:dd:ee:ff when the chassis ID is a MAC, else as sent)
+    Raises if any of the LLDP walks fails.
+    """
+    return asyncio.run(poll_lldp_neighbors_async(host, community))
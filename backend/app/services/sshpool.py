@@ -0,0 +1,241 @@
+# backend/app/services/sshpool.py
+# Shared SSH connections for sshpush, configsync and pfsense.
+#
+# Connections are pooled per (host, port, user, credentials) and reused while
+# they stay healthy, so repeated operations against a device skip the TCP
+# connect, key exchange and auth. Every use opens its own channel (exec or
+# shell) on the shared transport, so concurrent callers can share one
+# connection. Idle connections are closed after SSH_POOL_IDLE_SEC. One that
+# has been idle for a while is probed before reuse, and dropped if the probe
+# or its use fails.
+#
+# Private keys are parsed once per file version (any type paramiko supports:
+# RSA, ECDSA, Ed25519, DSS). The host key policy comes from SSH_HOST_KEY_POLICY
+# (auto-add | warn | reject), checked against SSH_KNOWN_HOSTS when set.
+
+from __future__ import annotations
+import hashlib
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+import paramiko
+
+
+SSH_CONNECT_TIMEOUT_SEC = float(os.getenv("SSH_CONNECT_TIMEOUT_SEC", "10"))
+SSH_COMMAND_TIMEOUT_SEC = float(os.getenv("SSH_COMMAND_TIMEOUT_SEC", "120"))
+SSH_POOL_IDLE_SEC = float(os.getenv("SSH_POOL_IDLE_SEC", "300"))
+# Connections idle longer than this are probed (SSH ignore message) before reuse
+SSH_HEALTH_CHECK_SEC = float(os.getenv("SSH_HEALTH_CHECK_SEC", "30"))
+SSH_KEEPALIVE_SEC = int(os.getenv("SSH_KEEPALIVE_SEC", "30"))
+SSH_HOST_KEY_POLICY = os.getenv("SSH_HOST_KEY_POLICY", "auto-add")
+SSH_KNOWN_HOSTS = os.getenv("SSH_KNOWN_HOSTS")
+
+_POLICIES = {
+    "auto-add": paramiko.AutoAddPolicy,
+    "warn": paramiko.WarningPolicy,
+    "reject": paramiko.RejectPolicy,
+}
+
+# Raised by dead or half-dead connections; the pooled connection is dropped
+_CONNECTION_ERRORS = (paramiko.SSHException, EOFError, OSError, socket.timeout)
+
+
+# -------------------------------
+# Private key cache
+# -------------------------------
+
+_keys: Dict[Tuple[str, int, int, str], paramiko.PKey] = {}
+_keys_lock = threading.Lock()
+
+
+def load_private_key(path: str, passphrase: Optional[str] = None) -> paramiko.PKey:
+    """Parse a private key of any supported type, once per file version and passphrase."""
+    st = os.stat(path)
+    # the passphrase is part of the key (hashed), so a wrong one never gets a cached key back
+    secret = hashlib.sha256((passphrase or "").encode()).hexdigest()
+    cache_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, secret)
+    with _keys_lock:
+        key = _keys.get(cache_key)
+    if key is None:
+        key = paramiko.PKey.from_path(path, passphrase=passphrase.encode() if passphrase else None)
+        with _keys_lock:
+            _keys[cache_key] = key
+    return key
+
+
+# -------------------------------
+# Connection pool
+# -------------------------------
+
+PoolKey = Tuple[str, int, str, str]
+
+
+class _Entry:
+    __slots__ = ("client", "users", "last_used")
+
+    def __init__(self, client: paramiko.SSHClient) -> None:
+        self.client = client
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+class SSHPool:
+    def __init__(self) -> None:
+        self.entries: Dict[PoolKey, _Entry] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self.stats = {"connects": 0, "reuses": 0, "dropped": 0, "expired": 0}
+
+    @staticmethod
+    def _key(host: str, port: int, username: str, password: Optional[str], key_path: Optional[str]) -> PoolKey:
+        # credentials are part of the key (hashed), so a changed password never reuses a session
+        if key_path:
+            auth = "key:" + os.path.abspath(key_path)
+        else:
+            auth = "pw:" + hashlib.sha256((password or "").encode()).hexdigest()
+        return (host, port, username, auth)
+
+    def _connect(self, host: str, port: int, username: str, password: Optional[str], key_path: Optional[str]):
+        client = paramiko.SSHClient()
+        if SSH_KNOWN_HOSTS and os.path.exists(SSH_KNOWN_HOSTS):
+            client.load_host_keys(SSH_KNOWN_HOSTS)
+        client.set_missing_host_key_policy(_POLICIES.get(SSH_HOST_KEY_POLICY, paramiko.AutoAddPolicy)())
+        kwargs = dict(
+            username=username, port=port, timeout=SSH_CONNECT_TIMEOUT_SEC,
+            banner_timeout=SSH_CONNECT_TIMEOUT_SEC, auth_timeout=SSH_CONNECT_TIMEOUT_SEC,
+            look_for_keys=False, allow_agent=False,
+        )
+        if key_path:
+            client.connect(host, pkey=load_private_key(key_path), **kwargs)
+        else:
+            client.connect(host, password=password, **kwargs)
+        client.get_transport().set_keepalive(SSH_KEEPALIVE_SEC)
+        self.stats["connects"] += 1
+        return client
+
+    @staticmethod
+    def _healthy(entry: _Entry) -> bool:
+        transport = entry.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if time.monotonic() - entry.last_used > SSH_HEALTH_CHECK_SEC:
+            try:
+                transport.send_ignore()
+            except _CONNECTION_ERRORS:
+                return False
+        return True
+
+    def _checkout(self, key: PoolKey, connect) -> _Entry:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.users += 1
+                probe = entry.users == 1   # a connection in use by others is known good
+        if entry is not None:
+            # the probe is network I/O, so it runs outside the lock; holding a
+            # use keeps the reaper off the entry meanwhile
+            if not probe or self._healthy(entry):
+                self.stats["reuses"] += 1
+                return entry
+            self._checkin(key, entry, broken=True)
+
+        client = connect()   # outside the lock: other devices don't wait on this handshake
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = _Entry(client)
+                client = None
+            entry.users += 1
+        if client is not None:
+            client.close()   # someone else connected first; share theirs
+        self._start_reaper()
+        return entry
+
+    def _checkin(self, key: PoolKey, entry: _Entry, broken: bool) -> None:
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            if not broken:
+                return
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+                self.stats["dropped"] += 1
+            close = entry.users == 0
+        if close:
+            entry.client.close()
+
+    @contextmanager
+    def session(
+        self,
+        host: str,
+        username: str,
+        password: Optional[str] = None,
+        key_path: Optional[str] = None,
+        port: int = 22,
+    ) -> Iterator[paramiko.SSHClient]:
+        """
+        A connected SSHClient for the duration of the block. Open channels on
+        it (exec_command / invoke_shell) and close them; don't close the client.
+        """
+        key = self._key(host, port, username, password, key_path)
+        entry = self._checkout(key, lambda: self._connect(host, port, username, password, key_path))
+        broken = False
+        try:
+            yield entry.client
+        except _CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self._checkin(key, entry, broken)
+
+    def run(
+        self,
+        host: str,
+        username: str,
+        cmd: str,
+        password: Optional[str] = None,
+        key_path: Optional[str] = None,
+        port: int = 22,
+        timeout: float = SSH_COMMAND_TIMEOUT_SEC,
+    ) -> Tuple[bytes, bytes, int]:
+        """Run one command on a pooled connection: (stdout, stderr, exit status)."""
+        with self.session(host, username, password, key_path, port) as client:
+            _, out, err = client.exec_command(cmd, timeout=timeout)
+            data, errors = out.read(), err.read()
+            return data, errors, out.channel.recv_exit_status()
+
+    # ---- idle expiry ----
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap_loop, name="ssh-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while self.entries:
+            time.sleep(min(SSH_POOL_IDLE_SEC, 30))
+            self.expire_idle()
+
+    def expire_idle(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            idle = [k for k, e in self.entries.items() if e.users == 0 and now - e.last_used > SSH_POOL_IDLE_SEC]
+            expired = [self.entries.pop(k) for k in idle]
+            self.stats["expired"] += len(expired)
+        for entry in expired:
+            entry.client.close()
+        return len(expired)
+
+    def close_all(self) -> None:
+        with self._lock:
+            entries = list(self.entries.values())
+            self.entries.clear()
+        for entry in entries:
+            entry.client.close()
+
+
+ssh_pool = SSHPool()
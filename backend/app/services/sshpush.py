@@ -1,4 +1,4 @@
-import paramiko
+from .sshpool import ssh_pool
 
 
 JUNOS_CFG_ENTER = "configure\n"
@@ -8,25 +8,16 @@ JUNOS_COMMIT = "commit and-quit\n"
 JUNOS_QUIT = "quit\n"
 
 
-def _connect(host, username, password, private_key_path=None):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    if private_key_path:
-        key = paramiko.RSAKey.from_private_key_file(private_key_path)
-        client.connect(host, username=username, pkey=key, look_for_keys=False)
-    else:
-        client.connect(host, username=username, password=password, look_for_keys=False)
-    return client
-
-
 def push_juniper_set_config(host: str, username: str, password: str, private_key_path: str | None, config_text: str, dry_run: bool):
     """Push set-style config lines to JunOS using an interactive shell.
     For dry_run=True, returns the diff without commit.
+    Runs on a pooled connection (services.sshpool); only the shell channel is closed.
     """
-    client = _connect(host, username, password, private_key_path)
-    chan = client.invoke_shell()
+    with ssh_pool.session(host, username, password, private_key_path) as client:
+        return _push(client.invoke_shell(), config_text, dry_run)
 
 
+def _push(chan, config_text: str, dry_run: bool):
     def send(cmd):
         chan.send(cmd)
         while not chan.recv_ready():
@@ -54,5 +45,4 @@ def push_juniper_set_config(host: str, username: str, password: str, private_key
             out += send(JUNOS_COMMIT)
         return {"ok": True, "dry_run": dry_run, "output": out}
     finally:
-        chan.close()
-        client.close()
\ No newline at end of file
+        chan.close()
\ No newline at end of file
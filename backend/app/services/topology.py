@@ -1,32 +1,223 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import os
+import threading
+from collections import deque
 import networkx as nx
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from ..models.device import Device
 from ..models.neighbor import Neighbor
+from .events import bus as event_bus, publish_event
 
-def build_topology(db: Session) -> Dict[str, Any]:
+
+def _norm_name(name: Optional[str]) -> str:
+    return (name or "").strip().lower()
+
+
+_MAC_SEPARATORS = str.maketrans("", "", ":-. ")
+
+
+def _norm_mac(mac: Optional[str]) -> str:
+    """12 lowercase hex digits from any common MAC spelling; '' if it isn't one."""
+    digits = (mac or "").lower().translate(_MAC_SEPARATORS)
+    if len(digits) != 12:
+        return ""
+    try:
+        int(digits, 16)
+    except ValueError:
+        return ""
+    return digits
+
+
+def build_graph(db: Session) -> nx.Graph:
     G = nx.Graph()
 
-    # Nodes: devices we know
-    devices = {d.id: d for d in db.query(Device).all()}
-    for d in devices.values():
-        G.add_node(d.id, label=d.hostname or d.mgmt_ip, vendor=d.vendor, ip=d.mgmt_ip)
-
-    # Edges: LLDP neighbors we’ve captured
-    for n in db.query(Neighbor).all():
-        # Try to match remote by sysname or mgmt_ip if present
-        remote_id = None
-        for d in devices.values():
-            if n.remote_mgmt_ip and d.mgmt_ip == n.remote_mgmt_ip:
-                remote_id = d.id; break
-            if n.remote_sysname and (d.hostname or "").lower() == (n.remote_sysname or "").lower():
-                remote_id = d.id; break
-        if remote_id:
-            u, v = n.local_device_id, remote_id
-            if u and v and u != v:
-                G.add_edge(u, v, local_if=n.local_if, remote_port=n.remote_port)
+    # Nodes: devices we know. Only the columns we need, plus lookup indexes
+    # for resolving the far end of each LLDP neighbor in O(1).
+    by_ip: Dict[str, int] = {}
+    by_name: Dict[str, int] = {}
+    by_short_name: Dict[str, int] = {}
+    by_mac: Dict[str, int] = {}
+    nodes = []
+    for dev_id, hostname, vendor, mgmt_ip, mac in db.execute(
+        select(Device.id, Device.hostname, Device.vendor, Device.mgmt_ip, Device.mac)
+    ):
+        nodes.append((dev_id, {"label": hostname or mgmt_ip, "vendor": vendor, "ip": mgmt_ip}))
+        if mgmt_ip:
+            by_ip.setdefault(mgmt_ip, dev_id)
+        name = _norm_name(hostname)
+        if name:
+            by_name.setdefault(name, dev_id)
+            by_short_name.setdefault(name.split(".", 1)[0], dev_id)
+        key = _norm_mac(mac)
+        if key:
+            by_mac.setdefault(key, dev_id)
+    G.add_nodes_from(nodes)
+
+    # Edges: LLDP neighbors we’ve captured. Match the remote end by mgmt_ip,
+    # then chassis MAC, then sysname (exact, or FQDN vs short hostname).
+    edges = []
+    for local_id, local_if, sysname, remote_port, remote_ip, chassis in db.execute(select(
+        Neighbor.local_device_id, Neighbor.local_if, Neighbor.remote_sysname,
+        Neighbor.remote_port, Neighbor.remote_mgmt_ip, Neighbor.remote_chassis_id,
+    )):
+        remote_id = by_ip.get(remote_ip) if remote_ip else None
+        if remote_id is None and chassis:
+            remote_id = by_mac.get(_norm_mac(chassis))
+        if remote_id is None and sysname:
+            name = _norm_name(sysname)
+            remote_id = by_name.get(name) or by_short_name.get(name.split(".", 1)[0])
+        if remote_id and local_id and local_id != remote_id:
+            edges.append((local_id, remote_id, {"local_if": local_if, "remote_port": remote_port}))
+    G.add_edges_from(edges)
+    return G
+
 
+def graph_to_json(G: nx.Graph) -> Dict[str, Any]:
     # Return a simple JSON structure
     nodes = [{"id": nid, **G.nodes[nid]} for nid in G.nodes]
     edges = [{"source": u, "target": v, **G.edges[u, v]} for u, v in G.edges]
     return {"nodes": nodes, "edges": edges}
+
+
+def build_topology(db: Session) -> Dict[str, Any]:
+    return graph_to_json(build_graph(db))
+
+
+# -------------------------------
+# Versioned snapshot cache
+# -------------------------------
+# Writers (scans, SNMP polls, device CRUD) call invalidate_topology() after
+# committing; that only bumps the version. The next reader rebuilds once under
+# a lock, everyone else waiting on it gets the same snapshot, and clients that
+# already hold the current version get a 304 via the ETag.
+# Every rebuild also records what changed against the previous snapshot, so
+# WebSocket clients can be sent deltas instead of refetching the whole graph.
+# With the Redis event bus the version is a shared counter and every bump is
+# published, so all API workers (and RQ jobs) agree on what is current.
+
+# Deltas kept for clients catching up; anyone further behind gets a snapshot
+TOPOLOGY_DELTA_HISTORY = int(os.getenv("TOPOLOGY_DELTA_HISTORY", "100"))
+
+
+def _edge_key(e: Dict[str, Any]) -> Tuple[int, int]:
+    s, t = e["source"], e["target"]
+    return (s, t) if s <= t else (t, s)
+
+
+class TopologySnapshot:
+    __slots__ = ("version", "graph", "data", "body", "etag", "nodes", "edges")
+
+    def __init__(self, version: int, graph: nx.Graph, data: Dict[str, Any], etag: str) -> None:
+        self.version = version
+        self.graph = graph
+        self.data = data
+        self.body = json.dumps(data).encode()
+        self.etag = etag
+        self.nodes = {n["id"]: n for n in data["nodes"]}
+        self.edges = {_edge_key(e): e for e in data["edges"]}
+
+
+def diff_snapshots(old: TopologySnapshot, new: TopologySnapshot) -> Dict[str, Any]:
+    """
+    {"from", "version", "nodes": {"added", "changed", "removed"}, "edges": {...}}.
+    Added/changed carry full node/edge dicts; removed carries node ids and
+    [source, target] pairs (source <= target).
+    """
+    def side(before: dict, after: dict, removed_form) -> Dict[str, list]:
+        return {
+            "added": [v for k, v in after.items() if k not in before],
+            "changed": [v for k, v in after.items() if k in before and before[k] != v],
+            "removed": [removed_form(k) for k in before if k not in after],
+        }
+
+    return {
+        "from": old.version,
+        "version": new.version,
+        "nodes": side(old.nodes, new.nodes, lambda k: k),
+        "edges": side(old.edges, new.edges, list),
+    }
+
+
+class TopologyCache:
+    def __init__(self) -> None:
+        self._epoch: Optional[str] = None
+        self.version = 1
+        self.snapshot: Optional[TopologySnapshot] = None
+        self.deltas: deque = deque(maxlen=TOPOLOGY_DELTA_HISTORY)
+        self._version_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    @property
+    def epoch(self) -> str:
+        # ETag prefix: shared across workers on the Redis bus, else per process,
+        # so ETags from before a restart never match
+        if self._epoch is None:
+            self._epoch = event_bus.shared_epoch() or os.urandom(4).hex()
+        return self._epoch
+
+    def etag_for(self, version: int) -> str:
+        return f'"{self.epoch}-{version}"'
+
+    def invalidate(self) -> int:
+        shared = event_bus.next_version()
+        with self._version_lock:
+            self.version = max(self.version + 1, shared or 0)
+            version = self.version
+        publish_event({"type": "topology_changed", "version": version})
+        return version
+
+    def observe(self, version: int) -> bool:
+        """Adopt a version bumped elsewhere (another worker, a job); True if it was news."""
+        with self._version_lock:
+            if version <= self.version:
+                return False
+            self.version = version
+            return True
+
+    def get(self, db: Session) -> TopologySnapshot:
+        snap = self.snapshot
+        if snap is not None and snap.version == self.version:
+            return snap
+        with self._build_lock:
+            snap = self.snapshot
+            version = self.version
+            if snap is not None and snap.version == version:
+                return snap   # built by whoever held the lock before us
+            # Writers may bump the version mid-build; the snapshot keeps the
+            # version it started from, so the next reader rebuilds again.
+            G = build_graph(db)
+            data = {"version": version, **graph_to_json(G)}
+            snap = TopologySnapshot(version, G, data, self.etag_for(version))
+            if self.snapshot is not None:
+                self.deltas.append(diff_snapshots(self.snapshot, snap))
+            self.snapshot = snap
+            return snap
+
+    def deltas_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Deltas taking a client from `version` to the current snapshot, oldest
+        first ([] if it is current). None when `version` is no longer covered
+        by the history; the client needs a full snapshot then.
+        """
+        snap = self.snapshot
+        if snap is not None and version == snap.version:
+            return []
+        deltas = list(self.deltas)
+        for i, d in enumerate(deltas):
+            if d["from"] == version:
+                return deltas[i:]
+        return None
+
+
+cache = TopologyCache()
+
+
+def invalidate_topology() -> int:
+    """Mark the cached topology stale; returns the new version."""
+    return cache.invalidate()
+
+
+def topology_version() -> int:
+    return cache.version
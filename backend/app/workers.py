@@ -1,10 +1,396 @@
-# Minimal RQ worker target – you can expand each case to call your services
-from typing import Dict, Any
-from time import sleep
+# RQ worker target: routes typed jobs to the services that do the work.
+# Run workers with `rq worker high default bulk` (same REDIS_URL / DATABASE_URL
+# as the API); queue names and priorities are in services/queues.py.
+#
+# Each kind gets its payload dict and a progress callback. Progress lands in
+# job.meta["progress"] (read by GET /jobs/{id}) and is pushed to WebSocket
+# clients subscribed to the "jobs" topic; the handler's return value is the
+# job result, kept for JOB_RESULT_TTL_SEC.
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime, timezone
+import asyncio
+import os
+import time
+
+from rq import get_current_job
+from rq.job import Job
+
+from .db import SessionLocal
+from .models.device import Device
+from .services import discovery, scanner
+from .services.configsync import backup_juniper
+from .services.jobcontrol import limiter
+from .services.inventory import persist_scan_results, persist_snmp_results
+from .services.pfsense import pull_pfsense_bundle
+from .services.snmp import SNMP_COMMUNITY, SNMP_CONCURRENCY, SNMP_HOST_TIMEOUT_SEC, poll_many
+from .ws import broadcast_event
+
+JOB_TIMEOUT_SEC = int(os.getenv("JOB_TIMEOUT_SEC", "3600"))
+JOB_RESULT_TTL_SEC = int(os.getenv("JOB_RESULT_TTL_SEC", "86400"))
+JOB_FAILURE_TTL_SEC = int(os.getenv("JOB_FAILURE_TTL_SEC", "604800"))
+# Progress is written (and broadcast) at most this often, plus once at the end
+JOB_PROGRESS_INTERVAL_SEC = float(os.getenv("JOB_PROGRESS_INTERVAL_SEC", "0.5"))
+# Scan/SNMP results are committed in batches of this many hosts
+JOB_PERSIST_BATCH = int(os.getenv("JOB_PERSIST_BATCH", "50"))
+# Fleet jobs: devices per child job (scans: /SCAN_SHARD_PREFIX shards per child)
+JOB_FLEET_CHUNK = int(os.getenv("JOB_FLEET_CHUNK", "25"))
+
+Progress = Callable[..., None]
+
+# Payload keys holding credentials. RQ keeps a job's arguments in its hash for
+# as long as the result (or failure) is kept, so dispatch drops these once the
+# job has run; Redis only holds them while the job waits. Requeueing a
+# finished job therefore runs it with the defaults.
+SECRET_KEYS = ("community", "password")
+
+
+class _Progress:
+    def __init__(self, kind: str) -> None:
+        self.job = get_current_job()
+        self.kind = kind
+        self.last = 0.0
+
+    def __call__(self, done: int, total: Optional[int] = None, force: bool = False, **info: Any) -> None:
+        now = time.monotonic()
+        if not force and now - self.last < JOB_PROGRESS_INTERVAL_SEC and done != total:
+            return
+        self.last = now
+        progress = {"done": done, "total": total, **info}
+        job_id = None
+        if self.job is not None:
+            job_id = self.job.id
+            self.job.meta["progress"] = progress
+            self.job.save_meta()
+        broadcast_event(
+            {"event": "job_progress", "job_id": job_id, "kind": self.kind, **progress},
+            coalesce=f"job:{job_id}", topic="jobs",
+        )
+
+
+def _require(payload: Dict[str, Any], *keys: str) -> None:
+    missing = [k for k in keys if not payload.get(k)]
+    if missing:
+        raise ValueError(f"payload is missing {', '.join(missing)}")
+
+
+# ---------------------------
+# Handlers
+# ---------------------------
+
+async def _discover(targets: List[str], ports: Optional[List[int]], progress: Progress) -> dict:
+    # "discover" profile: TCP-connect probes (services.discovery), as POST /scan does
+    hosts: List[str] = []
+    batch: Dict[str, dict] = {}
+
+    def flush() -> None:
+        db = SessionLocal()
+        try:
+            persist_scan_results(db, batch, datetime.now(timezone.utc), "discover")
+        finally:
+            db.close()
+
+    async for ip in discovery.iter_live_hosts(targets, ports):
+        batch[ip] = {}
+        hosts.append(ip)
+        if len(batch) >= JOB_PERSIST_BATCH:
+            await asyncio.to_thread(flush)
+            batch = {}
+        progress(len(hosts), note=ip)
+    if batch:
+        await asyncio.to_thread(flush)
+    progress(len(hosts), len(hosts), force=True)
+    return {"ok": True, "count": len(hosts), "hosts": hosts}
+
+
+def _scan(payload: Dict[str, Any], progress: Progress) -> dict:
+    """payload: targets (list or "a b c"), profile, skip_ping, discovery_ports. Hosts are persisted as found."""
+    _require(payload, "targets")
+    targets = payload["targets"]
+    if isinstance(targets, str):
+        targets = targets.replace(",", " ").split()
+    profile = payload.get("profile", "standard")
+    if profile == "discover":
+        return asyncio.run(_discover(targets, payload.get("discovery_ports"), progress))
+    hosts: List[str] = []
+    batch: Dict[str, dict] = {}
+    db = SessionLocal()
+    try:
+        for ip, host in scanner.iter_sharded_scan(targets, profile, bool(payload.get("skip_ping"))):
+            batch[ip] = host
+            hosts.append(ip)
+            if len(batch) >= JOB_PERSIST_BATCH:
+                persist_scan_results(db, batch, datetime.now(timezone.utc), profile)
+                batch = {}
+            progress(len(hosts), note=ip)
+        if batch:
+            persist_scan_results(db, batch, datetime.now(timezone.utc), profile)
+        progress(len(hosts), len(hosts), force=True)
+    finally:
+        db.close()
+    return {"ok": True, "count": len(hosts), "hosts": hosts}
+
+
+async def _snmp_poll(hosts: List[str], community: str, progress: Progress) -> dict:
+    polled: List[str] = []
+    changed = 0
+    errors: Dict[str, str] = {}
+    batch: Dict[str, dict] = {}
+
+    def flush() -> int:
+        db = SessionLocal()
+        try:
+            persisted = persist_snmp_results(db, batch, datetime.now(timezone.utc))
+            return sum(1 for p in persisted.values() if p["changed"])
+        finally:
+            db.close()
+
+    # per-device/per-subnet slots are shared with every other job polling these hosts
+    polls = poll_many(hosts, community, SNMP_CONCURRENCY, SNMP_HOST_TIMEOUT_SEC, guard=limiter.aslot)
+    async for host, res, err in polls:
+        if err:
+            errors[host] = err
+        else:
+            batch[host] = res
+            polled.append(host)
+            if len(batch) >= JOB_PERSIST_BATCH:
+                changed += await asyncio.to_thread(flush)
+                batch = {}
+        progress(len(polled) + len(errors), len(hosts), failed=len(errors))
+    if batch:
+        changed += await asyncio.to_thread(flush)
+    return {"ok": not errors, "polled": len(polled), "changed": changed, "failed": len(errors), "errors": errors}
+
+
+def _snmp(payload: Dict[str, Any], progress: Progress) -> dict:
+    """payload: hosts (or host), or all_known=true; community."""
+    if payload.get("all_known"):
+        db = SessionLocal()
+        try:
+            hosts = [ip for (ip,) in db.query(Device.mgmt_ip).filter(Device.mgmt_ip.isnot(None)).all()]
+        finally:
+            db.close()
+    else:
+        hosts = payload.get("hosts") or ([payload["host"]] if payload.get("host") else [])
+        if not hosts:
+            raise ValueError("payload needs hosts, host or all_known")
+    hosts = list(dict.fromkeys(h.strip() for h in hosts if h.strip()))
+    return asyncio.run(_snmp_poll(hosts, payload.get("community") or SNMP_COMMUNITY, progress))
+
+
+def _pfsense(payload: Dict[str, Any], progress: Progress) -> dict:
+    """payload: host, username, password, private_key_path."""
+    _require(payload, "host", "username")
+    progress(0, 1, force=True)
+    with limiter.slot(payload["host"]):
+        result = pull_pfsense_bundle(
+            payload["host"], payload["username"], payload.get("password", ""), payload.get("private_key_path"),
+        )
+    progress(1, 1)
+    return result
+
+
+def _backup_one(db, device_id: int, host: Optional[str], payload: Dict[str, Any]) -> dict:
+    device = db.get(Device, device_id)
+    if device is None:
+        raise ValueError(f"device {device_id} not found")
+    host = host or device.mgmt_ip
+    if not host:
+        raise ValueError(f"device {device.id} has no mgmt_ip; pass host")
+    with limiter.slot(host):
+        return backup_juniper(
+            db, device.id, host, payload["username"], payload.get("password"), payload.get("private_key_path"),
+        )
+
+
+def _juniper_backup(payload: Dict[str, Any], progress: Progress) -> dict:
+    """
+    payload: device_id (host defaults to the device's mgmt_ip) or device_ids,
+    username, password or private_key_path. With device_ids, one failing
+    device doesn't stop the rest; failures are listed under "errors".
+    """
+    if not payload.get("device_ids"):
+        _require(payload, "device_id", "username")
+        db = SessionLocal()
+        try:
+            progress(0, 1, force=True)
+            result = _backup_one(db, payload["device_id"], payload.get("host"), payload)
+        finally:
+            db.close()
+        progress(1, 1)
+        return result
+
+    _require(payload, "username")
+    ids = payload["device_ids"]
+    backups: Dict[str, dict] = {}
+    errors: Dict[str, str] = {}
+    db = SessionLocal()
+    try:
+        for n, device_id in enumerate(ids, 1):
+            try:
+                backups[str(device_id)] = _backup_one(db, device_id, None, payload)
+            except Exception as exc:
+                db.rollback()
+                errors[str(device_id)] = str(exc) or type(exc).__name__
+            progress(n, len(ids), failed=len(errors))
+    finally:
+        db.close()
+    return {"ok": not errors, "backed_up": len(backups), "failed": len(errors), "backups": backups, "errors": errors}
+
+
+HANDLERS: Dict[str, Callable[[Dict[str, Any], Progress], dict]] = {
+    "scan": _scan,
+    "snmp": _snmp,
+    "pfsense": _pfsense,
+    "juniper_backup": _juniper_backup,
+}
+JOB_KINDS = tuple(HANDLERS)
+
+
+def _scrub_secrets(job: Job) -> None:
+    """
+    Drop SECRET_KEYS from the job's stored payload. The worker holds this same
+    Job object and saves it (arguments included) when recording the outcome.
+    """
+    task = job.args[0] if job.args and isinstance(job.args[0], dict) else None
+    payload = task.get("payload") if task is not None else None
+    if isinstance(payload, dict) and any(k in payload for k in SECRET_KEYS):
+        clean = {k: v for k, v in payload.items() if k not in SECRET_KEYS}
+        job.args = ({**task, "payload": clean},) + tuple(job.args[1:])
+
 
 def dispatch(task: Dict[str, Any]):
     kind = task.get("kind")
-    payload = task.get("payload", {})
-    # TODO: call into scanner/snmp/configsync as needed
-    sleep(1)
-    return {"done": True, "kind": kind, "payload": payload}
+    payload = task.get("payload") or {}
+    handler = HANDLERS.get(kind)
+    job = get_current_job()
+    job_id = job.id if job is not None else None
+    try:
+        if handler is None:
+            raise ValueError(f"unknown job kind {kind!r}")
+        try:
+            result = handler(payload, _Progress(kind))
+        except Exception as exc:
+            broadcast_event(
+                {"event": "job_failed", "job_id": job_id, "kind": kind, "error": str(exc) or type(exc).__name__},
+                topic="jobs",
+            )
+            raise   # RQ records the traceback and moves the job to the failed registry
+    finally:
+        if job is not None:
+            _scrub_secrets(job)
+    broadcast_event({"event": "job_finished", "job_id": job_id, "kind": kind}, topic="jobs")
+    return result
+
+
+# ---------------------------
+# Fleet jobs (fan-out / fan-in)
+# ---------------------------
+# A fleet job splits its device set into chunks and enqueues one dispatch job
+# per chunk, so every worker process takes a share. An aggregate job depends
+# on all of them (failures included) and merges their results, failures and
+# timings into one report; its id is the one clients poll.
+
+# kind -> payload key holding the list that gets chunked
+FLEET_KINDS = {"scan": "targets", "snmp": "hosts", "juniper_backup": "device_ids"}
+# kind -> payload keys every child needs; checked up front so a fleet that
+# would only fail in each child is rejected before anything is queued
+FLEET_REQUIRED = {"juniper_backup": ("username",)}
+
+
+def plan_fleet(db, kind: str, payload: Dict[str, Any], chunk_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Child payloads for a fleet job; all_known=true takes every (Juniper) device."""
+    key = FLEET_KINDS.get(kind)
+    if key is None:
+        raise ValueError(f"kind {kind!r} can't run as a fleet job; expected one of {', '.join(FLEET_KINDS)}")
+    _require(payload, *FLEET_REQUIRED.get(kind, ()))
+    if kind == "scan":
+        _require(payload, "targets")
+        targets = payload["targets"]
+        if isinstance(targets, str):
+            targets = targets.replace(",", " ").split()
+        shards = scanner.shard_targets(targets)
+        size = chunk_size or 1
+        chunks = [sum(shards[i:i + size], []) for i in range(0, len(shards), size)]
+    else:
+        items = payload.get(key)
+        if not items and payload.get("all_known"):
+            if kind == "snmp":
+                items = [ip for (ip,) in db.query(Device.mgmt_ip).filter(Device.mgmt_ip.isnot(None)).all()]
+            else:
+                items = [i for (i,) in db.query(Device.id).filter(Device.vendor.ilike("%juniper%")).all()]
+        if not items:
+            raise ValueError(f"payload needs {key} or all_known")
+        items = list(dict.fromkeys(items))
+        size = chunk_size or JOB_FLEET_CHUNK
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    base = {k: v for k, v in payload.items() if k not in (key, "all_known", "host", "device_id")}
+    return [{**base, key: chunk} for chunk in chunks]
+
+
+def _merge(into: Dict[str, Any], part: Dict[str, Any]) -> None:
+    for k, v in part.items():
+        if isinstance(v, bool):
+            into[k] = into.get(k, True) and v
+        elif isinstance(v, (int, float)):
+            into[k] = into.get(k, 0) + v
+        elif isinstance(v, list):
+            into.setdefault(k, []).extend(v)
+        elif isinstance(v, dict):
+            into.setdefault(k, {}).update(v)
+
+
+def _job_error(job: Job) -> Optional[str]:
+    exc_info = job.exc_info
+    return exc_info.strip().splitlines()[-1] if exc_info else None
+
+
+def aggregate(kind: str, child_ids: List[str]) -> dict:
+    """Fan-in: one report from the children of a fleet job."""
+    job = get_current_job()
+    key = FLEET_KINDS[kind]
+    children = Job.fetch_many(child_ids, connection=job.connection)
+    merged: Dict[str, Any] = {}
+    chunks: List[dict] = []
+    failures: List[dict] = []
+    starts, ends = [], []
+    items = 0
+    for child_id, child in zip(child_ids, children):
+        if child is None:
+            failures.append({"job_id": child_id, "status": "expired", "error": "child job expired"})
+            continue
+        chunk_items = child.args[0]["payload"][key] if child.args else []
+        items += len(chunk_items)
+        seconds = None
+        if child.started_at and child.ended_at:
+            starts.append(child.started_at)
+            ends.append(child.ended_at)
+            seconds = round((child.ended_at - child.started_at).total_seconds(), 3)
+        status = child.get_status()
+        status = getattr(status, "value", status)
+        chunks.append({"job_id": child_id, "status": status, "items": len(chunk_items), "seconds": seconds})
+        if child.is_finished:
+            _merge(merged, child.return_value() or {})
+        else:
+            failures.append({"job_id": child_id, "status": status, "error": _job_error(child), "items": chunk_items})
+
+    wall = (max(ends) - min(starts)).total_seconds() if starts else 0.0
+    work = sum(c["seconds"] or 0 for c in chunks)
+    report = {
+        "ok": not failures and merged.get("ok", True),
+        "kind": kind,
+        "children": len(child_ids),
+        "succeeded": len(child_ids) - len(failures),
+        "failed": len(failures),
+        "items": items,
+        "wall_sec": round(wall, 3),
+        "work_sec": round(work, 3),
+        "parallelism": round(work / wall, 2) if wall else None,
+        "result": merged,
+        "failures": failures,
+        "chunks": chunks,
+    }
+    broadcast_event(
+        {"event": "job_finished", "job_id": job.id, "kind": kind, "fleet": True, "failed": len(failures)},
+        topic="jobs",
+    )
+    return report
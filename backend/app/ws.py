@@ -1,93 +1,347 @@
 # backend/app/ws.py
 from __future__ import annotations
-from typing import Set, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 import asyncio
+import json
+import os
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from .db import SessionLocal
+from .services.events import publish_event
+from .services.layout import layout_cache
+from .services.topology import TopologySnapshot, cache as topology_cache
 
 router = APIRouter()
 PING_INTERVAL_SEC = 30
+# Messages buffered per socket; a client that falls this far behind is dropped
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "256"))
+WS_SEND_TIMEOUT_SEC = float(os.getenv("WS_SEND_TIMEOUT_SEC", "10"))
+# Coalesced events (and topology publishes) go out at most once per window
+WS_COALESCE_SEC = float(os.getenv("WS_COALESCE_SEC", "0.25"))
+# What a socket can subscribe to; new sockets get all of them unless they
+# connect with ?topics=a,b. Messages without a topic (pings) go to everyone.
+TOPICS = frozenset({"topology", "scan", "jobs"})
+
+
+class _Connection:
+    __slots__ = ("websocket", "queue", "task", "topics")
+
+    def __init__(self, websocket: WebSocket, topics: Iterable[str] = TOPICS) -> None:
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE)
+        self.task: Optional[asyncio.Task] = None
+        self.topics = set(topics) & TOPICS
+
 
 class ConnectionManager:
+    """
+    Fan-out to every socket without waiting on any of them: broadcast encodes
+    the message once and drops it into each connection's bounded queue, and a
+    per-connection sender task drains it. A socket whose queue overflows or
+    whose send stalls past WS_SEND_TIMEOUT_SEC is evicted (closed with 1013)
+    instead of holding everyone else up. One shared heartbeat task pings all
+    sockets, so an idle connection costs its reader and sender and nothing else.
+    """
+
     def __init__(self) -> None:
-        self.active_connections: Set[WebSocket] = set()
-        self._lock = asyncio.Lock()
+        self.connections: Dict[WebSocket, _Connection] = {}
+        self._coalesced: Dict[str, tuple] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.stats = {"sent": 0, "evicted": 0, "coalesced": 0}
+
+    @property
+    def active_connections(self):
+        return self.connections.keys()
 
-    async def connect(self, websocket: WebSocket) -> None:
+    async def connect(self, websocket: WebSocket, topics: Iterable[str] = TOPICS) -> None:
         await websocket.accept()
-        async with self._lock:
-            self.active_connections.add(websocket)
+        conn = _Connection(websocket, topics)
+        conn.task = asyncio.create_task(self._sender(conn))
+        self.connections[websocket] = conn
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._pinger())
 
     async def disconnect(self, websocket: WebSocket) -> None:
-        async with self._lock:
-            self.active_connections.discard(websocket)
+        conn = self.connections.pop(websocket, None)
+        if conn is not None and conn.task is not None:
+            conn.task.cancel()
 
-    async def broadcast(self, message: Dict[str, Any]) -> None:
-        if not self.active_connections:
-            return
-        # Send concurrently; drop dead sockets
-        to_remove = []
-        payload = message
-        for ws in list(self.active_connections):
+    async def _pinger(self) -> None:
+        # keeps NATs alive; stops once the last socket is gone
+        while self.connections:
+            await asyncio.sleep(PING_INTERVAL_SEC)
+            self._fanout("ping")
+
+    async def _sender(self, conn: _Connection) -> None:
+        while True:
+            text = await conn.queue.get()
             try:
-                await ws.send_json(payload)
+                await asyncio.wait_for(conn.websocket.send_text(text), WS_SEND_TIMEOUT_SEC)
+            except asyncio.CancelledError:
+                raise
             except Exception:
-                to_remove.append(ws)
-        if to_remove:
-            async with self._lock:
-                for ws in to_remove:
-                    self.active_connections.discard(ws)
+                self._evict(conn)
+                return
+            self.stats["sent"] += 1
+
+    def _evict(self, conn: _Connection) -> None:
+        if self.connections.get(conn.websocket) is not conn:
+            return
+        del self.connections[conn.websocket]
+        self.stats["evicted"] += 1
+        if conn.task is not None and conn.task is not asyncio.current_task():
+            conn.task.cancel()
+        asyncio.get_running_loop().create_task(self.close(conn.websocket))
+
+    @staticmethod
+    async def close(websocket: WebSocket, code: int = 1013) -> None:
+        """Close without raising (1013: try again later)."""
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def _enqueue(self, conn: _Connection, text: str) -> None:
+        try:
+            conn.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self._evict(conn)
+
+    def _fanout(self, text: str, topic: Optional[str] = None) -> None:
+        for conn in list(self.connections.values()):
+            if topic is None or topic in conn.topics:
+                self._enqueue(conn, text)
+
+    def _flush(self, key: str) -> None:
+        pending = self._coalesced.pop(key, None)
+        if pending is not None:
+            self._fanout(*pending)
+
+    async def broadcast(
+        self, message: Dict[str, Any], coalesce: Optional[str] = None, topic: Optional[str] = None,
+    ) -> None:
+        """
+        Queue `message` for every socket subscribed to `topic` (all sockets if
+        None); never blocks on slow clients. With a `coalesce` key, messages
+        sharing the key within WS_COALESCE_SEC collapse into one (the latest),
+        sent when the window closes.
+        """
+        if not self.connections:
+            return
+        text = json.dumps(message)
+        if coalesce is None:
+            self._fanout(text, topic)
+            return
+        if coalesce in self._coalesced:
+            self.stats["coalesced"] += 1
+        else:
+            asyncio.get_running_loop().call_later(WS_COALESCE_SEC, self._flush, coalesce)
+        self._coalesced[coalesce] = (text, topic)
+
+    def subscribe(self, websocket: WebSocket, add: Iterable[str] = (), remove: Iterable[str] = ()) -> list:
+        conn = self.connections.get(websocket)
+        if conn is None:
+            return []
+        conn.topics |= set(add) & TOPICS
+        conn.topics -= set(remove)
+        return sorted(conn.topics)
+
+    async def send(self, websocket: WebSocket, message: Any) -> None:
+        """Queue a message (dict, or plain text) for one socket, in order with broadcasts."""
+        conn = self.connections.get(websocket)
+        if conn is not None:
+            self._enqueue(conn, message if isinstance(message, str) else json.dumps(message))
 
 manager = ConnectionManager()
 
+# ---------------------------
+# Topology deltas
+# ---------------------------
+# Clients load GET /topology/ (which carries "version"), then apply
+# {"event": "topology_delta", "from", "version", "nodes", "edges"} messages in
+# order. A client whose version doesn't match a delta's "from" sends
+# {"cmd": "sync", "version": N} and gets the missing deltas, or a
+# {"event": "topology_snapshot", ...} with the full graph if N is too old.
+
+def _current_snapshot() -> TopologySnapshot:
+    db = SessionLocal()
+    try:
+        return topology_cache.get(db)
+    finally:
+        db.close()
+
+
+def _delta_is_empty(delta: Dict[str, Any]) -> bool:
+    return not any(delta[part][kind] for part in ("nodes", "edges") for kind in ("added", "changed", "removed"))
+
+
+def _drop_empty_deltas(deltas: list, start: Optional[int] = None) -> tuple:
+    """
+    Drop deltas where the version moved but the graph didn't; the next real
+    delta takes over their "from", so clients still see an unbroken chain.
+    Returns (deltas to send, "from" still waiting for a real delta).
+    """
+    out = []
+    for d in deltas:
+        if _delta_is_empty(d):
+            if start is None:
+                start = d["from"]
+            continue
+        out.append(d if start is None else {**d, "from": start})
+        start = None
+    return out, start
+
+
+class TopologyPublisher:
+    def __init__(self) -> None:
+        self.sent_version: Optional[int] = None
+        self.carry_from: Optional[int] = None   # see _drop_empty_deltas
+        self._lock: Optional[asyncio.Lock] = None
+        self._pending: Optional[asyncio.Task] = None
+
+    def request(self) -> None:
+        """Debounced publish: a burst of writes within WS_COALESCE_SEC costs one rebuild."""
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().create_task(self._delayed())
+
+    async def _delayed(self) -> None:
+        await asyncio.sleep(WS_COALESCE_SEC)
+        self._pending = None   # writes landing during the publish schedule another one
+        try:
+            await self.publish()
+        except Exception:
+            pass  # DB hiccup; the next write (or a client sync) catches up
+
+    async def publish(self) -> None:
+        """Rebuild the snapshot if stale and broadcast what changed since the last publish."""
+        if not manager.active_connections:
+            return  # nobody to tell; the next publish or sync catches up from history
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:   # keeps deltas in order across concurrent writers
+            snap = await asyncio.to_thread(_current_snapshot)
+            if self.sent_version == snap.version:
+                return
+            deltas = topology_cache.deltas_since(self.sent_version) if self.sent_version else None
+            if deltas is None:
+                await manager.broadcast(
+                    {"event": "update_topology", "version": snap.version},
+                    coalesce="update_topology", topic="topology",
+                )
+                self.carry_from = None
+            else:
+                deltas, self.carry_from = _drop_empty_deltas(deltas, self.carry_from)
+                for d in deltas:
+                    await manager.broadcast({"event": "topology_delta", **d}, topic="topology")
+            self.sent_version = snap.version
+
+
+publisher = TopologyPublisher()
+
+
+def _topic_list(value: Any) -> list:
+    if isinstance(value, str):
+        return [value]
+    return [t for t in value if isinstance(t, str)] if isinstance(value, list) else []
+
+
+async def _handle_command(websocket: WebSocket, text: str) -> None:
+    try:
+        msg = json.loads(text)
+    except ValueError:
+        return  # plain keepalive text
+    if not isinstance(msg, dict):
+        return
+    cmd = msg.get("cmd")
+    if cmd in ("subscribe", "unsubscribe"):
+        topics = _topic_list(msg.get("topics"))
+        if cmd == "subscribe":
+            current = manager.subscribe(websocket, add=topics)
+        else:
+            current = manager.subscribe(websocket, remove=topics)
+        await manager.send(websocket, {"event": "subscribed", "topics": current})
+        return
+    if cmd != "sync":
+        return
+    snap = await asyncio.to_thread(_current_snapshot)
+    version = msg.get("version")
+    deltas = topology_cache.deltas_since(version) if isinstance(version, int) else None
+    if deltas is None:
+        await manager.send(websocket, {"event": "topology_snapshot", **snap.data})
+        return
+    for d in _drop_empty_deltas(deltas)[0]:
+        await manager.send(websocket, {"event": "topology_delta", **d})
+
+
+@router.get("/ws/stats")
+async def ws_stats():
+    """Connected sockets plus messages sent, coalesced and slow consumers evicted."""
+    return {"connections": len(manager.connections), **manager.stats}
+
+
 @router.websocket("/ws/topology")
 async def topology_ws(websocket: WebSocket):
     """
     Simple WS endpoint:
-      - accepts connection
-      - sends periodic ping text to keep NATs alive
-      - listens for optional client pings/echo (ignored)
+      - accepts connection (optionally ?topics=topology,scan,jobs; default all)
+      - periodic ping text from the shared heartbeat keeps NATs alive
+      - answers {"cmd": "sync", "version": N} with deltas or a full snapshot
+      - {"cmd": "subscribe" | "unsubscribe", "topics": [...]} adjusts what
+        this socket receives, answered with {"event": "subscribed", "topics"}
     """
-    await manager.connect(websocket)
+    param = websocket.query_params.get("topics")
+    await manager.connect(websocket, param.split(",") if param else TOPICS)
     try:
+        # this coroutine is the socket's only reader; sends go through the queue
         while True:
-            # race: either client sends a message or ping timer ticks
-            ping = asyncio.create_task(asyncio.sleep(PING_INTERVAL_SEC))
-            recv = asyncio.create_task(websocket.receive_text())
-            done, pending = await asyncio.wait({ping, recv}, return_when=asyncio.FIRST_COMPLETED)
-            for task in pending:
-                task.cancel()
-            if recv in done:
-                # ignore content; could add commands later
-                try:
-                    _ = recv.result()
-                except Exception:
-                    # client closed
-                    break
-            else:
-                # ping timer fired
-                try:
-                    await websocket.send_text("ping")
-                except Exception:
-                    break
-    except WebSocketDisconnect:
-        pass
+            try:
+                text = await websocket.receive_text()
+            except (WebSocketDisconnect, RuntimeError):
+                break   # client closed, or we closed it as a slow consumer
+            except KeyError:
+                # a binary frame has no "text"; we only speak JSON text
+                await manager.close(websocket, code=1003)
+                break
+            except Exception:
+                break   # anything else wrong with the socket ends this reader
+            await _handle_command(websocket, text)
     finally:
         await manager.disconnect(websocket)
 
+# ---------------------------
+# Event bus
+# ---------------------------
+# Everything that should reach browsers goes through services.events, so an
+# event raised in any API worker or RQ job reaches the sockets of every worker.
+# Each worker's subscriber lands here and fans out to its own connections.
+
+async def handle_event(event: Dict[str, Any]) -> None:
+    kind = event.get("type")
+    if kind == "broadcast":
+        await manager.broadcast(event["message"], coalesce=event.get("coalesce"), topic=event.get("topic"))
+    elif kind == "topology_changed":
+        version = event.get("version")
+        if isinstance(version, int):
+            topology_cache.observe(version)
+        publisher.request()
+        if layout_cache.result is not None:
+            layout_cache.refresh()   # only once this worker has served a layout
+
+
+def broadcast_event(
+    message: Dict[str, Any], coalesce: Optional[str] = None, topic: Optional[str] = None,
+) -> None:
+    """Send `message` to subscribed sockets on every API worker; safe from any thread or process."""
+    publish_event({"type": "broadcast", "message": message, "coalesce": coalesce, "topic": topic})
+
 # Convenience helpers to trigger broadcasts from endpoints/services
 
 async def notify_topology_update() -> None:
     """Async helper (use inside async endpoints)."""
-    await manager.broadcast({"event": "update_topology"})
+    notify_topology_update_background()
 
 def notify_topology_update_background() -> None:
     """
-    Fire-and-forget helper usable with BackgroundTasks or threads.
-    Schedules the async broadcast on the running loop.
+    Fire-and-forget helper usable with BackgroundTasks, threads or jobs.
+    Every API worker rebuilds and publishes whatever changed.
     """
-    try:
-        loop = asyncio.get_event_loop()
-        loop.create_task(manager.broadcast({"event": "update_topology"}))
-    except RuntimeError:
-        # No running loop (rare under uvicorn); safely ignore
-        pass
+    publish_event({"type": "topology_changed", "version": topology_cache.version})
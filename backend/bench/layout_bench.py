@@ -0,0 +1,73 @@
+"""
+Server-side layout benchmark.
+
+Times services.layout.force_layout on synthetic topologies: a spanning tree
+plus random extra links (about 1.5 edges per node), every node movable, the
+iteration count and temperature compute_layout uses for a full layout.
+Also reports one incremental run (1% new nodes) on the result.
+
+Run from backend/:
+    python bench/layout_bench.py --nodes 1000 3000 5000 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services import layout
+
+
+def _graph(n: int, rng) -> np.ndarray:
+    tree = [(i, int(rng.integers(0, i))) for i in range(1, n)]
+    extra = rng.integers(0, n, size=(n // 2, 2))
+    edges = np.array(tree + [tuple(e) for e in extra if e[0] != e[1]], dtype=np.int64)
+    return edges.reshape(-1, 2)
+
+
+def _stretch(pos: np.ndarray, edges: np.ndarray) -> float:
+    d = pos[edges[:, 0]] - pos[edges[:, 1]]
+    return float(np.median(np.hypot(d[:, 0], d[:, 1])) / layout.LAYOUT_EDGE_LENGTH)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--nodes", type=int, nargs="+", default=[1000, 3000, 5000, 10000])
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    length = layout.LAYOUT_EDGE_LENGTH
+    print(f"{'nodes':>7} {'edges':>7} {'iters':>6} {'full p50':>10} {'incr p50':>10} {'median edge/L':>14}")
+    for n in args.nodes:
+        rng = np.random.default_rng(n)
+        edges = _graph(n, rng)
+        iterations, temperature = layout.full_layout_schedule(n, length)
+        movable = np.ones(n, dtype=bool)
+        side = length * np.sqrt(n)
+        layout.force_layout(rng.uniform(-side / 2, side / 2, (n, 2)), edges, movable, 2, temperature, length)  # warm FFT kernels
+
+        times, pos = [], None
+        for _ in range(args.repeat):
+            pos = rng.uniform(-side / 2, side / 2, (n, 2))
+            t = time.perf_counter()
+            layout.force_layout(pos, edges, movable, iterations, temperature, length)
+            times.append(time.perf_counter() - t)
+
+        new = np.zeros(n, dtype=bool)
+        new[rng.choice(n, max(1, n // 100), replace=False)] = True
+        incr = []
+        for _ in range(args.repeat):
+            p2 = pos.copy()
+            t = time.perf_counter()
+            layout.force_layout(p2, edges, new, layout.LAYOUT_INCREMENTAL_ITERATIONS, length, length)
+            incr.append(time.perf_counter() - t)
+
+        print(f"{n:>7} {len(edges):>7} {iterations:>6} {np.median(times) * 1000:>8.0f}ms "
+              f"{np.median(incr) * 1000:>8.0f}ms {_stretch(pos, edges):>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Topology build benchmark (user-013/014).
+
+Seeds N devices and M LLDP neighbor rows into a throwaway SQLite database (or
+--db), then times:
+  - build_graph()             neighbor resolution + networkx graph
+  - rebuild                   what the first GET after a change pays
+                              (build_graph + JSON + snapshot encoding)
+  - cached get                TopologyCache.get() when nothing changed
+  - GET /topology/            through the FastAPI app, 200 and 304 paths
+
+Run from backend/:
+    python bench/topology_bench.py --devices 10000 --neighbors 50000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--devices", type=int, default=10_000)
+    p.add_argument("--neighbors", type=int, default=50_000)
+    p.add_argument("--repeat", type=int, default=5, help="runs per measurement (requests: x20)")
+    p.add_argument("--db", help="DATABASE_URL to seed (default: temporary SQLite file)")
+    p.add_argument("--seed", type=int, default=1)
+    return p.parse_args()
+
+
+def _ms(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"p50 {pick(0.5):8.1f} ms   p95 {pick(0.95):8.1f} ms   max {samples[-1] * 1000:8.1f} ms"
+
+
+def _time(fn, repeat):
+    out = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t)
+    return out
+
+
+def main() -> None:
+    args = _args()
+    tmp = None
+    if args.db:
+        os.environ["DATABASE_URL"] = args.db
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}"
+    os.environ.setdefault("EVENT_BUS", "local")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import insert
+    from app.db import SessionLocal, enjoy
+    from app.main import app
+    from app.models.device import Device
+    from app.models.neighbor import Neighbor
+    from app.services.topology import build_graph, cache, invalidate_topology
+
+    rnd = random.Random(args.seed)
+    n = args.devices
+
+    def ip(i):
+        return f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+
+    def mac(i):
+        return ":".join(f"{b:02x}" for b in (0x02, 0, i >> 24 & 255, i >> 16 & 255, i >> 8 & 255, i & 255))
+
+    t = time.perf_counter()
+    with enjoy.begin() as conn:
+        conn.execute(insert(Device), [
+            {"id": i + 1, "hostname": f"sw{i}.lab.example", "mgmt_ip": ip(i), "mac": mac(i), "vendor": "Juniper"}
+            for i in range(n)
+        ])
+        rows = []
+        for k in range(args.neighbors):
+            local, remote = rnd.randrange(n), rnd.randrange(n)
+            how = k % 3   # resolve the far end by mgmt_ip, chassis MAC or sysname
+            rows.append({
+                "local_device_id": local + 1,
+                "instance": f"{k % 48 + 1}.{k}",
+                "local_if": f"ge-0/0/{k % 48}",
+                "remote_port": f"ge-0/0/{rnd.randrange(48)}",
+                "remote_sysname": f"SW{remote}" if how == 2 else None,
+                "remote_mgmt_ip": ip(remote) if how == 0 else None,
+                "remote_chassis_id": mac(remote) if how == 1 else None,
+            })
+        conn.execute(insert(Neighbor), rows)
+    print(f"seeded {n} devices, {args.neighbors} neighbors in {time.perf_counter() - t:.1f}s "
+          f"({enjoy.url.render_as_string(hide_password=True)})")
+
+    db = SessionLocal()
+    try:
+        G = build_graph(db)
+        print(f"graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges\n")
+
+        print(f"build_graph      {_ms(_time(lambda: build_graph(db), args.repeat))}")
+
+        def rebuild():
+            invalidate_topology()
+            cache.get(db)
+        print(f"rebuild          {_ms(_time(rebuild, args.repeat))}")
+        print(f"cached get       {_ms(_time(lambda: cache.get(db), args.repeat * 20))}")
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    first = client.get("/topology/")
+    etag = first.headers["etag"]
+    print(f"GET /topology/   {_ms(_time(lambda: client.get('/topology/'), args.repeat * 20))}   "
+          f"({len(first.content) / 1e6:.1f} MB body)")
+    print(f"GET (304)        {_ms(_time(lambda: client.get('/topology/', headers={'If-None-Match': etag}), args.repeat * 20))}")
+
+    if tmp is not None:
+        os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
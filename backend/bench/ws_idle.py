@@ -0,0 +1,105 @@
+"""
+Idle WebSocket connection cost.
+
+Opens N simulated clients (see wsclients.py) that never send anything and
+measures, per 1,000 connections: Python heap (tracemalloc), live asyncio
+tasks, and CPU time spent over --seconds while the heartbeat pings them
+every --ping seconds. The heap figure includes the simulated clients' own
+state, the same in both modes.
+
+--legacy serves the clients with the receive loop /ws/topology used before
+(a fresh sleep task and receive task raced on every iteration, one pinger
+per socket), for comparison.
+
+Run from backend/:
+    python bench/ws_idle.py --clients 5000
+    python bench/ws_idle.py --clients 5000 --legacy
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+
+
+def _args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--clients", type=int, default=5000)
+    p.add_argument("--seconds", type=float, default=10.0, help="idle window measured for CPU")
+    p.add_argument("--ping", type=float, default=1.0, help="heartbeat interval for this run")
+    p.add_argument("--legacy", action="store_true", help="old per-iteration task race")
+    return p.parse_args()
+
+
+def _legacy_router():
+    from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+    from app import ws
+
+    router = APIRouter()
+
+    @router.websocket("/ws/legacy")
+    async def legacy_ws(websocket: WebSocket):
+        await websocket.accept()
+        try:
+            while True:
+                ping = asyncio.create_task(asyncio.sleep(ws.PING_INTERVAL_SEC))
+                recv = asyncio.create_task(websocket.receive_text())
+                done, pending = await asyncio.wait({ping, recv}, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:
+                    task.cancel()
+                if recv in done:
+                    try:
+                        recv.result()
+                    except Exception:
+                        break
+                else:
+                    try:
+                        await websocket.send_text("ping")
+                    except Exception:
+                        break
+        except WebSocketDisconnect:
+            pass
+
+    return router
+
+
+async def run(args: argparse.Namespace) -> None:
+    from wsclients import Client, close_all, connect_all, ws_app
+    from app import ws
+
+    ws.PING_INTERVAL_SEC = args.ping
+    app = ws_app(_legacy_router())
+    path = "/ws/legacy" if args.legacy else "/ws/topology"
+
+    gc.collect()
+    tracemalloc.start()
+    heap0, _ = tracemalloc.get_traced_memory()
+    tasks0 = len(asyncio.all_tasks())
+    clients = [Client(app, path=path) for _ in range(args.clients)]
+    await connect_all(clients)
+    await asyncio.sleep(0.2)
+    gc.collect()
+    heap1, _ = tracemalloc.get_traced_memory()
+    tasks1 = len(asyncio.all_tasks())
+    tracemalloc.stop()   # tracing would dominate the CPU figure
+
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    await asyncio.sleep(args.seconds)
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+
+    per_k = 1000 / args.clients
+    pings = sum(c.received for c in clients) / args.clients
+    print(f"mode            {'legacy' if args.legacy else 'current'}  ({args.clients} clients, ping {args.ping:g}s)")
+    print(f"heap            {(heap1 - heap0) * per_k / 1024:9.0f} KiB per 1000 connections")
+    print(f"asyncio tasks   {(tasks1 - tasks0) * per_k:9.0f} per 1000 connections")
+    print(f"cpu             {cpu * 1000 * per_k / wall:9.1f} ms/s per 1000 connections  ({pings:.1f} pings each)")
+    await close_all(clients)
+
+
+def main() -> None:
+    asyncio.run(run(_args()))
+
+
+if __name__ == "__main__":
+    main()
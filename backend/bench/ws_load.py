@@ -0,0 +1,97 @@
+"""
+WebSocket broadcast load test.
+
+Connects N simulated clients to /ws/topology (see wsclients.py), a share of
+them slow to take each message, then broadcasts M messages on the topology
+topic and reports the broadcast-to-delivery latency of the fast clients, how
+many slow ones were evicted, and how long each broadcast call held the loop.
+
+--serial sends each message by awaiting every socket in turn instead, the way
+broadcast worked before per-connection queues, for comparison.
+
+Run from backend/:
+    python bench/ws_load.py --clients 5000 --slow 0.01
+    python bench/ws_load.py --clients 5000 --slow 0.01 --serial
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+
+def _args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--clients", type=int, default=5000)
+    p.add_argument("--messages", type=int, default=50)
+    p.add_argument("--interval", type=float, default=0.02, help="seconds between broadcasts")
+    p.add_argument("--slow", type=float, default=0.01, help="share of clients that take --slow-delay per message")
+    p.add_argument("--slow-delay", type=float, default=0.5)
+    p.add_argument("--queue", type=int, default=16, help="WS_SEND_QUEUE for this run")
+    p.add_argument("--serial", action="store_true", help="await each socket in turn (old broadcast)")
+    p.add_argument("--seed", type=int, default=1)
+    return p.parse_args()
+
+
+async def run(args: argparse.Namespace) -> None:
+    from wsclients import Client, close_all, connect_all, percentiles, ws_app
+    from app.ws import manager
+
+    async def serial_broadcast(message: dict) -> None:
+        text = json.dumps(message)
+        for conn in list(manager.connections.values()):
+            try:
+                await conn.websocket.send_text(text)
+            except Exception:
+                pass
+
+    rng = random.Random(args.seed)
+    app = ws_app()
+    clients = [
+        Client(app, query="topics=topology", delay=args.slow_delay if rng.random() < args.slow else 0.0)
+        for _ in range(args.clients)
+    ]
+    fast = [c for c in clients if not c.delay]
+
+    t = time.perf_counter()
+    await connect_all(clients)
+    print(f"connected {len(clients)} clients ({len(clients) - len(fast)} slow) in {time.perf_counter() - t:.2f}s")
+
+    held = []
+    started = time.perf_counter()
+    for seq in range(args.messages):
+        message = {"event": "bench", "seq": seq, "t": time.perf_counter()}
+        t = time.perf_counter()
+        if args.serial:
+            await serial_broadcast(message)
+        else:
+            await manager.broadcast(message, topic="topology")
+        held.append(time.perf_counter() - t)
+        await asyncio.sleep(args.interval)
+
+    # let the fast clients drain
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline and any(len(c.latencies) < args.messages for c in fast):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    samples = [s for c in fast for s in c.latencies]
+    print(f"mode            {'serial' if args.serial else 'queued'}")
+    print(f"broadcasts      {args.messages} in {elapsed:.2f}s")
+    print(f"delivered       {len(samples)} / {len(fast) * args.messages} to fast clients")
+    print(f"latency (fast)  {percentiles(samples)}")
+    print(f"broadcast call  {percentiles(held)}")
+    print(f"slow evicted    {sum(1 for c in clients if c.delay and c.closed is not None)} / {len(clients) - len(fast)}")
+    print(f"manager stats   {manager.stats}")
+    await close_all(clients)
+
+
+def main() -> None:
+    args = _args()
+    os.environ["WS_SEND_QUEUE"] = str(args.queue)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Simulated WebSocket clients for the ws benchmarks.
+
+Each client drives the ASGI app directly (websocket.connect / receive / send
+messages), so thousands of them fit in one event loop and the numbers cover
+Starlette's WebSocket, the /ws/topology endpoint and ConnectionManager, but
+not a network stack. No WebSocket client library needed. The clients share
+the server's event loop, so their own JSON parsing shows up in the latencies.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the ws module pulls in the DB session factory; nothing here touches a database
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("EVENT_BUS", "local")
+
+
+def ws_app(*extra_routers):
+    """A bare FastAPI app with the WebSocket routes (no lifespan, Redis or DB)."""
+    from fastapi import FastAPI
+    from app.ws import router
+
+    app = FastAPI()
+    app.include_router(router)
+    for r in extra_routers:
+        app.include_router(r)
+    return app
+
+
+class Client:
+    """
+    One simulated socket. Messages carrying "t" (perf_counter at broadcast)
+    add a latency sample when the server hands them over; `delay` makes the
+    client that slow to take each message, like a congested link.
+    """
+
+    def __init__(self, app, path: str = "/ws/topology", query: str = "", delay: float = 0.0) -> None:
+        self.app = app
+        self.path = path
+        self.query = query
+        self.delay = delay
+        self.latencies: List[float] = []
+        self.received = 0
+        self.closed: Optional[int] = None
+        self.accepted = asyncio.Event()
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._inbox.put_nowait({"type": "websocket.connect"})
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> "Client":
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "",
+            "query_string": self.query.encode(), "headers": [], "subprotocols": [],
+            "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        }
+        self.task = asyncio.create_task(self.app(scope, self._inbox.get, self._send))
+        return self
+
+    async def _send(self, message: dict) -> None:
+        kind = message["type"]
+        if kind == "websocket.accept":
+            self.accepted.set()
+        elif kind == "websocket.send":
+            text = message.get("text") or ""
+            if text.startswith("{"):
+                sent_at = json.loads(text).get("t")
+                if sent_at is not None:
+                    self.latencies.append(time.perf_counter() - sent_at)
+            self.received += 1
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        elif kind == "websocket.close":
+            self.closed = message.get("code", 1000)
+            self.disconnect()
+
+    def send_text(self, text: str) -> None:
+        self._inbox.put_nowait({"type": "websocket.receive", "text": text})
+
+    def send_bytes(self, data: bytes) -> None:
+        self._inbox.put_nowait({"type": "websocket.receive", "bytes": data})
+
+    def disconnect(self) -> None:
+        self._inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+
+async def connect_all(clients: List[Client], batch: int = 500) -> None:
+    for i in range(0, len(clients), batch):
+        chunk = [c.start() for c in clients[i:i + batch]]
+        await asyncio.gather(*(c.accepted.wait() for c in chunk))
+
+
+async def close_all(clients: List[Client]) -> None:
+    for c in clients:
+        c.disconnect()
+    await asyncio.gather(*(c.task for c in clients if c.task is not None), return_exceptions=True)
+
+
+def percentiles(samples: List[float]) -> str:
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"p50 {pick(0.5):7.2f} ms   p95 {pick(0.95):7.2f} ms   p99 {pick(0.99):7.2f} ms   max {samples[-1] * 1000:7.2f} ms"
@@ -28,15 +28,17 @@ async function postJSON(path, body) {
 // Optional: WebSocket (live updates) – backend endpoint can be added later.
 // If not available, it fails silently.
 let topoSocket = null;
-function openTopologySocket(onMessage) {
+function openTopologySocket(onMessage, topics) {
   try {
     const proto = window.location.protocol === 'https:' ? 'wss' : 'ws';
-    topoSocket = new WebSocket(`${proto}://${window.location.host}/ws/topology`);
+    const query = topics?.length ? `?topics=${topics.join(',')}` : '';
+    topoSocket = new WebSocket(`${proto}://${window.location.host}/ws/topology${query}`);
     topoSocket.onmessage = (ev) => {
       try { const msg = JSON.parse(ev.data); onMessage?.(msg); } catch {}
     };
     topoSocket.onerror = () => {};
   } catch {}
+  return topoSocket;
 }
 
 function mount(view) {
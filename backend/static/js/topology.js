@@ -52,11 +52,22 @@
   };
 
   async function fetchTopology() { return getJSON('/topology'); }
-  async function fetchLayout()   { return getJSON('/topology/layout'); }
+  // Server-computed positions for every node (hand-placed ones are pinned)
+  async function fetchLayout()   { return getJSON('/topology/layout/computed'); }
+  // A new topology version is laid out in the background; poll briefly until it lands
+  async function fetchLayoutFor(version) {
+    let layout = await fetchLayout();
+    for (let wait = 250; layout.version < version && wait <= 4000; wait *= 2) {
+      await new Promise(r => setTimeout(r, wait));
+      layout = await fetchLayout();
+    }
+    return layout;
+  }
 
-  function collectPositions(cy) {
+  function collectPositions(cy, onlyIds) {
     const points = [];
     cy.nodes().forEach(n => {
+      if (onlyIds && !onlyIds.has(n.id())) return;
       const idNum = Number(n.id());
       if (Number.isFinite(idNum) && idNum > 0) {
         points.push({ device_id: idNum, x: n.position('x'), y: n.position('y') });
@@ -123,22 +134,25 @@
       const topo = await fetchTopology();
       const layoutMap = await fetchLayout();
 
-      const nodes = topo.nodes.map(n => ({
-        data: {
-          id: String(n.id),
-          label: n.label || n.ip,
-          vendor: n.vendor || 'unknown',
-          ip: n.ip,
-          icon: USE_ICONS ? (ICONS[vkey(n.vendor)] || ICONS.unknown) : null
-        }
-      }));
-      const edges = topo.edges.map(e => ({
-        data: {
-          source: String(e.source),
-          target: String(e.target),
-          label: e.local_if || e.remote_port || ''
-        }
-      }));
+      // Edge ids follow the server's [source, target] pair (source <= target)
+      const edgeId = (s, t) => (s <= t ? `e${s}-${t}` : `e${t}-${s}`);
+      const nodeData = (n) => ({
+        id: String(n.id),
+        label: n.label || n.ip,
+        vendor: n.vendor || 'unknown',
+        ip: n.ip,
+        icon: USE_ICONS ? (ICONS[vkey(n.vendor)] || ICONS.unknown) : null
+      });
+      const edgeData = (e) => ({
+        id: edgeId(e.source, e.target),
+        source: String(e.source),
+        target: String(e.target),
+        label: e.local_if || e.remote_port || ''
+      });
+
+      let topoVersion = topo.version;
+      const nodes = topo.nodes.map(n => ({ data: nodeData(n) }));
+      const edges = topo.edges.map(e => ({ data: edgeData(e) }));
 
       const baseNodeStyle = {
         'shape': 'round-rectangle',
@@ -219,11 +233,13 @@
 
       async function saveNow() {
         try {
-          const body = collectPositions(cy);
+          // Only nodes dragged by hand get saved (and thereby pinned)
+          const body = collectPositions(cy, moved);
           console.log('[Topology] saveNow ->', body);
           setStatus('Saving...');
           const res = await postJSON('/topology/layout', body);
           console.log('[Topology] saveNow response ->', res);
+          moved.clear();
           setStatus('Saved ✔');
         } catch (e) {
           console.error('[Topology] saveNow error:', e);
@@ -242,8 +258,13 @@
       });
 
       // Auto-save on drag end (if unlocked)
+      const moved = new Set();
       const debouncedSave = debounce(saveNow, 750);
-      cy.on('dragfree', 'node', () => { if (editing) debouncedSave(); });
+      cy.on('dragfree', 'node', (evt) => {
+        if (!editing) return;
+        moved.add(evt.target.id());
+        debouncedSave();
+      });
 
       // Click node → info
       cy.on('tap', 'node', (evt) => {
@@ -256,30 +277,48 @@
         ]);
       });
 
-      // Optional live updates (future websocket)
-      openTopologySocket(async (msg) => {
-        if (msg?.event === 'update_topology') {
+      // Live updates: apply versioned deltas; resync when we missed some
+      async function replaceAll(newTopo) {
+        cy.elements().remove();
+        cy.add({
+          nodes: newTopo.nodes.map(n => ({ data: nodeData(n) })),
+          edges: newTopo.edges.map(e => ({ data: edgeData(e) }))
+        });
+        topoVersion = newTopo.version;
+        applySavedPositions(cy, await fetchLayoutFor(topoVersion));
+      }
+
+      function applyDelta(d) {
+        cy.batch(() => {
+          d.edges.removed.forEach(([s, t]) => cy.getElementById(edgeId(s, t)).remove());
+          d.nodes.removed.forEach(id => cy.getElementById(String(id)).remove());
+          d.nodes.changed.forEach(n => cy.getElementById(String(n.id)).data(nodeData(n)));
+          d.nodes.added.forEach(n => cy.add({ group: 'nodes', data: nodeData(n) }));
+          d.edges.changed.forEach(e => cy.getElementById(edgeId(e.source, e.target)).data(edgeData(e)));
+          d.edges.added.forEach(e => cy.add({ group: 'edges', data: edgeData(e) }));
+        });
+        topoVersion = d.version;
+        return d.nodes.added.length;
+      }
+
+      const socket = openTopologySocket(async (msg) => {
+        if (msg?.event === 'topology_delta') {
+          if (msg.version <= topoVersion) return;
+          if (msg.from !== topoVersion) {
+            socket?.send(JSON.stringify({ cmd: 'sync', version: topoVersion }));
+            return;
+          }
+          if (applyDelta(msg) > 0) applySavedPositions(cy, await fetchLayoutFor(topoVersion));
+          setLegend(`Topology v${topoVersion}: ${cy.nodes().length} devices, ${cy.edges().length} links`);
+        } else if (msg?.event === 'topology_snapshot') {
+          await replaceAll(msg);
+          setLegend('Topology resynced');
+        } else if (msg?.event === 'update_topology' && msg.version !== topoVersion) {
           setLegend('Updating topology...');
-          const newTopo = await fetchTopology();
-          cy.elements().remove();
-          cy.add({
-            nodes: newTopo.nodes.map(n => ({
-              data: {
-                id: String(n.id),
-                label: n.label || n.ip,
-                vendor: n.vendor || 'unknown',
-                ip: n.ip,
-                icon: USE_ICONS ? (ICONS[vkey(n.vendor)] || ICONS.unknown) : null
-              }
-            })),
-            edges: newTopo.edges.map(e => ({
-              data: { source: String(e.source), target: String(e.target), label: e.local_if || e.remote_port || '' }
-            }))
-          });
-          applySavedPositions(cy, await fetchLayout());
+          await replaceAll(await fetchTopology());
           setLegend('Topology updated');
         }
-      });
+      }, ['topology']);
 
     })().catch(err => {
       setLegend('Failed to load: ' + err.message);